@@ -2,10 +2,22 @@ from typing import Dict, List, Union
 
 from qtpy import QtGui
 from qtpy.QtCore import QPoint, QSize, Qt, Signal
-from qtpy.QtWidgets import QLabel, QPlainTextEdit
+from qtpy.QtGui import QSyntaxHighlighter, QTextCursor, QTextDocument
+from qtpy.QtWidgets import QLabel, QPlainTextDocumentLayout, QPlainTextEdit
 from typing_extensions import Self
 
-from ..core import BasicCommands, ChellyDocument, ChellyStyle, Properties, TextEngine
+from ..core import (
+    BasicCommands,
+    ChellyDocument,
+    EditDelta,
+    ChellyStyle,
+    FrameProfiler,
+    LineWidths,
+    OverlayCompositor,
+    Properties,
+    VisibleBlocks,
+    VisibleRange,
+)
 from ..internal import (
     ChellyDocumentExceptions,
     FeaturesExceptions,
@@ -38,8 +50,24 @@ class ChellyEditor(QPlainTextEdit):
     post_on_key_pressed = Signal(object)
 
     @property
-    def visible_blocks(self) -> list:
-        return self._visible_blocks
+    def visible_blocks(self) -> VisibleBlocks:
+        return self._visible_range.snapshot()
+
+    @property
+    def visible_range(self) -> VisibleRange:
+        return self._visible_range
+
+    @property
+    def line_widths(self) -> LineWidths:
+        return self._line_widths
+
+    @property
+    def overlays(self) -> OverlayCompositor:
+        return self._overlays
+
+    @property
+    def profiler(self) -> FrameProfiler:
+        return self._profiler
 
     @property
     def commands(self) -> BasicCommands:
@@ -56,6 +84,11 @@ class ChellyEditor(QPlainTextEdit):
     def followed(self) -> bool:
         return bool(self.followers)
 
+    @property
+    def shares_document(self) -> bool:
+        """True when the editor shows the document of the editor it follows"""
+        return self._shared_document
+
     @property
     def shareables(self) -> dict:
         return {"panels": self.panels, "features": self.features}
@@ -82,10 +115,17 @@ class ChellyEditor(QPlainTextEdit):
 
         self.__commands = BasicCommands(self)
 
-        self._visible_blocks = list()
+        self._visible_range = VisibleRange(self)
+        self._line_widths = LineWidths(self)
+        self._overlays = OverlayCompositor(self)
+        self._profiler = FrameProfiler(self)
         self._last_mouse_pos = QPoint(0, 0)
         self.__followers_references = []
         self._shared_reference = None
+        self._shared_document = False
+        self.__shared_editor = None
+        # the copy of the text made when the editor stopped sharing a document
+        self.__owned_document = None
         self.__build()
 
     def __build(self):
@@ -113,6 +153,11 @@ class ChellyEditor(QPlainTextEdit):
         if old_document is new_document:
             return None
 
+        if self._shared_document:
+            # the text is copied and replayed in an own document
+            self.__own_document()
+            old_document = self._chelly_document
+
         if new_document is ChellyDocument:
             self._chelly_document = new_document(self)
         elif isinstance(new_document, ChellyDocument):
@@ -220,46 +265,33 @@ class ChellyEditor(QPlainTextEdit):
         self.panels.refresh()
 
     def paintEvent(self, event) -> None:
+        if self._profiler.enabled:
+            with self._profiler.span("ChellyEditor.paintEvent", "frame"):
+                return self._paint(event)
+        return self._paint(event)
+
+    def _paint(self, event) -> None:
         self._update_visible_blocks(event)
         super().paintEvent(event)
+        self._overlays.paint(event)
         self.on_painted.emit(event)
 
     def resizeEvent(self, event) -> None:
         super().resizeEvent(event)
+        self._visible_range.invalidate()
         self.on_resized.emit()
 
     def _update_visible_blocks(self, *args) -> None:
-        """Updates the list of visible blocks"""
-        self._visible_blocks[:] = []
-        block = self.firstVisibleBlock()
-        block_nbr = block.blockNumber()
-
-        top = int(
-            self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
-        )
-        bottom = top + int(self.blockBoundingRect(block).height())
-        editor_bottom_top = 0
-        editor_bottom_bottom = self.height()
-        first_block = True
-
-        while block.isValid():
-            visible = top >= editor_bottom_top and bottom <= editor_bottom_bottom
-
-            if not visible and not first_block:
-                break
-            first_block = False
-
-            if visible and block.isVisible():
-                self._visible_blocks.append((top, block_nbr, block))
-
-            block = block.next()
-            top = bottom
-            bottom = top + int(self.blockBoundingRect(block).height())
-            block_nbr = block.blockNumber()
-
-        # pprint.pprint(self._visible_blocks)
+        """Updates the visible blocks if the visible range changed"""
+        self._visible_range.snapshot()
 
     def keyPressEvent(self, event: QtGui.QKeyEvent) -> Union[None, object]:
+        if self._profiler.enabled:
+            with self._profiler.span("ChellyEditor.keyPressEvent", "frame"):
+                return self._key_press(event)
+        return self._key_press(event)
+
+    def _key_press(self, event: QtGui.QKeyEvent) -> Union[None, object]:
         self.on_key_pressed.emit(event)
 
         if event.key() == Qt.Key_Tab and event.modifiers() == Qt.NoModifier:
@@ -309,71 +341,34 @@ class ChellyEditor(QPlainTextEdit):
     def __setup_chelly_document(
         self, old_chelly_document: ChellyDocument, new_chelly_document: ChellyDocument
     ):
+        if old_chelly_document.tracks_edits:
+            old_chelly_document.edits.on_edited.disconnect(self._update_contents)
+            old_chelly_document.release_edits()
+        # the pending changes are in the copied text
+        new_chelly_document.edits.flush()
         self.setPlainText(new_chelly_document.editor.toPlainText())
-        self.__cached_block_count = TextEngine(new_chelly_document.editor).line_count
-        old_chelly_document.on_contents_changed.disconnect(self._update_contents)
-        new_chelly_document.on_contents_changed.connect(self._update_contents)
-
-    def _update_contents(
-        self, editor: QPlainTextEdit, pos: int, charsrem: int, charsadd: int
-    ):
-        line_number = TextEngine(editor).current_line_nbr
-        TextEngine(self).move_cursor_to_line(line_number)
-        line_count = TextEngine(editor).line_count
-
-        if self.__cached_block_count == line_count:
-            text = TextEngine(editor).text_at_line(line_number)
-            TextEngine(self).set_text_at_line(self.textCursor().blockNumber(), text)
-            TextEngine(self).move_cursor_to_line(line_number)
-
-        elif self.__cached_block_count == line_count - 1:
-            cursor = self.textCursor()
-            cursor.setPosition(pos)
-            cursor.insertText("\n")
-            self.setTextCursor(cursor)
-
-        elif self.__cached_block_count == line_count + 1:
-            TextEngine(self).move_cursor_to_line(line_number + 1)
-            cursor = self.textCursor()
-            cursor.deletePreviousChar()
-            self.setTextCursor(cursor)
-
-        else:
-            cursor = self.textCursor()
-            cursor.setPosition(pos)
-
-            if charsrem:
-                for _ in range(charsrem):
-                    cursor.deleteChar()
-
-            if charsadd:
-                calc = pos + charsadd
-                start_block = TextEngine(editor).block_from_position(pos)
-                end_block = TextEngine(editor).block_from_position(calc)
-
-                new_blocks = list(
-                    TextEngine(editor).iterate_blocks_from(
-                        start_block, end_block.blockNumber()
-                    )
-                )
-                for nb in new_blocks:
-                    cursor.beginEditBlock()
-                    cursor.insertText(nb.text())
-
-                    if nb.next().blockNumber() >= 0 and nb != end_block:
-                        cursor.insertText("\n")
-
-                    cursor.endEditBlock()
-
-            self.setTextCursor(cursor)
-
-            TextEngine(self).move_cursor_to_line(TextEngine(editor).current_line_nbr)
-
-        self.__cached_block_count = TextEngine(editor).line_count
-
-    def follow(self, other_editor: Self, follow_back: bool = False):
+        new_chelly_document.edits.on_edited.connect(self._update_contents)
+
+    def _update_contents(self, delta: EditDelta):
+        """Replays a change of the followed document, as one undo step"""
+        cursor = QTextCursor(self.document())
+        cursor.beginEditBlock()
+        delta.apply(cursor)
+        cursor.endEditBlock()
+
+    def follow(self, other_editor: Self, follow_back: bool = False, shared: bool = False):
+        """
+        Follows the text of another editor. A shared follower shows the
+        QTextDocument of the other editor with its own viewport, cursor and
+        decorations, otherwise the changes are replayed in a copy. The font and
+        the tab stops belong to the document, a shared follower has the ones of
+        the other editor.
+        """
         other_editor.followers.append(self)
-        self.chelly_document = other_editor.chelly_document
+        if shared:
+            self.__share_document(other_editor)
+        else:
+            self.chelly_document = other_editor.chelly_document
 
         for key, value in other_editor.imitables.items():
             imitable = getattr(self, key, None)
@@ -386,7 +381,8 @@ class ChellyEditor(QPlainTextEdit):
     def unfollow(self, other_editor: Self, unfollow_back: bool = False):
         if self.following(other_editor):
             other_editor.followers.remove(self)
-            ...
+            if self._shared_document and self.document() is other_editor.document():
+                self.__own_document()
         if unfollow_back:
             if other_editor.following(self):
                 self.followers.remove(other_editor)
@@ -394,6 +390,75 @@ class ChellyEditor(QPlainTextEdit):
     def following(self, other_editor: Self) -> bool:
         return self in other_editor.followers
 
+    def __share_document(self, other_editor: Self) -> None:
+        if self.document() is other_editor.document():
+            return None
+
+        lexer = self._language.lexer
+        if isinstance(lexer, QSyntaxHighlighter):
+            # the blocks are highlighted by the other editor, the highlighter
+            # is kept for an own document
+            lexer.setDocument(None)
+            lexer.setParent(self)
+
+        if self._chelly_document.tracks_edits:
+            self._chelly_document.edits.on_edited.disconnect(self._update_contents)
+            self._chelly_document.release_edits()
+
+        previous_document = self.document()
+        previous_chelly_document = self._chelly_document
+        document = other_editor.document()
+        # the document is no longer deleted with the other editor, it is kept
+        # by the chelly document while an editor shows it
+        document.setParent(None)
+        # Qt deletes the first document, a child of its text control
+        self.setDocument(document)
+        self._chelly_document = other_editor.chelly_document
+        if previous_document is self.__owned_document:
+            self.__owned_document = None
+            if not any(
+                editor.chelly_document is previous_chelly_document
+                for editor in self.followers
+            ):
+                previous_document.deleteLater()
+        self._shared_document = True
+        self.__shared_editor = other_editor
+        other_editor.destroyed.connect(self.__release_document)
+        self._update_visible_blocks()
+        self.on_chelly_document_changed.emit(self._chelly_document)
+
+    def __release_document(self, *args) -> None:
+        # the other editor is deleted, the shared document is still alive
+        if self._shared_document:
+            self.__own_document()
+
+    def __own_document(self) -> None:
+        """Stops sharing the document, the editor keeps a copy of the text"""
+        if self.__shared_editor is not None:
+            try:
+                self.__shared_editor.destroyed.disconnect(self.__release_document)
+            except (RuntimeError, TypeError):
+                ...
+            self.__shared_editor = None
+
+        shared_document = self.document()
+        document = QTextDocument(self)
+        document.setDocumentLayout(QPlainTextDocumentLayout(document))
+        document.setDefaultFont(shared_document.defaultFont())
+        document.setDefaultTextOption(shared_document.defaultTextOption())
+        document.setPlainText(shared_document.toPlainText())
+
+        self.setDocument(document)
+        self.__owned_document = document
+        self._chelly_document = ChellyDocument(self)
+        self._shared_document = False
+
+        lexer = self._language.lexer
+        if isinstance(lexer, QSyntaxHighlighter):
+            lexer.setDocument(document)
+        self._update_visible_blocks()
+        self.on_chelly_document_changed.emit(self._chelly_document)
+
     @property
     def shared_reference(self) -> list:
         return self.__shared_reference
@@ -49,6 +49,8 @@ class EditionMargin(Panel):
         @show_text_help.setter
         def show_text_help(self, show: bool) -> None:
             self.__show_text_help = show
+            # the rows drawn with the previous value are rendered again
+            self.panel.update()
 
         @chelly_property
         def max_lines_count(self) -> int:
@@ -65,6 +67,7 @@ class EditionMargin(Panel):
         @unknow.setter
         def unknow(self, color: QColor) -> None:
             self._unknow = color
+            self.panel.update()
 
         @chelly_property
         def added(self) -> QColor:
@@ -73,6 +76,7 @@ class EditionMargin(Panel):
         @added.setter
         def added(self, color: QColor) -> None:
             self._added = color
+            self.panel.update()
 
         @chelly_property
         def removed(self) -> QColor:
@@ -81,6 +85,7 @@ class EditionMargin(Panel):
         @removed.setter
         def removed(self, color: QColor) -> None:
             self._removed = color
+            self.panel.update()
 
     @property
     def properties(self) -> Properties:
@@ -97,9 +102,16 @@ class EditionMargin(Panel):
     def __init__(self, editor) -> None:
         super().__init__(editor)
         self.scrollable = True
+        self.dependencies = Panel.Dependencies.SCROLL | Panel.Dependencies.DOCUMENT
+        self.backing_store = True
         self.number_font = QFont()
 
         self.__cached_lines_text = []
+        # the current lines, kept from the edits of the document
+        self.__lines_text = None
+        self.__chelly_document = None
+        # the edits are tracked while the document is small enough to compare
+        self.__tracking = False
         self.__cached_cursor_position = ChellyCache(
             None, None, lambda: TextEngine(self.editor).cursor_position
         )
@@ -121,6 +133,41 @@ class EditionMargin(Panel):
         self.editor.textChanged.connect(
             lambda: self.job_delayer.request_job(self.update_diffs)
         )
+        self._attach(self.editor.chelly_document)
+        self.editor.on_chelly_document_changed.connect(self._attach)
+
+    def _attach(self, chelly_document) -> None:
+        self._stop_tracking()
+        self.__chelly_document = chelly_document
+
+    def _start_tracking(self) -> None:
+        if not self.__tracking:
+            self.__tracking = True
+            self.__lines_text = None
+            self.__chelly_document.edits.on_edited.connect(self._on_edited)
+
+    def _stop_tracking(self) -> None:
+        if self.__tracking:
+            self.__tracking = False
+            self.__lines_text = None
+            self.__chelly_document.edits.on_edited.disconnect(self._on_edited)
+            self.__chelly_document.release_edits()
+
+    def _on_edited(self, delta) -> None:
+        if self.__lines_text is not None:
+            delta.apply_to_lines(self.__lines_text)
+
+    def _current_lines_text(self) -> list:
+        self._start_tracking()
+        self.__chelly_document.edits.flush()
+        if self.__lines_text is None:
+            self.__lines_text = [
+                text_block.text()
+                for text_block in TextEngine(self.editor).iterate_blocks_from(
+                    self.editor.document().firstBlock()
+                )
+            ]
+        return self.__lines_text
 
     def sizeHint(self):
         """
@@ -136,6 +183,13 @@ class EditionMargin(Panel):
         return space
 
     def update_diffs(self):
+        if self.editor.blockCount() > self.properties.max_lines_count:
+            # too large to compare, the lines are not kept
+            if self.__tracking:
+                self._stop_tracking()
+                self.preload_diffs([])
+            return None
+
         if self.editor.blockCount() <= 1:
             return None
 
@@ -143,46 +197,32 @@ class EditionMargin(Panel):
         if cached_lines_text_length >= self.properties.max_lines_count:
             return None
 
-        first_visible_block_number = self.editor.firstVisibleBlock().blockNumber()
-        lines_text = []
-
-        first_block = self.editor.document().firstBlock()
-
         if not self.__cached_lines_text:
-            if self.editor.blockCount() > self.properties.max_lines_count:
-                return None
-
-            for text_block in list(
-                TextEngine(self.editor).iterate_blocks_from(first_block)
-            ):
-                lines_text.append(text_block.text())
-
-            self.__cached_lines_text = lines_text.copy()
+            self.__cached_lines_text = self._current_lines_text().copy()
             return None
 
-        else:
-            for text_block in list(
-                TextEngine(self.editor).iterate_blocks_from(
-                    first_block, cached_lines_text_length
-                )
-            ):
-                lines_text.append(text_block.text())
+        lines_text = self._current_lines_text()[:cached_lines_text_length]
 
         if self.__cached_cursor_position.changed:
             self.on_compare_request.emit(self.__cached_lines_text, lines_text)
 
     def preload_diffs(self, diff: list) -> None:
         self.__preloaded_diff = diff
+        self.update()
 
     def paintEvent(self, event) -> None:
         super().paintEvent(event)
+        self.paint_visible_rows(event)
 
-        if not self.__preloaded_diff:
+    def paint_rows(self, painter: QPainter, rows: list) -> None:
+        if not self.__preloaded_diff or not rows:
             return None
 
         pen = QPen()
         pen.setCosmetic(True)
         pen.setJoinStyle(Qt.RoundJoin)
+        # the line spans its row only, rows are repainted on their own
+        pen.setCapStyle(Qt.FlatCap)
         pen.setWidth(8)
         point_x = 0
 
@@ -191,51 +231,35 @@ class EditionMargin(Panel):
         if self.editor.firstVisibleBlock().blockNumber() <= len(
             self.__cached_lines_text
         ):
-            with QPainter(self) as painter:
-                for idx, diff in enumerate(self.__preloaded_diff):
-                    if diff.startswith(("-", "+", "?")):
-                        top = TextEngine(self.editor).point_y_from_line_number(idx)
-
-                        if diff.startswith("-"):
-                            pen.setBrush(self.properties.removed)
-                            painter.setPen(pen)
-                            if self.properties.show_text_help:
-                                painter.drawText(6, top + height // 1.5, "!")
-
-                        elif diff.startswith("+"):
-                            pen.setBrush(self.properties.added)
-                            painter.setPen(pen)
-                            if self.properties.show_text_help:
-                                painter.drawText(6, top + height // 1.5, "+")
-
-                        elif diff.startswith("?"):
-                            pen.setBrush(self.properties.unknow)
-                            painter.setPen(pen)
-                            if self.properties.show_text_help:
-                                painter.drawText(6, top + height // 1.5, "?")
-
-                        painter.drawLine(
-                            point_x,
-                            TextEngine(self.editor).point_y_from_line_number(idx),
-                            point_x,
-                            TextEngine(self.editor).point_y_from_line_number(idx)
-                            + height,
-                        )
-        else:
-            with QPainter(self) as painter:
-                pen.setBrush(Qt.GlobalColor.darkMagenta)
+            for top, block_number, _block in rows:
+                if block_number >= len(self.__preloaded_diff):
+                    continue
+
+                diff = self.__preloaded_diff[block_number]
+                if diff.startswith("-"):
+                    pen.setBrush(self.properties.removed)
+                    help_text = "!"
+                elif diff.startswith("+"):
+                    pen.setBrush(self.properties.added)
+                    help_text = "+"
+                elif diff.startswith("?"):
+                    pen.setBrush(self.properties.unknow)
+                    help_text = "?"
+                else:
+                    continue
+
                 painter.setPen(pen)
                 if self.properties.show_text_help:
-                    painter.drawText(6, top + height // 1.5, "+")
+                    painter.drawText(6, top + height // 1.5, help_text)
+                painter.drawLine(point_x, top, point_x, top + height)
+        else:
+            pen.setBrush(Qt.GlobalColor.darkMagenta)
+            painter.setPen(pen)
 
-                for _top, block_number, _block in self.editor.visible_blocks:
-                    painter.drawLine(
-                        point_x,
-                        TextEngine(self.editor).point_y_from_line_number(block_number),
-                        point_x,
-                        TextEngine(self.editor).point_y_from_line_number(block_number)
-                        + height,
-                    )
+            for top, _block_number, _block in rows:
+                if self.properties.show_text_help:
+                    painter.drawText(6, top + height // 1.5, "+")
+                painter.drawLine(point_x, top, point_x, top + height)
 
 
 __all__ = ["EditionMargin", "EditionMarginWorker"]
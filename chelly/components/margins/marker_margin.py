@@ -102,6 +102,8 @@ class MarkerMargin(Panel):
         self._icons = {}
         self._previous_line = -1
         self.scrollable = True
+        self.dependencies = Panel.Dependencies.SCROLL | Panel.Dependencies.DOCUMENT
+        self.backing_store = True
         self._job_runner = DelayJobRunner(delay=100)
         self.setMouseTracking(True)
         self._to_remove = []
@@ -186,16 +188,19 @@ class MarkerMargin(Panel):
 
     def paintEvent(self, event):
         super().paintEvent(event)
-        with QPainter(self) as painter:
-            for top, block_nbr, block in self.editor.visible_blocks:
-                for marker in self._markers:
-                    if marker.block == block and marker.icon:
-                        rect = QRect()
-                        rect.setX(0)
-                        rect.setY(top)
-                        rect.setWidth(self.sizeHint().width())
-                        rect.setHeight(self.sizeHint().height())
-                        marker.icon.paint(painter, rect)
+        self.paint_visible_rows(event)
+
+    def paint_rows(self, painter: QPainter, rows: list) -> None:
+        size_hint = self.sizeHint()
+        for top, block_nbr, block in rows:
+            for marker in self._markers:
+                if marker.block == block and marker.icon:
+                    rect = QRect()
+                    rect.setX(0)
+                    rect.setY(top)
+                    rect.setWidth(size_hint.width())
+                    rect.setHeight(size_hint.height())
+                    marker.icon.paint(painter, rect)
 
     def mousePressEvent(self, event):
         # Handle mouse press:
@@ -1,9 +1,57 @@
-from qtpy.QtGui import QFont, QTextCursor, QColor, QPainter
+from qtpy.QtGui import QFont, QColor, QPainter, QPixmap
 from qtpy.QtCore import Qt, QSize, QRect
 from ...core import Panel, FontEngine
 from ...internal import chelly_property
-from typing import Any
+from typing import Any, Dict
 from dataclasses import dataclass
+from math import ceil
+
+
+class _NumberPixmaps:
+    """
+    Line numbers of one font and color pre-rendered in row sized pixmaps at
+    the device pixel ratio of the margin, a repaint only blits them.
+    """
+
+    #: rendered numbers kept, a few screens of line numbers
+    MAX_SIZE = 2048
+
+    def __init__(
+        self,
+        font: QFont,
+        color: QColor,
+        size: QSize,
+        device_pixel_ratio: float,
+    ):
+        self.font = QFont(font)
+        self.color = QColor(color)
+        self.size = size
+        self.device_pixel_ratio = device_pixel_ratio
+        self._pixmaps: Dict[str, QPixmap] = {}
+
+    def pixmap(self, number: str) -> QPixmap:
+        pixmap = self._pixmaps.get(number)
+        if pixmap is not None:
+            return pixmap
+
+        if len(self._pixmaps) >= self.MAX_SIZE:
+            self._pixmaps.clear()
+
+        width, height = self.size.width(), self.size.height()
+        pixmap = QPixmap(
+            ceil(width * self.device_pixel_ratio),
+            ceil(height * self.device_pixel_ratio),
+        )
+        pixmap.setDevicePixelRatio(self.device_pixel_ratio)
+        pixmap.fill(Qt.GlobalColor.transparent)
+
+        with QPainter(pixmap) as painter:
+            painter.setFont(self.font)
+            painter.setPen(self.color)
+            painter.drawText(0, 0, width, height, Qt.AlignmentFlag.AlignRight, number)
+
+        self._pixmaps[number] = pixmap
+        return pixmap
 
 
 class LineNumberMargin(Panel):
@@ -30,6 +78,8 @@ class LineNumberMargin(Panel):
         @foreground.setter
         def foreground(self, new_color: QColor) -> None:
             self._foreground = new_color
+            # the rows drawn with the previous value are rendered again
+            self.panel.update()
 
         @chelly_property
         def background(self) -> QColor:
@@ -38,6 +88,11 @@ class LineNumberMargin(Panel):
         @background.setter
         def background(self, new_color: QColor) -> None:
             self._background = new_color
+            # an opaque margin can be blitted when the editor scrolls
+            self.panel.setAttribute(
+                Qt.WidgetAttribute.WA_OpaquePaintEvent, new_color.alpha() == 255
+            )
+            self.panel.update()
 
         @chelly_property
         def highlight(self) -> QColor:
@@ -46,6 +101,7 @@ class LineNumberMargin(Panel):
         @highlight.setter
         def highlight(self, new_color: QColor) -> None:
             self._highlight = new_color
+            self.panel.update()
 
     @property
     def properties(self) -> Properties:
@@ -63,8 +119,21 @@ class LineNumberMargin(Panel):
         super().__init__(editor)
         self.__properties = LineNumberMargin.Properties(self)
         self.scrollable = True
+        self.dependencies = (
+            Panel.Dependencies.SCROLL
+            | Panel.Dependencies.CURSOR_LINE
+            | Panel.Dependencies.DOCUMENT
+        )
         self.number_font = QFont()
 
+        self.backing_store = True
+
+        # (font key, device pixel ratio, color, row size) -> rendered numbers
+        self._numbers: Dict[tuple, _NumberPixmaps] = {}
+        # (font key, digits) of the width measured last
+        self._width_key = None
+        self._width = 0
+
     def sizeHint(self):
         """
         Returns the panel size hint (as the panel is on the left, we only need
@@ -74,39 +143,60 @@ class LineNumberMargin(Panel):
 
     @property
     def line_number_area_width(self) -> int:
-        digits = 1
-        max_num = max(1, self.editor.blockCount())
-        while max_num >= 10:
-            max_num *= 0.1
-            digits += 1
-
-        space = (
-            FontEngine(self.font()).real_horizontal_advance("9", True) * digits
-        ) + 2
-        return space
+        digits = len(str(max(1, self.editor.blockCount())))
+        font = self.font()
+        key = (font.key(), digits)
+        if key != self._width_key:
+            font_engine = FontEngine(font)
+            self._width = (font_engine.real_horizontal_advance("9", True) * digits) + 2
+            self._width_key = key
+        return self._width
+
+    def _number_pixmaps(self, color: QColor, bold: bool, size: QSize) -> _NumberPixmaps:
+        self.number_font.setBold(bold)
+        device_pixel_ratio = self.devicePixelRatioF()
+        key = (
+            self.number_font.key(),
+            device_pixel_ratio,
+            color.rgba(),
+            size.width(),
+            size.height(),
+        )
+        numbers = self._numbers.get(key)
+        if numbers is None:
+            if len(self._numbers) >= 8:
+                # font, screen, colors or width changed
+                self._numbers.clear()
+            numbers = self._numbers[key] = _NumberPixmaps(
+                self.number_font, color, size, device_pixel_ratio
+            )
+        return numbers
 
     def paintEvent(self, event):
         super().paintEvent(event)
-        with QPainter(self) as painter:
-            for top, block_number, block in self.editor.visible_blocks:
-                if block.userState() == -999:
-                    continue
-
-                number = str(block_number + 1)
-
-                if block_number == self.editor.textCursor().blockNumber():
-                    self.number_font.setBold(True)
-                    painter.setPen(self.properties.highlight)
-                else:
-                    self.number_font.setBold(False)
-                    painter.setPen(self.properties.foreground)
-
-                painter.setFont(self.number_font)
-                width = self.width()
-                height = self.fontMetrics().height()
-                painter.drawText(
-                    0, top, width, height, Qt.AlignmentFlag.AlignRight, number
-                )
+        self.paint_visible_rows(event)
+
+    def paint_background(self, painter: QPainter, rect: QRect) -> None:
+        if self.properties.background.alpha():
+            painter.fillRect(rect, self.properties.background)
+
+    def paint_rows(self, painter: QPainter, rows: list) -> None:
+        size = QSize(self.width(), self.fontMetrics().height())
+        current_line = self.editor.textCursor().blockNumber()
+
+        pixmap = self._number_pixmaps(self.properties.foreground, False, size).pixmap
+        current_pixmap = self._number_pixmaps(
+            self.properties.highlight, True, size
+        ).pixmap
+
+        for top, block_number, block in rows:
+            if block.userState() == -999:
+                continue
+
+            if block_number == current_line:
+                painter.drawPixmap(0, top, current_pixmap(str(block_number + 1)))
+            else:
+                painter.drawPixmap(0, top, pixmap(str(block_number + 1)))
 
 
 __all__ = ["LineNumberMargin"]
@@ -1 +1,2 @@
 from .view import MiniMap
+from .raster import MiniMapRaster
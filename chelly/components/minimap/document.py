@@ -24,8 +24,17 @@ class DocumentMap(CodeEditor):
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
 
     def update_document(self):
+        # the font is a property of the document, a zoomed out view keeps its
+        # own document instead of sharing the one of the editor
         self.chelly_document = self.editor.chelly_document
 
+    def detach(self) -> None:
+        """Stops following the document of the editor"""
+        self.editor.on_chelly_document_changed.disconnect(self.update_document)
+        if self.chelly_document.tracks_edits:
+            self.chelly_document.edits.on_edited.disconnect(self._update_contents)
+            self.chelly_document.release_edits()
+
     def mouseMoveEvent(self, event) -> None:
         return None
 
@@ -3,7 +3,6 @@ from qtpy.QtGui import QMouseEvent, QResizeEvent
 from ...core import TextEngine
 from .slider import SliderArea
 from .document import DocumentMap
-from math import modf
 
 
 class MiniMapEditor(DocumentMap):
@@ -33,52 +32,27 @@ class MiniMapEditor(DocumentMap):
         TextEngine(self).goto_line(line)
         self._scroll_slide()
 
-    def _scroll_slide(self):
-        num_editor_visible_lines = TextEngine(self.editor).visible_lines_from_line_count
-        lines_on_editor_screen = TextEngine(self.editor).visible_lines
-
-        if num_editor_visible_lines > lines_on_editor_screen:
-            self._move_scroll_bar()
-
-            if not self.slider.is_pressed:
-                max_height = self.__cached_height
-                current_scroll_y = self.editor.verticalScrollBar().value()
-                max_scroll_y = self.__cached_max_scroll_y
-
-                delta_y = current_scroll_y - (self.slider.height() // 2)
-
-                if max_scroll_y > max_height:
-                    decimal_delta_y = max_scroll_y / max_height
-
-                    if modf(decimal_delta_y)[0] <= 0.5:
-                        decimal_delta_y += 1
-                    else:
-                        decimal_delta_y += 0.5
-
-                    py = current_scroll_y // decimal_delta_y
-                    delta_y = py - (self.slider.height() // 2)
-
-                if delta_y < 0:
-                    delta_y = 0
-
-                self.slider.move_y(delta_y)
-
-    def scroll_editor(self, y_pos) -> None:
-        max_height = self.__cached_height
+    def _scroll_ratio(self) -> float:
         max_scroll_y = self.__cached_max_scroll_y
-        delta_y = y_pos
-
-        if max_scroll_y > max_height:
-            decimal_delta_y = max_scroll_y / max_height
+        if max_scroll_y <= 0:
+            return 0.0
+        return self.editor.verticalScrollBar().value() / max_scroll_y
 
-            if modf(decimal_delta_y)[0] <= 0.5:
-                decimal_delta_y += 1
-            else:
-                decimal_delta_y += 0.5
+    def _scroll_slide(self):
+        # the minimap and its slider are scrolled by the ratio the editor is
+        ratio = self._scroll_ratio()
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.setValue(round(ratio * scroll_bar.maximum()))
 
-            delta_y = y_pos * int(decimal_delta_y)
+        if not self.slider.is_pressed:
+            self.slider.move_y(ratio * max(0, self.__cached_height - self.slider.height()))
 
-        self.editor.verticalScrollBar().setValue(delta_y)
+    def scroll_editor(self, y_pos) -> None:
+        height = max(1, self.__cached_height - self.slider.height())
+        y_pos = min(max(0, y_pos - self.slider.height() // 2), height)
+        self.editor.verticalScrollBar().setValue(
+            round(self.__cached_max_scroll_y * y_pos / height)
+        )
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
         TextEngine(self.editor).move_cursor_to_line(
@@ -99,16 +73,5 @@ class MiniMapEditor(DocumentMap):
         self.__cached_height = self.height()
         return super().resizeEvent(event)
 
-    def _move_scroll_bar(self):
-        max_scroll_y = self.__cached_max_scroll_y
-
-        dy = max_scroll_y / (self.editor.verticalScrollBar().value() + 1)
-        if dy <= 0:
-            dy = 1
-
-        self.verticalScrollBar().setValue(
-            int(self.editor.verticalScrollBar().value() / dy)
-        )
-
 
 __all__ = ["MiniMapEditor"]
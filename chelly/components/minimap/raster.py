@@ -0,0 +1,478 @@
+from dataclasses import dataclass
+from functools import partial
+from math import ceil
+import re
+from typing import Dict, Tuple
+
+from qtpy.QtCore import QEvent, QObject, QRect, Qt, QThread, Signal
+from qtpy.QtGui import QColor, QImage, QMouseEvent, QPainter, QResizeEvent
+from qtpy.QtWidgets import QApplication, QWidget
+
+from ...core import LRUCache, TextEngine
+from ...internal import ChellyQThreadManager
+from .slider import SliderArea
+
+
+class TileWorker(QObject):
+    """
+    Renders the tiles of a raster minimap from text and format snapshots
+    away from the GUI thread. Requests no longer pending are skipped.
+    """
+
+    on_rendered = Signal(int, int, object)
+
+    def __init__(self, render):
+        super().__init__()
+        self.render = render
+        #: tile -> request pending in the minimap, read only
+        self.pending: Dict[int, int] = {}
+
+    def run(self, request: int, tile: int, snapshot: tuple):
+        if self.pending.get(tile) != request:
+            return None
+        self.on_rendered.emit(request, tile, self.render(snapshot))
+
+
+class MiniMapRaster(QWidget):
+    """
+    Draws the document as strips of colored pixels, a pixel row per line.
+    The colors come from the formats the highlighter wrote in the block
+    layouts of the editor, so no second document is needed.
+
+    The rows are cached in tiles of a fixed number of lines, rendered on a
+    background thread from snapshots of the text and the formats and evicted
+    when the least recently used. A tile not rendered yet is drawn as a flat
+    placeholder, an outdated one is drawn until its new version is ready.
+    """
+
+    on_tile_requested = Signal(int, int, object)
+
+    @dataclass(frozen=True)
+    class Defaults:
+        #: height of a line on screen, in pixels
+        LINE_HEIGHT = 2
+        #: width of a character, in pixels
+        CHAR_WIDTH = 1
+        #: lines of a tile
+        TILE_LINES = 256
+        #: tiles kept in memory
+        MAX_TILES = 64
+        #: renders the tiles in a worker thread
+        BACKGROUND = True
+
+    NON_SPACES = re.compile(r"\S+")
+
+    _render_thread = None
+    # workers running in the render thread
+    _render_users = 0
+
+    @staticmethod
+    def shared_render_thread() -> QThread:
+        """
+        The thread of the tile workers, started for the first one. Every call
+        counts a worker, ``release_render_thread`` gives it back.
+        """
+        if MiniMapRaster._render_thread is None:
+            thread = QThread()
+            ChellyQThreadManager(QApplication.instance()).append(thread)
+            # forgotten as soon as it stops, the thread manager kills it when
+            # the application quits
+            thread.finished.connect(
+                partial(MiniMapRaster._forget_render_thread, thread), Qt.DirectConnection
+            )
+            thread.start()
+            MiniMapRaster._render_thread = thread
+            MiniMapRaster._render_users = 0
+
+        MiniMapRaster._render_users += 1
+        return MiniMapRaster._render_thread
+
+    @staticmethod
+    def release_render_thread(thread: QThread) -> None:
+        """Stops the render thread once its last worker released it"""
+        if thread is not MiniMapRaster._render_thread:
+            # already stopped
+            return None
+
+        MiniMapRaster._render_users -= 1
+        if MiniMapRaster._render_users > 0:
+            return None
+
+        MiniMapRaster._forget_render_thread(thread)
+        ChellyQThreadManager(QApplication.instance()).remove(thread)
+        thread.quit()
+        thread.wait()
+        thread.deleteLater()
+
+    @staticmethod
+    def _forget_render_thread(thread: QThread) -> None:
+        if thread is MiniMapRaster._render_thread:
+            MiniMapRaster._render_thread = None
+            MiniMapRaster._render_users = 0
+
+    @staticmethod
+    def _release_worker(worker: QObject, thread: QThread) -> None:
+        try:
+            # deleted by its thread, after the request it may be running
+            worker.deleteLater()
+        except RuntimeError:
+            ...
+        MiniMapRaster.release_render_thread(thread)
+
+    def __init__(self, minimap):
+        super().__init__(minimap)
+        self.minimap = minimap
+        self.editor = minimap.editor
+
+        self._document = None
+        # tile -> image of its rows
+        self._tiles = LRUCache(self.Defaults.MAX_TILES)
+        # cached tiles whose lines changed since they were rendered
+        self._stale = set()
+        # tile -> request in flight
+        self._pending: Dict[int, int] = {}
+        self._requests = 0
+        self._line_count = 0
+        # first line shown
+        self._offset = 0
+        self._background = False
+        self._worker = None
+        self._worker_release = None
+        #: lines snapshotted by the last paint, for tests and profiling
+        self.rendered_lines = 0
+
+        self.slider = SliderArea(self)
+        self.slider.show()
+        self.setMouseTracking(True)
+
+        self.background = self.Defaults.BACKGROUND
+        self.bind()
+        self._attach(self.editor.document())
+
+    def bind(self):
+        self.editor.on_painted.connect(self.update_ui)
+        self.slider.on_scroll_area.connect(self.scroll_editor)
+
+    @property
+    def background(self) -> bool:
+        """Renders the tiles in a worker thread instead of during the paint"""
+        return self._background
+
+    @background.setter
+    def background(self, value: bool) -> None:
+        value = bool(value)
+        if value == self._background:
+            return None
+
+        self._background = value
+        if value and self._worker is None:
+            self._worker = TileWorker(self.render_tile)
+            self._worker.pending = self._pending
+            thread = self.shared_render_thread()
+            self._worker.moveToThread(thread)
+            # the thread is released with the minimap when it is not detached
+            self._worker_release = partial(MiniMapRaster._release_worker, self._worker, thread)
+            self.destroyed.connect(self._worker_release)
+            self.on_tile_requested.connect(self._worker.run)
+            self._worker.on_rendered.connect(self._on_tile_ready)
+        # the requests in flight are abandoned
+        self._pending.clear()
+        self.update()
+
+    @property
+    def is_rendering(self) -> bool:
+        return bool(self._pending)
+
+    @property
+    def offset(self) -> int:
+        return self._offset
+
+    def tile(self, index: int) -> QImage:
+        """The cached image of a tile, None if it is not rendered yet"""
+        if index in self._tiles:
+            return self._tiles.get(index)
+        return None
+
+    def tile_at(self, line: int) -> Tuple[int, int]:
+        """The tile of a line and the row of the line in the tile"""
+        return divmod(line, self.Defaults.TILE_LINES)
+
+    def _attach(self, document) -> None:
+        if self._document is not None:
+            try:
+                self._document.contentsChange.disconnect(self._on_contents_change)
+            except (RuntimeError, TypeError):
+                ...
+
+        self._document = document
+        document.contentsChange.connect(self._on_contents_change)
+        self.invalidate()
+
+    def detach(self) -> None:
+        """Stops following the document of the editor"""
+        self.editor.on_painted.disconnect(self.update_ui)
+        self._document.contentsChange.disconnect(self._on_contents_change)
+        self._pending.clear()
+        if self._worker is not None:
+            self.on_tile_requested.disconnect(self._worker.run)
+            self._worker.on_rendered.disconnect(self._on_tile_ready)
+            try:
+                self.destroyed.disconnect(self._worker_release)
+            except (RuntimeError, TypeError):
+                ...
+            self._worker_release()
+            self._worker_release = None
+            self._worker = None
+
+    def invalidate(self) -> None:
+        """Renders every tile again"""
+        self._line_count = self._document.blockCount()
+        self._tiles.clear()
+        self._stale.clear()
+        self._pending.clear()
+        self.update()
+
+    def _on_contents_change(self, position: int, removed: int, added: int) -> None:
+        document = self._document
+        first = document.findBlock(position).blockNumber()
+        last = document.findBlock(position + added).blockNumber()
+        if first < 0:
+            return self.invalidate()
+        if last < 0:
+            # changed up to the end of the document
+            last = document.blockCount() - 1
+
+        line_count = document.blockCount()
+        if line_count != self._line_count:
+            # the following lines moved
+            last = max(line_count, self._line_count) - 1
+            self._line_count = line_count
+        self._invalidate_lines(first, last)
+
+    def _invalidate_lines(self, first: int, last: int) -> None:
+        first_tile = first // self.Defaults.TILE_LINES
+        last_tile = last // self.Defaults.TILE_LINES
+        for tile in self._tiles.keys():
+            if tile * self.Defaults.TILE_LINES >= self._line_count:
+                self._tiles.pop(tile)
+                self._stale.discard(tile)
+            elif first_tile <= tile <= last_tile:
+                self._stale.add(tile)
+        for tile in list(self._pending):
+            if first_tile <= tile <= last_tile:
+                del self._pending[tile]
+
+        if first <= self._offset + self.visible_line_count and last >= self._offset:
+            self.update()
+
+    @property
+    def visible_line_count(self) -> int:
+        return ceil(self.height() / self.Defaults.LINE_HEIGHT)
+
+    @staticmethod
+    def _rgba(text_format) -> int:
+        brush = text_format.foreground()
+        if brush.style() == Qt.NoBrush:
+            return None
+        return brush.color().rgba()
+
+    def _snapshot(self, tile: int) -> tuple:
+        """The width, colors and lines of a tile, for :meth:`render_tile`"""
+        lines = []
+        block = self._document.findBlockByNumber(tile * self.Defaults.TILE_LINES)
+        for _ in range(self.Defaults.TILE_LINES):
+            if not block.isValid():
+                break
+            # copies of the format ranges, read by the worker
+            lines.append((block.text(), block.layout().formats()))
+            block = block.next()
+
+        self.rendered_lines += len(lines)
+        return (
+            self.width(),
+            self.editor.palette().text().color().rgba(),
+            self.editor.properties.indent_size,
+            tuple(lines),
+        )
+
+    @classmethod
+    def render_tile(cls, snapshot: tuple) -> QImage:
+        """Renders the rows of a tile snapshot, safe out of the GUI thread"""
+        width, default_rgba, tab_width, lines = snapshot
+        # 16 bits per pixel, half the memory of 32 bits images for the
+        # same fill speed
+        image = QImage(
+            max(width, 1), cls.Defaults.TILE_LINES, QImage.Format_ARGB4444_Premultiplied
+        )
+        image.fill(Qt.transparent)
+
+        char_width = cls.Defaults.CHAR_WIDTH
+        non_spaces = cls.NON_SPACES
+        colors = {}
+
+        painter = QPainter(image)
+        painter.setCompositionMode(QPainter.CompositionMode_Source)
+        for row, (text, formats) in enumerate(lines):
+            if "\t" in text:
+                columns = cls._tab_columns(text, tab_width)
+                text = text.expandtabs(tab_width)
+            else:
+                columns = None
+
+            # the text not covered by a format has the default color
+            segments = []
+            position = 0
+            for format_range in formats:
+                start = format_range.start
+                end = start + format_range.length
+                rgba = cls._rgba(format_range.format)
+                if columns is not None:
+                    start = columns[min(start, len(columns) - 1)]
+                    end = columns[min(end, len(columns) - 1)]
+                if start > position:
+                    segments.append((position, start, default_rgba))
+                segments.append((start, end, default_rgba if rgba is None else rgba))
+                position = max(position, end)
+            if position < len(text):
+                segments.append((position, len(text), default_rgba))
+
+            for start, end, rgba in segments:
+                if start * char_width >= width:
+                    break
+                color = colors.get(rgba)
+                if color is None:
+                    color = colors[rgba] = QColor.fromRgba(rgba)
+                for match in non_spaces.finditer(text, start, end):
+                    painter.fillRect(
+                        match.start() * char_width,
+                        row,
+                        (match.end() - match.start()) * char_width,
+                        1,
+                        color,
+                    )
+        painter.end()
+        return image
+
+    @staticmethod
+    def _tab_columns(text: str, tab_width: int) -> list:
+        """Column of each position of the text once the tabs are expanded"""
+        columns = []
+        column = 0
+        for char in text:
+            columns.append(column)
+            if char == "\t":
+                column += tab_width - column % tab_width
+            else:
+                column += 1
+        columns.append(column)
+        return columns
+
+    def _request(self, tile: int) -> None:
+        """Renders a tile again, in the worker thread in background mode"""
+        if tile in self._pending:
+            return None
+
+        if not self._background:
+            self._store(tile, self.render_tile(self._snapshot(tile)))
+            return None
+
+        self._requests += 1
+        self._pending[tile] = self._requests
+        self.on_tile_requested.emit(self._requests, tile, self._snapshot(tile))
+
+    def _store(self, tile: int, image: QImage) -> None:
+        self._tiles.put(tile, image)
+        self._stale.discard(tile)
+
+    def _on_tile_ready(self, request: int, tile: int, image: QImage) -> None:
+        if self._pending.get(tile) != request:
+            return None
+
+        del self._pending[tile]
+        self._store(tile, image)
+        line_height = self.Defaults.LINE_HEIGHT
+        tile_lines = self.Defaults.TILE_LINES
+        top = (tile * tile_lines - self._offset) * line_height
+        self.update(0, top, self.width(), tile_lines * line_height)
+
+    def update_ui(self, *args) -> None:
+        if self.editor.document() is not self._document:
+            self._attach(self.editor.document())
+
+        offset = self._offset
+        self._scroll_slide()
+        if offset != self._offset:
+            self.update()
+
+    def _scroll_ratio(self) -> float:
+        scroll_bar = self.editor.verticalScrollBar()
+        if scroll_bar.maximum() <= 0:
+            return 0.0
+        return scroll_bar.value() / scroll_bar.maximum()
+
+    def _scroll_slide(self) -> None:
+        ratio = self._scroll_ratio()
+        self._offset = int(ratio * max(0, self._line_count - self.visible_line_count))
+
+        if not self.slider.is_pressed:
+            self.slider.move_y(ratio * max(0, self.height() - self.slider.height()))
+
+    def scroll_editor(self, y_pos: int) -> None:
+        scroll_bar = self.editor.verticalScrollBar()
+        height = max(1, self.height() - self.slider.height())
+        y_pos = min(max(0, y_pos - self.slider.height() // 2), height)
+        scroll_bar.setValue(round(scroll_bar.maximum() * y_pos / height))
+
+    def line_at(self, y_pos: int) -> int:
+        line = self._offset + y_pos // self.Defaults.LINE_HEIGHT
+        return min(max(line, 0), max(self._line_count - 1, 0))
+
+    def paintEvent(self, event) -> None:
+        rect = event.rect()
+        line_height = self.Defaults.LINE_HEIGHT
+        tile_lines = self.Defaults.TILE_LINES
+        first = self._offset + rect.top() // line_height
+        last = min(self._offset + rect.bottom() // line_height, self._line_count - 1)
+        self.rendered_lines = 0
+        if last < first:
+            return None
+
+        with QPainter(self) as painter:
+            for tile in range(self.tile_at(first)[0], self.tile_at(last)[0] + 1):
+                image = self.tile(tile)
+                if image is None or tile in self._stale:
+                    self._request(tile)
+                    image = self.tile(tile)
+
+                top = (tile * tile_lines - self._offset) * line_height
+                if image is None:
+                    lines = min(tile_lines, self._line_count - tile * tile_lines)
+                    placeholder = QColor(self.palette().text().color())
+                    placeholder.setAlpha(24)
+                    painter.fillRect(0, top, self.width(), lines * line_height, placeholder)
+                else:
+                    painter.drawImage(
+                        QRect(0, top, image.width(), tile_lines * line_height), image
+                    )
+
+    def mousePressEvent(self, event: QMouseEvent) -> None:
+        TextEngine(self.editor).move_cursor_to_line(self.line_at(event.pos().y()))
+
+    def wheelEvent(self, event) -> None:
+        return self.editor.wheelEvent(event)
+
+    def leaveEvent(self, event: QEvent) -> None:
+        self.slider.change_transparency(self.slider.properties.no_state_color)
+        return super().leaveEvent(event)
+
+    def enterEvent(self, event: QEvent) -> None:
+        self.slider.change_transparency(self.slider.properties.color)
+        return super().enterEvent(event)
+
+    def resizeEvent(self, event: QResizeEvent) -> None:
+        if event.size().width() != event.oldSize().width():
+            self.invalidate()
+        return super().resizeEvent(event)
+
+
+__all__ = ["MiniMapRaster", "TileWorker"]
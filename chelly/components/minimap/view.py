@@ -1,14 +1,24 @@
 from typing_extensions import Self
-from typing import Any
+from typing import Any, Union
 from qtpy.QtCore import QSize
 from qtpy.QtGui import QColor
 from qtpy.QtWidgets import QGraphicsDropShadowEffect, QHBoxLayout
 from ...core import Panel
 from ...internal import chelly_property
 from .editor import MiniMapEditor
+from .raster import MiniMapRaster
 
 
 class MiniMap(Panel):
+    class Mode(object):
+        """
+        Enumerates how the minimap is drawn
+        """
+        #: a zoomed out editor sharing the text of the editor
+        EDITOR = 0
+        #: pixel strips colored from the formats of the editor
+        RASTER = 1
+
     class Properties(Panel._Properties):
         def __init__(self, minimap_instance) -> None:
             super().__init__(minimap_instance)
@@ -16,8 +26,7 @@ class MiniMap(Panel):
             self.__min_width = 40
             self.__width_percentage = 40
             self.__resizable = True
-            self.__chelly_editor: MiniMapEditor = self.instance.chelly_editor
-            self.__chelly_editor.slider.setFixedWidth(self.__max_width)
+            self.instance.view.slider.setFixedWidth(self.__max_width)
             self.__drop_shadow = None
             self.default()
 
@@ -64,7 +73,7 @@ class MiniMap(Panel):
         @max_width.setter
         def max_width(self, width: int) -> None:
             self.__max_width = width
-            self.__chelly_editor.slider.setFixedWidth(width)
+            self.instance.view.slider.setFixedWidth(width)
 
         @chelly_property
         def min_width(self) -> int:
@@ -83,6 +92,14 @@ class MiniMap(Panel):
             if isinstance(width, int):
                 self.__width_percentage = width
 
+        @chelly_property
+        def mode(self) -> int:
+            return self.instance.mode
+
+        @mode.setter
+        def mode(self, mode: int) -> None:
+            self.instance.mode = mode
+
         @chelly_property
         def resizable(self) -> bool:
             return self.__resizable
@@ -104,20 +121,57 @@ class MiniMap(Panel):
 
     @property
     def chelly_editor(self) -> MiniMapEditor:
+        """The minimap editor, None in raster mode"""
+        if isinstance(self._minimap, MiniMapEditor):
+            return self._minimap
+        return None
+
+    @property
+    def view(self) -> Union[MiniMapEditor, MiniMapRaster]:
         return self._minimap
 
-    def __init__(self, editor):
+    @property
+    def mode(self) -> int:
+        if isinstance(self._minimap, MiniMapRaster):
+            return MiniMap.Mode.RASTER
+        return MiniMap.Mode.EDITOR
+
+    @mode.setter
+    def mode(self, mode: int) -> None:
+        if mode == self.mode:
+            return None
+
+        old_view = self._minimap
+        if mode == MiniMap.Mode.RASTER:
+            self._minimap = MiniMapRaster(self)
+        else:
+            self._minimap = MiniMapEditor(self)
+        self._minimap.slider.setFixedWidth(self.properties.max_width)
+
+        self.box.replaceWidget(old_view, self._minimap)
+        old_view.detach()
+        old_view.hide()
+        # frees the document and the layout of the minimap editor
+        old_view.deleteLater()
+        self._minimap.show()
+
+    def __init__(self, editor, mode: int = Mode.EDITOR):
         super().__init__(editor)
 
         self.box = QHBoxLayout(self)
         self.box.setContentsMargins(0, 0, 0, 0)
 
-        self._minimap = MiniMapEditor(self)
+        if mode == MiniMap.Mode.RASTER:
+            self._minimap = MiniMapRaster(self)
+        else:
+            self._minimap = MiniMapEditor(self)
 
         self.box.addWidget(self._minimap)
         self.setLayout(self.box)
 
         self.__properties = MiniMap.Properties(self)
+        # the minimap editor repaints itself when the editor is painted
+        self.dependencies = Panel.Dependencies.NONE
 
         self.editor.blockCountChanged.connect(self.update_shadow)
         self.editor.on_resized.connect(self.update_shadow)
@@ -131,22 +185,18 @@ class MiniMap(Panel):
         elif (
             len(self.editor.visible_blocks) == 1
             and force
-            and len(self.editor.toPlainText()) > 0
+            and not self.editor.document().isEmpty()
         ):
             self.properties.shadow.setEnabled(True)
 
-        else:
-            for top, block_number, block in self.editor.visible_blocks:
-                width = self.editor.fontMetrics().boundingRect(block.text()).width()
-
-                line_width = (
-                    self.editor.geometry().width() - self.geometry().width()
-                ) - width
-                if line_width < 0:
-                    self.properties.shadow.setEnabled(True)
-                    break
-                else:
-                    self.properties.shadow.setEnabled(False)
+        elif self.editor.visible_blocks:
+            visible_blocks = self.editor.visible_blocks
+            width = self.editor.line_widths.max_width(
+                visible_blocks.first, visible_blocks.last
+            )
+
+            line_width = (self.editor.geometry().width() - self.geometry().width()) - width
+            self.properties.shadow.setEnabled(line_width < 0)
 
         return self
 
@@ -77,6 +77,7 @@ class VerticalScrollBar(Panel):
 
         self.box.addWidget(self._scroll_bar)
         self.setLayout(self.box)
+        self.dependencies = Panel.Dependencies.NONE
 
         self.editor.on_painted.connect(self.update_values)
         self.editor.verticalScrollBar().rangeChanged.connect(self.set_range)
@@ -1,10 +1,12 @@
-from .chelly_cache import ChellyCache
+from .chelly_cache import ChellyCache, LRUCache
 from .properties import Properties
 from .ui import ChellyTheme, ChellyStyle
 from .utils import (
     Character,
     DelayJobRunner,
     FontEngine,
+    FrameProfiler,
+    LineWidths,
     TextBlockHelper,
     TextDecoration,
     TextEngine,
@@ -12,6 +14,8 @@ from .utils import (
     sanitize_html,
     icon_to_base64,
     image_to_base64,
+    VisibleBlocks,
+    VisibleRange,
 )
 from .edition import (
     ColorScheme,
@@ -20,7 +24,9 @@ from .edition import (
     SyntaxHighlighter,
     TextBlockUserData,
     ChellyDocument,
+    EditCoalescer,
+    EditDelta,
 )
 
 from .commands import BasicCommands
-from .dev import Feature, Panel, Manager
+from .dev import Feature, Panel, Manager, OverlayCompositor, OverlayGeometry, OverlayLayer
@@ -1,4 +1,5 @@
 import pprint
+from collections import OrderedDict
 from types import LambdaType
 from typing import Any, Callable
 from typing_extensions import Self
@@ -33,4 +34,82 @@ class ChellyCache:
         return self
 
 
-__all__ = ["ChellyCache"]
+class LRUCache:
+    """
+    Mapping limited to ``max_size`` entries, the least recently used entry is
+    evicted first. Hits, misses and evictions are counted for profiling.
+    """
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @max_size.setter
+    def max_size(self, size: int) -> None:
+        self._max_size = max(0, size)
+        self._evict()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self._data = OrderedDict()
+        self._max_size = max(0, max_size)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Any, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        self._evict()
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        return self._data.pop(key, default)
+
+    def keys(self) -> list:
+        """The keys, the least recently used first"""
+        return list(self._data)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _evict(self) -> None:
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._data
+
+    def __repr__(self) -> str:
+        return (
+            f"<LRUCache size={len(self)}/{self._max_size} "
+            f"hits={self.hits} misses={self.misses} evictions={self.evictions}>"
+        )
+
+
+__all__ = ["ChellyCache", "LRUCache"]
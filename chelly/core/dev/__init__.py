@@ -1,3 +1,4 @@
 from .feature import Feature
 from .manager import Manager
-from .panel import Panel
\ No newline at end of file
+from .panel import Panel
+from .overlay import OverlayCompositor, OverlayGeometry, OverlayLayer
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from time import perf_counter
+from typing import TYPE_CHECKING, Dict, List, Tuple, Union
+
+from qtpy.QtCore import QPointF, QRect
+from qtpy.QtGui import QFontMetrics, QPainter, QPaintEvent
+
+if TYPE_CHECKING:
+    from ...api import ChellyEditor
+    from ..utils import VisibleBlocks
+
+
+@dataclass(frozen=True)
+class OverlayGeometry:
+    """Geometry of a frame, computed once and shared by every overlay layer"""
+
+    rect: QRect
+    viewport_rect: QRect
+    content_offset: QPointF
+    document_margin: float
+    font_metrics: QFontMetrics
+    visible_blocks: VisibleBlocks
+
+
+class OverlayLayer:
+    """
+    Something painted over the text of the viewport by the editor
+    :class:`OverlayCompositor`, in the painter of the frame.
+    """
+
+    #: paint order, higher layers are painted last
+    OVERLAY_Z = 0
+
+    def overlay_rect(self, geometry: OverlayGeometry) -> Union[QRect, None]:
+        """
+        Area painted by the layer, the layer is skipped when it doesn't
+        intersect the repainted rect. None paints it on every frame, an empty
+        rect skips it.
+        """
+        return None
+
+    def paint_overlay(self, painter: QPainter, geometry: OverlayGeometry) -> None:
+        raise NotImplementedError()
+
+
+class OverlayCompositor:
+    """
+    Paints the overlay layers of an editor after its text, with a single
+    painter clipped to the repainted rect of the frame.
+    """
+
+    @property
+    def layers(self) -> List[OverlayLayer]:
+        return [layer for _, _, layer in self._layers]
+
+    def __init__(self, editor: ChellyEditor):
+        self._editor = editor
+        self._layers: List[Tuple[int, int, OverlayLayer]] = []
+        self._order = 0
+
+        #: duration of the last frame, and of each layer painted in it
+        self.frame_time = 0.0
+        self.layer_times: Dict[str, float] = {}
+        self.frames = 0
+
+    def add(self, layer: OverlayLayer, z: int = None) -> OverlayLayer:
+        if z is None:
+            z = getattr(layer, "OVERLAY_Z", 0)
+
+        self.remove(layer)
+        self._layers.append((z, self._order, layer))
+        self._layers.sort(key=lambda entry: entry[:2])
+        self._order += 1
+        return layer
+
+    def remove(self, layer: OverlayLayer) -> None:
+        self._layers = [entry for entry in self._layers if entry[2] is not layer]
+
+    def geometry(self, event: QPaintEvent) -> OverlayGeometry:
+        editor = self._editor
+        return OverlayGeometry(
+            rect=event.rect(),
+            viewport_rect=editor.viewport().rect(),
+            content_offset=editor.contentOffset(),
+            document_margin=editor.document().documentMargin(),
+            font_metrics=editor.fontMetrics(),
+            visible_blocks=editor.visible_blocks,
+        )
+
+    def paint(self, event: QPaintEvent) -> None:
+        layers = [
+            layer for _, _, layer in self._layers if getattr(layer, "enabled", True)
+        ]
+        if not layers:
+            return None
+
+        start = perf_counter()
+        geometry = self.geometry(event)
+        rect = geometry.rect
+        layer_times = {}
+        profiler = getattr(self._editor, "profiler", None)
+
+        painter = None
+        try:
+            for layer in layers:
+                layer_rect = layer.overlay_rect(geometry)
+                if layer_rect is not None and not layer_rect.intersects(rect):
+                    continue
+
+                if painter is None:
+                    painter = QPainter(self._editor.viewport())
+                    painter.setClipRect(rect)
+
+                layer_start = perf_counter()
+                painter.save()
+                try:
+                    layer.paint_overlay(painter, geometry)
+                finally:
+                    painter.restore()
+                layer_times[type(layer).__name__] = perf_counter() - layer_start
+                if profiler is not None and profiler.enabled:
+                    profiler.record(
+                        f"{type(layer).__name__}.paint_overlay",
+                        "overlay",
+                        layer_start,
+                        layer_times[type(layer).__name__],
+                    )
+        finally:
+            if painter is not None:
+                painter.end()
+
+        self.layer_times = layer_times
+        self.frame_time = perf_counter() - start
+        self.frames += 1
+
+
+__all__ = ["OverlayCompositor", "OverlayGeometry", "OverlayLayer"]
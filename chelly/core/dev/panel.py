@@ -1,12 +1,16 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, List
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
 from typing_extensions import Self
 
 if TYPE_CHECKING:
     from ...api import ChellyEditor
+    from ..utils import VisibleBlock
 
 from dataclasses import dataclass
+from math import ceil
+from qtpy.QtCore import QRect, Qt
+from qtpy.QtGui import QPainter, QPaintEvent, QPixmap, QRegion
 from qtpy.QtWidgets import QFrame
 from ...internal import BaseElement
 
@@ -35,6 +39,24 @@ class Panel(QFrame):
             """ Returns possible positions as an iterable (list) """
             return [cls.TOP, cls.LEFT, cls.RIGHT, cls.BOTTOM]
 
+    class Dependencies(object):
+        """
+        Enumerates what the content of a panel depends on, the panels
+        manager only repaints a panel when one of them changed
+        """
+        NONE = 0
+        #: the vertical scroll offset, scrollable panels are blitted
+        SCROLL = 1
+        #: the line of the text cursor, only its rows are repainted
+        CURSOR_LINE = 2
+        #: the text of the document
+        DOCUMENT = 4
+        #: the text decorations of the editor
+        DECORATIONS = 8
+        #: any repaint of the viewport, the caret blinking included
+        VIEWPORT = 16
+        ALL = SCROLL | CURSOR_LINE | DOCUMENT | DECORATIONS | VIEWPORT
+
     class _Properties(BaseElement):
         
         @property
@@ -49,6 +71,17 @@ class Panel(QFrame):
         super().__init__(editor)
         self.order_in_zone = -1
         self._scrollable = False
+        self._dependencies = Panel.Dependencies.ALL
+        self._backing_store = False
+        self._store: QPixmap = None
+        self._store_key: tuple = None
+        # (rendered visible blocks, top and bottom of the rendered rows),
+        # None to render every row
+        self._store_anchor: Tuple[Any, int, int] = None
+        # (first, last) lines to render again
+        self._store_invalid: List[Tuple[int, int]] = []
+        #: rows painted by the last repaint, for tests and profiling
+        self.painted_rows = 0
         self.__enabled = True
         self.__editor = editor
         self.editor.panels.refresh()
@@ -80,6 +113,221 @@ class Panel(QFrame):
     @scrollable.setter
     def scrollable(self, value:bool):
         self._scrollable = value
+
+    @property
+    def dependencies(self) -> int:
+        """
+        What the panel content depends on, a combination of
+        :class:`Panel.Dependencies` flags.
+        :type: int
+        """
+        return self._dependencies
+
+    @dependencies.setter
+    def dependencies(self, value:int):
+        self._dependencies = value
+
+    @property
+    def backing_store(self) -> bool:
+        """
+        Renders the rows of the panel in an off-screen pixmap, a repaint
+        blits it and renders only the rows shown by a scroll or invalidated.
+        Needs :meth:`paint_rows`.
+        :type: bool
+        """
+        return self._backing_store
+
+    @backing_store.setter
+    def backing_store(self, value:bool):
+        self._backing_store = value
+        self._store = None
+        self._store_anchor = None
+
+    def invalidate_rows(self, first:int = None, last:int = None) -> None:
+        """Renders again the rows of the lines, or every row"""
+        if first is None:
+            self._store_anchor = None
+        elif self._store_anchor is not None:
+            self._store_invalid.append((first, first if last is None else last))
+
+    def invalidate_rect(self, rect:QRect) -> None:
+        """Renders again the rows intersecting the rect"""
+        rows = [
+            row for row, bottom in self._visible_rows()
+            if rect.top() < bottom and row[0] <= rect.bottom()
+        ]
+        if rows:
+            self.invalidate_rows(rows[0][1], rows[-1][1])
+
+    def update(self, *args) -> None:
+        # without a rect the whole content changed
+        if not args:
+            self._store_anchor = None
+        super().update(*args)
+
+    def repaint(self, *args) -> None:
+        if not args:
+            self._store_anchor = None
+        super().repaint(*args)
+
+    def resizeEvent(self, event) -> None:
+        super().resizeEvent(event)
+        self._store_anchor = None
+
+    def paint_rows(self, painter:QPainter, rows:List[VisibleBlock]) -> None:
+        """Paints the (top, block number, block) rows of visible lines"""
+        raise NotImplementedError()
+
+    def paint_background(self, painter:QPainter, rect:QRect) -> None:
+        """Paints the background under the rows, transparent by default"""
+
+    def paint_visible_rows(self, event:QPaintEvent) -> None:
+        """Paints the rows in the repainted rect, from the backing store if enabled"""
+        if self._backing_store:
+            return self._paint_backing_store(event)
+
+        rect = event.rect()
+        rows = [
+            row
+            for row, bottom in self._visible_rows()
+            if rect.top() < bottom and row[0] <= rect.bottom()
+        ]
+        with QPainter(self) as painter:
+            self.paint_background(painter, rect)
+            self.paint_rows(painter, rows)
+        self.painted_rows = len(rows)
+
+    def _visible_rows(self):
+        """The visible rows and their bottom"""
+        visible_blocks = self.editor.visible_blocks
+        for index in range(len(visible_blocks) - 1):
+            yield visible_blocks[index], visible_blocks[index + 1][0]
+        if visible_blocks:
+            row = visible_blocks[-1]
+            yield row, row[0] + int(self.editor.blockBoundingRect(row[2]).height())
+
+    @staticmethod
+    def _row_index(visible_blocks, block_number:int) -> int:
+        """Index of the first row showing the line or a following one"""
+        low, high = 0, len(visible_blocks)
+        while low < high:
+            middle = (low + high) // 2
+            if visible_blocks[middle][1] < block_number:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _row_bottom(self, visible_blocks, index:int) -> int:
+        if index + 1 < len(visible_blocks):
+            return visible_blocks[index + 1][0]
+        top, _block_number, block = visible_blocks[index]
+        return top + int(self.editor.blockBoundingRect(block).height())
+
+    def _paint_backing_store(self, event:QPaintEvent) -> None:
+        device_pixel_ratio = self.devicePixelRatioF()
+        width, height = self.width(), self.height()
+        key = (width, height, device_pixel_ratio)
+        store = self._store
+        if store is None or self._store_key != key:
+            store = self._store = QPixmap(
+                ceil(width * device_pixel_ratio),
+                ceil(height * device_pixel_ratio),
+            )
+            store.setDevicePixelRatio(device_pixel_ratio)
+            store.fill(Qt.GlobalColor.transparent)
+            self._store_key = key
+            self._store_anchor = None
+
+        visible_blocks = self.editor.visible_blocks
+        anchor = self._store_anchor
+        invalid = self._store_invalid
+        self._store_invalid = []
+
+        # a scroll moves the rows already rendered, the rows of the lines
+        # still shown at the same place are kept
+        delta_y = None
+        if anchor is not None and visible_blocks and anchor[0]:
+            rendered_blocks = anchor[0]
+            # a line shown before and after the scroll
+            for blocks, other_blocks, sign in (
+                (visible_blocks, rendered_blocks, 1),
+                (rendered_blocks, visible_blocks, -1),
+            ):
+                top, block_number, _block = blocks[0]
+                index = self._row_index(other_blocks, block_number)
+                if index < len(other_blocks) and other_blocks[index][1] == block_number:
+                    delta_y = (top - other_blocks[index][0]) * sign
+                    break
+
+        indexes = set()
+        if delta_y is None:
+            stale = QRegion(0, 0, width, height)
+            indexes.update(range(len(visible_blocks)))
+        else:
+            if delta_y:
+                store.scroll(0, round(delta_y * device_pixel_ratio), store.rect())
+
+            # rendered rows, out of them everything is rendered again
+            valid_top = max(0, anchor[1] + delta_y)
+            valid_bottom = min(height, anchor[2] + delta_y)
+            stale = QRegion(0, 0, width, height)
+            if valid_top < valid_bottom:
+                stale -= QRegion(0, valid_top, width, valid_bottom - valid_top)
+
+            for index in range(len(visible_blocks)):
+                if visible_blocks[index][0] >= valid_top:
+                    break
+                indexes.add(index)
+            for index in range(len(visible_blocks) - 1, -1, -1):
+                if self._row_bottom(visible_blocks, index) <= valid_bottom:
+                    break
+                indexes.add(index)
+
+            for first, last in invalid:
+                index = self._row_index(visible_blocks, first)
+                while index < len(visible_blocks) and visible_blocks[index][1] <= last:
+                    indexes.add(index)
+                    index += 1
+
+        rows = [visible_blocks[index] for index in sorted(indexes)]
+        for index in indexes:
+            top = visible_blocks[index][0]
+            stale += QRegion(0, top, width, self._row_bottom(visible_blocks, index) - top)
+
+        if not stale.isEmpty():
+            with QPainter(store) as painter:
+                painter.setClipRegion(stale)
+                painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+                painter.fillRect(0, 0, width, height, Qt.GlobalColor.transparent)
+                painter.setCompositionMode(
+                    QPainter.CompositionMode.CompositionMode_SourceOver
+                )
+                self.paint_rows(painter, rows)
+
+        if visible_blocks:
+            self._store_anchor = (
+                visible_blocks,
+                visible_blocks[0][0],
+                self._row_bottom(visible_blocks, len(visible_blocks) - 1),
+            )
+        else:
+            self._store_anchor = None
+
+        rect = event.rect()
+        with QPainter(self) as painter:
+            self.paint_background(painter, rect)
+            painter.drawPixmap(
+                rect.topLeft(),
+                store,
+                QRect(
+                    round(rect.x() * device_pixel_ratio),
+                    round(rect.y() * device_pixel_ratio),
+                    ceil(rect.width() * device_pixel_ratio),
+                    ceil(rect.height() * device_pixel_ratio),
+                ),
+            )
+        self.painted_rows = len(rows)
     
     def setVisible(self, visible:bool):
         """
@@ -2,4 +2,4 @@ from .language import Language
 from .sh import SyntaxHighlighter, Highlighter
 from .text_formats import ColorScheme
 from .text_blocks import TextBlockUserData
-from .chelly_document import ChellyDocument
+from .chelly_document import ChellyDocument, EditCoalescer, EditDelta
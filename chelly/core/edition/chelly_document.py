@@ -1,20 +1,195 @@
+from dataclasses import dataclass
 from typing import List
 from typing_extensions import Self
 from ..utils import TextEngine, Character
 from ...internal import ChellyEvent
+from qtpy.QtCore import QTimer
+from qtpy.QtGui import QTextCursor, QTextDocument
 from qtpy.QtWidgets import QPlainTextEdit
 
 
+@dataclass(frozen=True)
+class EditDelta:
+    """
+    A change of a document: the text removed and the text inserted at a
+    position, and the blocks touched before and after the change.
+    """
+
+    #: position of the change, in characters
+    position: int
+    #: position of the change in its first block
+    column: int
+    removed_text: str
+    inserted_text: str
+    #: first block touched, the same before and after the change
+    first_block: int
+    #: last block touched, before the change
+    old_last_block: int
+    #: last block touched, after the change
+    new_last_block: int
+
+    @property
+    def block_delta(self) -> int:
+        """Number of blocks added, negative when blocks were removed"""
+        return self.new_last_block - self.old_last_block
+
+    def apply(self, cursor: QTextCursor) -> None:
+        """Makes the change in the document of the cursor"""
+        cursor.setPosition(self.position)
+        cursor.setPosition(self.position + len(self.removed_text), QTextCursor.KeepAnchor)
+        cursor.insertText(self.inserted_text)
+
+    def apply_to_lines(self, lines: List[str]) -> None:
+        """Makes the change in a list of lines"""
+        first = self.first_block
+        old_text = "\n".join(lines[first : self.old_last_block + 1])
+        new_text = (
+            old_text[: self.column]
+            + self.inserted_text
+            + old_text[self.column + len(self.removed_text) :]
+        )
+        lines[first : self.old_last_block + 1] = new_text.split("\n")
+
+
+class EditCoalescer:
+    """
+    Merges the changes made to a document during an event loop turn, a
+    paste, a replace-all or a reformat, into one EditDelta delivered at the
+    next turn. The lines as they were at the last delivery are kept to give
+    the removed text.
+    """
+
+    def __init__(self, document: QTextDocument):
+        self.on_edited = ChellyEvent(EditDelta)
+
+        self._document = document
+        # U+2029 separates the paragraphs of the raw text
+        self._lines = document.toRawText().split("\u2029")
+        # start, old end and new end of the changed text
+        self._region: List[int] = None
+
+        self._timer = QTimer(document)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self.flush)
+        document.contentsChange.connect(self._on_contents_change)
+
+    @property
+    def pending(self) -> bool:
+        return self._region is not None
+
+    def detach(self) -> None:
+        """Stops following the changes of the document"""
+        self._region = None
+        try:
+            self._timer.stop()
+            self._document.contentsChange.disconnect(self._on_contents_change)
+        except (RuntimeError, TypeError):
+            ...
+
+    def _on_contents_change(self, position: int, removed: int, added: int) -> None:
+        region = self._region
+        if region is None:
+            self._region = [position, position + removed, position + added]
+            self._timer.start()
+            return None
+
+        start, old_end, new_end = region
+        # the text around the region did not change, it is the same before
+        # and after the previous changes
+        end = max(new_end, position + removed)
+        region[0] = min(start, position)
+        region[1] = old_end + end - new_end
+        region[2] = end + added - removed
+
+    def flush(self) -> None:
+        """Delivers the pending changes now"""
+        region = self._region
+        if region is None:
+            return None
+
+        self._region = None
+        self._timer.stop()
+
+        document = self._document
+        lines = self._lines
+        # the changes count the final paragraph separator
+        length = document.characterCount() - 1
+        start = min(region[0], length)
+        new_end = min(region[2], length)
+
+        block = document.findBlock(start)
+        first = block.blockNumber()
+        column = start - block.position()
+
+        old_last = first
+        remaining = column + region[1] - start
+        while old_last < len(lines) - 1 and remaining > len(lines[old_last]):
+            remaining -= len(lines[old_last]) + 1
+            old_last += 1
+        removed_text = "\n".join(lines[first : old_last + 1])[column : column + region[1] - start]
+
+        new_lines = []
+        last_block = document.findBlock(new_end)
+        while block.isValid():
+            new_lines.append(block.text())
+            if block == last_block:
+                break
+            block = block.next()
+        inserted_text = "\n".join(new_lines)[column : column + new_end - start]
+
+        lines[first : old_last + 1] = new_lines
+        if removed_text == inserted_text:
+            # formats only
+            return None
+
+        self.on_edited.emit(
+            EditDelta(
+                start,
+                column,
+                removed_text,
+                inserted_text,
+                first,
+                old_last,
+                first + len(new_lines) - 1,
+            )
+        )
+
+
 class ChellyDocument:
     @property
     def editor(self) -> QPlainTextEdit:
         return self._editor
 
+    @property
+    def document(self) -> QTextDocument:
+        return self._document
+
+    @property
+    def edits(self) -> EditCoalescer:
+        """The changes of the document merged once per event loop turn"""
+        if self._edits is None:
+            self._edits = EditCoalescer(self._document)
+        return self._edits
+
+    @property
+    def tracks_edits(self) -> bool:
+        return self._edits is not None
+
+    def release_edits(self) -> None:
+        """Drops the edits and the copy of the lines when nothing uses them"""
+        if self._edits is not None and not len(self._edits.on_edited):
+            self._edits.detach()
+            self._edits = None
+
     def __init__(self, editor: QPlainTextEdit):
         self.on_contents_changed = ChellyEvent(object, int, int, int)
 
         self._editor = editor
-        self._editor.document().contentsChange.connect(self.__update_contents)
+        # a shared document has no parent, it lives as long as this reference
+        self._document = editor.document()
+        self._edits = None
+        self._document.contentsChange.connect(self.__update_contents)
 
     def __update_contents(
         self, from_: int = 0, charsremoved: int = 0, charsadded: int = 0
@@ -22,4 +197,4 @@ class ChellyDocument:
         self.on_contents_changed.emit(self._editor, from_, charsremoved, charsadded)
 
 
-__all__ = ["ChellyDocument"]
+__all__ = ["ChellyDocument", "EditCoalescer", "EditDelta"]
@@ -1,9 +1,381 @@
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Dict, List, Tuple
+
+from qtpy.QtCore import QObject, Qt, QThread, Signal
+from qtpy.QtWidgets import QApplication
+
+from ...internal import ChellyQThreadManager
+from ..chelly_cache import LRUCache
+from ..utils import TextBlockHelper
 from .sh import SyntaxHighlighter
 
 
+class TokenizerWorker(QObject):
+    """
+    Tokenizes plain text snapshots away from the GUI thread, the results are
+    emitted in chunks tagged with the revision of the snapshot.
+    """
+
+    on_tokenized = Signal(int, int, object, bool)
+
+    def __init__(self, tokenize: Callable, chunk_size: int):
+        super().__init__()
+        self.tokenize = tokenize
+        self.chunk_size = chunk_size
+        #: latest document revision, older requests are abandoned
+        self.revision = 0
+
+    def run(self, revision: int, first_line: int, prev_state: int, lines: list):
+        results = []
+        chunk_first_line = first_line
+
+        for line_number, text in enumerate(lines, first_line):
+            if revision != self.revision:
+                break
+
+            tokens = self.tokenize(text, prev_state)
+            results.append((prev_state, text, tokens))
+            prev_state = tokens.state
+
+            if len(results) >= self.chunk_size:
+                self.on_tokenized.emit(revision, chunk_first_line, results, False)
+                results = []
+                chunk_first_line = line_number + 1
+
+        self.on_tokenized.emit(revision, chunk_first_line, results, True)
+
+
 class Language(SyntaxHighlighter):
+    on_tokens_requested = Signal(int, int, int, object)
+
+    @dataclass(frozen=True)
+    class Defaults:
+        TOKEN_CACHE_SIZE = 4096
+        BACKGROUND = False
+        BACKGROUND_CHUNK_SIZE = 1000  # lines per result batch
+
+    _background_thread = None
+    # workers running in the background thread
+    _background_users = 0
+
+    @classmethod
+    def shared_token_cache(cls) -> LRUCache:
+        """
+        Token runs cache shared by every highlighter of this language class,
+        so editors showing the same text don't tokenize it again.
+        """
+        cache = cls.__dict__.get("_token_cache")
+        if cache is None:
+            cache = LRUCache(Language.Defaults.TOKEN_CACHE_SIZE)
+            cls._token_cache = cache
+        return cache
+
+    @staticmethod
+    def shared_background_thread() -> QThread:
+        """
+        The thread of the background workers, started for the first one. Every
+        call counts a worker, ``release_background_thread`` gives it back.
+        """
+        if Language._background_thread is None:
+            thread = QThread()
+            ChellyQThreadManager(QApplication.instance()).append(thread)
+            # forgotten as soon as it stops, the thread manager kills it when
+            # the application quits
+            thread.finished.connect(
+                partial(Language._forget_background_thread, thread), Qt.DirectConnection
+            )
+            thread.start()
+            Language._background_thread = thread
+            Language._background_users = 0
+
+        Language._background_users += 1
+        return Language._background_thread
+
+    @staticmethod
+    def release_background_thread(thread: QThread) -> None:
+        """Stops the background thread once its last worker released it"""
+        if thread is not Language._background_thread:
+            # already stopped
+            return None
+
+        Language._background_users -= 1
+        if Language._background_users > 0:
+            return None
+
+        Language._forget_background_thread(thread)
+        ChellyQThreadManager(QApplication.instance()).remove(thread)
+        thread.quit()
+        thread.wait()
+        thread.deleteLater()
+
+    @staticmethod
+    def _forget_background_thread(thread: QThread) -> None:
+        if thread is Language._background_thread:
+            Language._background_thread = None
+            Language._background_users = 0
+
+    @staticmethod
+    def _release_worker(worker: QObject, thread: QThread) -> None:
+        try:
+            # deleted by its thread, after the request it may be running
+            worker.deleteLater()
+        except RuntimeError:
+            ...
+        Language.release_background_thread(thread)
+
+    def move_to_background_thread(self, worker: QObject) -> None:
+        """Runs the worker in the background thread until it is released"""
+        thread = self.shared_background_thread()
+        worker.moveToThread(thread)
+        release = partial(Language._release_worker, worker, thread)
+        self._worker_releases[worker] = release
+        self.destroyed.connect(release)
+
+    def release_worker(self, worker: QObject) -> None:
+        """Deletes a worker of ``move_to_background_thread``"""
+        release = self._worker_releases.pop(worker)
+        try:
+            self.destroyed.disconnect(release)
+        except (RuntimeError, TypeError):
+            ...
+        release()
+
+    @property
+    def token_cache(self) -> LRUCache:
+        return self.shared_token_cache()
+
+    @property
+    def background(self) -> bool:
+        """
+        Tokenizes the blocks out of the viewport in a worker thread, the GUI
+        thread only applies the resulting runs. Implies the progressive mode.
+        """
+        return self._background
+
+    @background.setter
+    def background(self, value: bool) -> None:
+        if value == self._background:
+            return None
+
+        self._background = value
+        self._background_tokens.clear()
+
+        if value:
+            self.progressive = True
+            if self._worker is None:
+                self._worker = TokenizerWorker(
+                    self.tokenize, Language.Defaults.BACKGROUND_CHUNK_SIZE
+                )
+                self.move_to_background_thread(self._worker)
+                self.on_tokens_requested.connect(self._worker.run)
+                self._worker.on_tokenized.connect(self._on_tokens_ready)
+            self._worker.revision = self._revision
+        else:
+            self._requested_ranges = []
+            if self._worker is not None:
+                # abandon the requests in flight
+                self._worker.revision = -1
+                self.on_tokens_requested.disconnect(self._worker.run)
+                self._worker.on_tokenized.disconnect(self._on_tokens_ready)
+                self.release_worker(self._worker)
+                self._worker = None
+            self.rehighlight()
+
+    @property
+    def revision(self) -> int:
+        """Incremented on every change of the document text"""
+        return self._revision
+
+    @property
+    def is_highlighting(self) -> bool:
+        return super().is_highlighting or bool(self._requested_ranges)
+
     def __init__(self, editor, color_scheme=None):
         super().__init__(editor, color_scheme)
+        self._background = Language.Defaults.BACKGROUND
+        self._background_tokens: Dict[int, Tuple[int, str, object]] = {}
+        self._requested_ranges: List[List[int]] = []
+        self._revision = 0
+        self._worker = None
+        # worker -> release of its thread
+        self._worker_releases: Dict[QObject, Callable] = {}
+
+    def tokenize(self, text: str, prev_state: int):
+        """
+        Returns the tokens of a line given the state of the previous one, must
+        not depend on the block so the result can be cached or computed by a
+        worker thread.
+        """
+        raise NotImplementedError()
+
+    def highlight_tokens(self, text: str, block):
+        """Highlights the block with cached tokens when the line was seen before"""
+        prev_state = TextBlockHelper.get_state(block.previous())
+
+        tokens = None
+        if self._background_tokens:
+            pending = self._background_tokens.pop(block.blockNumber(), None)
+            if pending is not None and pending[:2] == (prev_state, text):
+                tokens = pending[2]
+
+        if tokens is None:
+            cache = self.token_cache
+            key = (prev_state, text)
+
+            tokens = cache.get(key)
+            if tokens is None:
+                tokens = self.tokenize(text, prev_state)
+                cache.put(key, tokens)
+
+        self.set_format_runs(tokens.runs)
+        TextBlockHelper.set_state(block, tokens.state)
+        return tokens
+
+    def set_format_runs(self, runs) -> None:
+        """Applies (start, length, format key) runs to the current block"""
+        formats = self.formats
+        for start, length, kind in runs:
+            self.setFormat(start, length, formats[kind])
+
+    def rehighlight(self):
+        if not self._background:
+            return super().rehighlight()
+
+        self._background_tokens.clear()
+        last_block = self.document().blockCount() - 1
+        first, last = self._visible_range()
+        last = min(last, last_block)
+
+        self.mark_dirty(first, last)
+        self._cached_visible_window = None
+        self._highlight_visible_blocks()
+
+        if first > 0:
+            self.request_tokens(0, first - 1)
+        if last < last_block:
+            self.request_tokens(last + 1, last_block)
+
+    def request_tokens(self, first_block: int, last_block: int) -> None:
+        """Sends a snapshot of the block range to the worker thread"""
+        document = self.document()
+        last_block = min(last_block, document.blockCount() - 1)
+        if last_block < first_block:
+            return None
+
+        lines = None
+        if last_block - first_block > Language.Defaults.BACKGROUND_CHUNK_SIZE:
+            lines = document.toPlainText().split("\n")
+            if len(lines) == document.blockCount():
+                lines = lines[first_block : last_block + 1]
+            else:
+                # line separators inside a block, use the block texts
+                lines = None
+
+        if lines is None:
+            lines = [block.text() for block in self._iterate_blocks(first_block, last_block)]
+
+        prev_state = TextBlockHelper.get_state(document.findBlockByNumber(first_block - 1))
+        if prev_state in (-1, self.UNKNOWN_STATE):
+            prev_state = 0
+
+        self._requested_ranges.append([first_block, last_block])
+        self.on_tokens_requested.emit(self._revision, first_block, prev_state, lines)
+
+    def _iterate_blocks(self, first_block: int, last_block: int):
+        block = self.document().findBlockByNumber(first_block)
+        while block.isValid() and block.blockNumber() <= last_block:
+            yield block
+            block = block.next()
+
+    def _is_requested(self, block_number: int) -> bool:
+        for first, last in self._requested_ranges:
+            if first <= block_number <= last:
+                return True
+        return False
+
+    def _is_block_due(self, block) -> bool:
+        if not super()._is_block_due(block):
+            return False
+
+        if self._background and self._slice_deadline is not None:
+            # don't tokenize on the GUI thread what the worker will deliver
+            block_number = block.blockNumber()
+            if block_number not in self._background_tokens:
+                return not self._is_requested(block_number)
+
+        return True
+
+    def _merge_skipped(self) -> None:
+        if not self._background:
+            return super()._merge_skipped()
+
+        if self._skipped_range is None:
+            return None
+
+        first, last = self._skipped_range
+        self._skipped_range = None
+
+        for requested_first, requested_last in sorted(self._requested_ranges):
+            if requested_last < first or requested_first > last:
+                continue
+            if requested_first > first:
+                self.request_tokens(first, requested_first - 1)
+            first = requested_last + 1
+
+        if first <= last:
+            self.request_tokens(first, last)
+
+    def _on_tokens_ready(
+        self, revision: int, first_block: int, results: List, finished: bool
+    ):
+        if revision != self._revision or not self._background:
+            return None
+
+        next_block = first_block + len(results)
+        for requested_range in self._requested_ranges:
+            if requested_range[0] == first_block:
+                requested_range[0] = next_block
+                if finished:
+                    self._requested_ranges.remove(requested_range)
+                break
+
+        for block_number, result in enumerate(results, first_block):
+            self._background_tokens[block_number] = result
+
+        if results:
+            self.mark_dirty(first_block, next_block - 1)
+        elif not self.is_highlighting:
+            self.on_highlight_finished.emit()
+
+    def _on_contents_change(self, position: int, removed: int, added: int) -> None:
+        document = self.document()
+        delta = document.blockCount() - self._cached_block_count
+
+        super()._on_contents_change(position, removed, added)
+        self._revision += 1
+
+        if self._worker is None or not self._background:
+            return None
+
+        self._worker.revision = self._revision
+        # block numbers of the pending results may have shifted, ask again
+        # for everything not applied yet
+        self._background_tokens.clear()
+        block_number = document.findBlock(position).blockNumber()
+        ranges = [
+            self._shift_range(requested_range, block_number, delta)
+            for requested_range in self._requested_ranges
+        ]
+        if self._dirty_range is not None:
+            ranges.append(self._dirty_range)
+            self._dirty_range = None
+
+        self._requested_ranges = []
+        for first, last in ranges:
+            # requested again by the next slice, once per event loop turn
+            self._mark_skipped(first)
+            self._mark_skipped(last)
 
 
-__all__ = ["Language"]
+__all__ = ["Language", "TokenizerWorker"]
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Type, Union
+from dataclasses import dataclass
+from time import perf_counter
+from typing import TYPE_CHECKING, Tuple, Type, Union
 
 if TYPE_CHECKING:
     from ...api import ChellyEditor
 
-from qtpy.QtCore import Qt, Signal
+from qtpy.QtCore import Qt, Signal, QTimer
 from qtpy.QtWidgets import QApplication
 from qtpy.QtCore import QRegularExpression
-from qtpy.QtGui import QSyntaxHighlighter, QTextCharFormat, QCursor
+from qtpy.QtGui import QSyntaxHighlighter, QTextCharFormat, QCursor, QTextBlock
+from ..utils import TextBlockHelper
 from .text_formats import ColorScheme
 
 
@@ -29,6 +32,15 @@ class Highlighter(QSyntaxHighlighter):
 class SyntaxHighlighter(Highlighter):
     block_highlight_started = Signal(object, object)
     block_highlight_finished = Signal(object, object)
+    on_highlight_finished = Signal()
+
+    @dataclass(frozen=True)
+    class Defaults:
+        PROGRESSIVE = False
+        TIME_BUDGET = 8  # milliseconds per slice
+
+    #: Low state bits of a block waiting to be highlighted again
+    UNKNOWN_STATE = 0xFFFF
 
     @property
     def formats(self):
@@ -42,18 +54,107 @@ class SyntaxHighlighter(Highlighter):
     def color_scheme(self, color_scheme):
         if isinstance(color_scheme, ColorScheme):
             self._color_scheme = color_scheme
+            self.restyle()
+
+    @property
+    def progressive(self) -> bool:
+        """
+        In progressive mode the visible blocks are highlighted first and the
+        rest of the document is finished in small time slices.
+        """
+        return self._progressive
+
+    @progressive.setter
+    def progressive(self, value: bool) -> None:
+        self._progressive = value
+
+        if not value and self._dirty_range is not None:
+            self._slice_timer.stop()
+            self._dirty_range = None
+            self._skipped_range = None
             self.rehighlight()
 
+    @property
+    def time_budget(self) -> int:
+        return self._time_budget
+
+    @time_budget.setter
+    def time_budget(self, milliseconds: int) -> None:
+        self._time_budget = max(1, milliseconds)
+
+    @property
+    def is_highlighting(self) -> bool:
+        return (
+            self._dirty_range is not None
+            or self._skipped_range is not None
+            or self._restyle_range is not None
+        )
+
     def __init__(self, editor: ChellyEditor, color_scheme: dict = None):
         super().__init__(editor)
 
         if color_scheme is None:
             color_scheme = dict({})
 
-        self._color_scheme = ColorScheme(color_scheme)
+        self._color_scheme = ColorScheme.from_style(color_scheme)
+
+        self._progressive = SyntaxHighlighter.Defaults.PROGRESSIVE
+        self._time_budget = SyntaxHighlighter.Defaults.TIME_BUDGET
+        self._dirty_range: Union[Tuple[int, int], None] = None
+        self._skipped_range: Union[Tuple[int, int], None] = None
+        self._slice_deadline = None
+        self._last_highlighted_block = -1
+        self._cached_visible_range = None
+        self._cached_visible_window = None
+        self._cached_block_count = self.document().blockCount()
+        self._restyle_range: Union[Tuple[int, int], None] = None
+
+        self._slice_timer = QTimer()
+        self._slice_timer.setSingleShot(True)
+        self._slice_timer.setInterval(0)
+        self._slice_timer.timeout.connect(self._highlight_next_slice)
+
+        self._restyle_timer = QTimer()
+        self._restyle_timer.setSingleShot(True)
+        self._restyle_timer.setInterval(0)
+        self._restyle_timer.timeout.connect(self._restyle_next_slice)
+
+        # attach the document again so the bookkeeping of an edit runs before
+        # Qt highlights the changed blocks with their new numbers
+        document = self.document()
+        self.setDocument(None)
+        self.setDocument(document)
+
+        if hasattr(editor, "on_painted"):
+            editor.on_painted.connect(self._on_editor_painted)
+
+    def setDocument(self, document) -> None:
+        previous_document = self.document()
+        if previous_document is not None:
+            try:
+                previous_document.contentsChange.disconnect(self._on_contents_change)
+            except (RuntimeError, TypeError):
+                ...
+
+        self._dirty_range = None
+        self._restyle_range = None
+        self._cached_visible_range = None
+        if document is not None:
+            # connected before the handler of Qt, see __init__
+            document.contentsChange.connect(self._on_contents_change)
+            self._cached_block_count = document.blockCount()
+        super().setDocument(document)
 
     def highlightBlock(self, text) -> None:
         current_block = self.currentBlock()
+
+        if self._progressive and not self._is_block_due(current_block):
+            # keep the previous state so Qt stops the cascade here, the
+            # block will be highlighted by a later slice
+            self._mark_skipped(current_block.blockNumber())
+            return None
+
+        self._last_highlighted_block = current_block.blockNumber()
         # if current_block.isVisible() and current_block.isValid():
         # self.block_highlight_started.emit(self, current_block)
         self.highlight_block(text, current_block)
@@ -63,6 +164,12 @@ class SyntaxHighlighter(Highlighter):
         raise NotImplementedError()
 
     def rehighlight(self):
+        if self._progressive:
+            self.mark_dirty(0, self.document().blockCount() - 1)
+            self._cached_visible_window = None
+            self._highlight_visible_blocks()
+            return None
+
         QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
         try:
             super().rehighlight()
@@ -70,5 +177,257 @@ class SyntaxHighlighter(Highlighter):
             ...
         QApplication.restoreOverrideCursor()
 
+    def restyle(self) -> None:
+        """
+        Applies the formats of the current color scheme to the highlighted
+        blocks without tokenizing them again. The visible blocks are done
+        right away and the rest of the document in small time slices.
+        """
+        last_block = self.document().blockCount() - 1
+        self._restyle_range = (0, last_block)
+
+        first, last = self._visible_range()
+        self.restyle_blocks(first, min(last, last_block))
+
+        if not self._restyle_timer.isActive():
+            self._restyle_timer.start()
+
+    def restyle_blocks(self, first_block: int, last_block: int) -> None:
+        block = self.document().findBlockByNumber(first_block)
+        dirty = None
+        while block.isValid() and block.blockNumber() <= last_block:
+            dirty = self._restyle_block(block, dirty)
+            block = block.next()
+        self._mark_restyled(dirty)
+
+    def _restyle_block(self, block: QTextBlock, dirty: Union[Tuple[int, int], None]):
+        """Returns the character range to repaint, grown with the block when it changed"""
+        layout = block.layout()
+        format_ranges = layout.formats()
+        color_scheme = self._color_scheme
+        formats = color_scheme.formats
+
+        changed = False
+        for format_range in format_ranges:
+            kind = color_scheme.kind_of(format_range.format)
+            if kind is None:
+                continue
+
+            fmt = formats[kind]
+            if format_range.format != fmt:
+                format_range.format = fmt
+                changed = True
+
+        if not changed:
+            return dirty
+
+        layout.setFormats(format_ranges)
+        end = block.position() + block.length()
+        if dirty is None:
+            return (block.position(), end)
+        return (dirty[0], end)
+
+    def _mark_restyled(self, dirty: Union[Tuple[int, int], None]) -> None:
+        # a single relayout for all the restyled blocks
+        if dirty is not None:
+            self.document().markContentsDirty(dirty[0], dirty[1] - dirty[0])
+
+    def _restyle_next_slice(self) -> None:
+        if self._restyle_range is None:
+            return None
+
+        first, last = self._restyle_range
+        block = self.document().findBlockByNumber(first)
+        deadline = perf_counter() + self._time_budget / 1000
+
+        dirty = None
+        while block.isValid() and block.blockNumber() <= last:
+            if perf_counter() >= deadline:
+                break
+            dirty = self._restyle_block(block, dirty)
+            block = block.next()
+        self._mark_restyled(dirty)
+
+        if block.isValid() and block.blockNumber() <= last:
+            self._restyle_range = (block.blockNumber(), last)
+            self._restyle_timer.start()
+        else:
+            self._restyle_range = None
+            if not self.is_highlighting:
+                self.on_highlight_finished.emit()
+
+    def mark_dirty(self, first_block: int, last_block: int = None) -> None:
+        """Schedules the given block range to be highlighted by the next slices"""
+        if last_block is None:
+            last_block = first_block
+
+        # an unknown state makes Qt cascade through the whole range in a
+        # single rehighlightBlock call instead of stopping at each block
+        block = self.document().findBlockByNumber(first_block)
+        while block.isValid() and block.blockNumber() <= last_block:
+            if block.userState() != -1:
+                TextBlockHelper.set_state(block, self.UNKNOWN_STATE)
+            block = block.next()
+
+        if self._dirty_range is None:
+            self._dirty_range = (first_block, last_block)
+        else:
+            first, last = self._dirty_range
+            self._dirty_range = (min(first, first_block), max(last, last_block))
+
+        if not self._slice_timer.isActive():
+            self._slice_timer.start()
+
+    def _mark_skipped(self, block_number: int) -> None:
+        if self._skipped_range is None:
+            self._skipped_range = (block_number, block_number)
+        else:
+            first, last = self._skipped_range
+            self._skipped_range = (min(first, block_number), max(last, block_number))
+
+        if not self._slice_timer.isActive():
+            self._slice_timer.start()
+
+    def _merge_skipped(self) -> None:
+        if self._skipped_range is not None:
+            first, last = self._skipped_range
+            self._skipped_range = None
+            self.mark_dirty(first, last)
+
+    def _visible_range(self) -> Tuple[int, int]:
+        if self._cached_visible_range is None:
+            editor = self.editor
+            visible_blocks = getattr(editor, "visible_blocks", None)
+
+            if visible_blocks:
+                first = visible_blocks[0][1]
+                last = visible_blocks[-1][1] + 1
+            else:
+                first = editor.firstVisibleBlock().blockNumber()
+                last = first
+
+            line_height = max(1, editor.fontMetrics().height())
+            last = max(last, first + editor.viewport().height() // line_height + 1)
+            self._cached_visible_range = (first, last)
+
+        return self._cached_visible_range
+
+    def _is_block_due(self, block: QTextBlock) -> bool:
+        if self._slice_deadline is not None:
+            # everything cascaded from the slice start is due until the
+            # time budget is spent
+            return perf_counter() < self._slice_deadline
+
+        first, last = self._visible_range()
+        return first <= block.blockNumber() <= last
+
+    def _highlight_visible_blocks(self) -> None:
+        if self._dirty_range is None:
+            return None
+
+        window = self._visible_range()
+        if window == self._cached_visible_window:
+            return None
+        self._cached_visible_window = window
+
+        first, last = window
+        dirty_first, dirty_last = self._dirty_range
+        first = max(first, dirty_first)
+        last = min(last, dirty_last)
+
+        block = self.document().findBlockByNumber(first)
+        while block.isValid() and block.blockNumber() <= last:
+            self._last_highlighted_block = -1
+            self.rehighlightBlock(block)
+
+            if self._last_highlighted_block < block.blockNumber():
+                break
+            block = block.next()
+
+            # visible blocks have unknown states, so the cascade usually
+            # covers the whole window with the first call
+            while block.isValid() and block.blockNumber() <= self._last_highlighted_block:
+                block = block.next()
+
+    def _highlight_next_slice(self) -> None:
+        self._merge_skipped()
+
+        if self._dirty_range is None:
+            return None
+
+        document = self.document()
+        first, last = self._dirty_range
+        block = document.findBlockByNumber(first)
+        self._slice_deadline = perf_counter() + self._time_budget / 1000
+
+        try:
+            while block.isValid() and block.blockNumber() <= last:
+                if perf_counter() >= self._slice_deadline:
+                    break
+
+                if block.userState() != -1:
+                    TextBlockHelper.set_state(block, self.UNKNOWN_STATE)
+
+                self._last_highlighted_block = -1
+                self.rehighlightBlock(block)
+
+                if self._last_highlighted_block < block.blockNumber():
+                    break
+                block = document.findBlockByNumber(self._last_highlighted_block + 1)
+
+                # blocks skipped by the cascade extend the pending range
+                self._merge_skipped()
+                last = self._dirty_range[1]
+        finally:
+            self._slice_deadline = None
+
+        if block.isValid() and block.blockNumber() <= last:
+            self._dirty_range = (block.blockNumber(), last)
+            self._slice_timer.start()
+        else:
+            self._slice_timer.stop()
+            self._dirty_range = None
+            self._cached_visible_window = None
+            if not self.is_highlighting:
+                self.on_highlight_finished.emit()
+
+    def _on_contents_change(self, position: int, removed: int, added: int) -> None:
+        document = self.document()
+        block_count = document.blockCount()
+        delta = block_count - self._cached_block_count
+        self._cached_block_count = block_count
+        self._cached_visible_range = None
+
+        if delta:
+            block_number = document.findBlock(position).blockNumber()
+            if self._dirty_range is not None:
+                self._dirty_range = self._shift_range(self._dirty_range, block_number, delta)
+            if self._restyle_range is not None:
+                self._restyle_range = self._shift_range(
+                    self._restyle_range, block_number, delta
+                )
+
+    @staticmethod
+    def _shift_range(block_range: Tuple[int, int], block_number: int, delta: int):
+        """Moves a block range after ``delta`` blocks were added at ``block_number``"""
+        first, last = block_range
+
+        if block_number < first:
+            first = max(block_number, first + delta)
+        if block_number <= last:
+            last = max(block_number, last + delta)
+
+        return (first, last)
+
+    def _on_editor_painted(self, *args) -> None:
+        self._cached_visible_range = None
+
+        if self._restyle_range is not None:
+            first, last = self._visible_range()
+            self.restyle_blocks(first, last)
+
+        if self._progressive:
+            self._highlight_visible_blocks()
+
 
 __all__ = ["Highlighter", "SyntaxHighlighter"]
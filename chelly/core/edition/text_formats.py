@@ -1,8 +1,9 @@
-from typing import Union
+import weakref
+from typing import Any, Callable, Tuple, Union
 
 from pygments.style import Style
 from pygments.token import Punctuation, Token
-from qtpy.QtGui import QBrush, QColor, QFont, QTextCharFormat
+from qtpy.QtGui import QBrush, QColor, QFont, QTextCharFormat, QTextFormat
 from .. import drift_color
 
 
@@ -60,6 +61,36 @@ class ColorScheme(object):
         "operator_word": Token.Operator.Word,
     }
 
+    #: Every format holds the id of its key in this property, so highlighted
+    #: blocks can switch to the formats of another scheme without being
+    #: tokenized again
+    KIND_PROPERTY = QTextFormat.UserProperty + 1
+    KINDS = ("background", *COLOR_SCHEME_KEYS)
+    KIND_IDS = {kind: kind_id for kind_id, kind in enumerate(KINDS)}
+
+    # process-wide tables, entries live as long as a scheme uses them
+    _schemes = weakref.WeakValueDictionary()
+    _shared_brushes = weakref.WeakValueDictionary()
+    _shared_formats = weakref.WeakValueDictionary()
+
+    @classmethod
+    def from_style(cls, style: Style) -> "ColorScheme":
+        """
+        Returns the color scheme of a pygments style, built once and shared by
+        every highlighter using the style. The shared formats must not be
+        modified in place.
+        """
+        try:
+            scheme = cls._schemes.get((cls, style))
+        except TypeError:
+            # not a style class, nothing to share
+            return cls(style)
+
+        if scheme is None:
+            scheme = cls(style)
+            cls._schemes[(cls, style)] = scheme
+        return scheme
+
     @property
     def background(self) -> QColor:
         return self.formats["background"].background().color()
@@ -76,11 +107,43 @@ class ColorScheme(object):
         self.load_formats_from_style(self._style)
 
     def load_formats_from_style(self, style: Style):
-        self.formats["background"] = self.get_format_from_color(style.background_color)
+        self.formats["background"] = self._shared_format(
+            "background",
+            style.background_color,
+            lambda: self.get_format_from_color(style.background_color),
+        )
 
         for key, token in self.COLOR_SCHEME_KEYS.items():
             if token and key:
-                self.formats[key] = self.get_format_from_style(token, style)
+                self.formats[key] = self._shared_format(
+                    key,
+                    (style.background_color, tuple(style.style_for_token(token).items())),
+                    lambda: self.get_format_from_style(token, style),
+                )
+
+    def _shared_format(
+        self, key: str, source: Any, build: Callable[[], QTextCharFormat]
+    ) -> QTextCharFormat:
+        """Returns the interned format of a key built from the same style values"""
+        shared_key: Tuple = (type(self), key, source)
+        try:
+            fmt = ColorScheme._shared_formats.get(shared_key)
+        except TypeError:
+            shared_key, fmt = None, None
+
+        if fmt is None:
+            fmt = build()
+            fmt.setProperty(self.KIND_PROPERTY, self.KIND_IDS[key])
+            if shared_key is not None:
+                ColorScheme._shared_formats[shared_key] = fmt
+        return fmt
+
+    def kind_of(self, fmt: QTextCharFormat) -> Union[str, None]:
+        """Returns the key of a format made by a color scheme"""
+        kind_id = fmt.property(self.KIND_PROPERTY)
+        if isinstance(kind_id, int) and 0 <= kind_id < len(self.KINDS):
+            return self.KINDS[kind_id]
+        return None
 
     def get_format_from_color(self, color):
         fmt = QTextCharFormat()
@@ -124,8 +187,11 @@ class ColorScheme(object):
         """Returns a brush for the color."""
         result = self._brushes.get(color)
         if result is None:
-            qcolor = self.get_color(color)
-            result = QBrush(qcolor)
+            result = ColorScheme._shared_brushes.get(color)
+            if result is None:
+                qcolor = self.get_color(color)
+                result = QBrush(qcolor)
+                ColorScheme._shared_brushes[color] = result
             self._brushes[color] = result
         return result
 
@@ -48,6 +48,12 @@ class Properties(BaseElement):
     def show_whitespaces(self) -> bool:
         return self._show_whitespaces
 
+    @show_whitespaces.setter
+    def show_whitespaces(self, show: bool) -> None:
+        # painted by the IndentationMarks feature
+        self._show_whitespaces = bool(show)
+        self._editor.viewport().update()
+
     @chelly_property
     def text(self) -> str:
         return self._editor.toPlainText()
@@ -122,7 +128,7 @@ class Properties(BaseElement):
     def font(self, new_font: QFont) -> None:
         self._font = new_font
         self._font_size = new_font.pointSize()
-        self._editor.setFont(new_font)
+        self.__set_font(new_font)
 
     @chelly_property
     def font_family(self) -> str:
@@ -133,7 +139,7 @@ class Properties(BaseElement):
         self._font_family = new_family
         font = self._editor.font()
         font.setFamily(new_family)
-        self._editor.setFont(font)
+        self.__set_font(font)
 
     @chelly_property
     def font_size(self) -> Union[int, float]:
@@ -149,7 +155,7 @@ class Properties(BaseElement):
         elif isinstance(new_size, float):
             font.setPointSizeF(new_size)
 
-        self._editor.setFont(font)
+        self.__set_font(font)
 
     @chelly_property
     def zoom(self) -> Union[int, float]:
@@ -174,6 +180,11 @@ class Properties(BaseElement):
             else:
                 new_font.setPointSize(font_calc)
 
+        self.__set_font(new_font)
+
+    def __set_font(self, new_font: QFont) -> None:
+        # the measures of the previous font are not needed anymore
+        FontEngine.invalidate(self._editor.font())
         self._editor.setFont(new_font)
 
     def __set_tab_distance(self, char: str, indent_size: int):
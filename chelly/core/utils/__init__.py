@@ -2,4 +2,7 @@ from .enums import Character
 from .functions import *
 from .engines import TextEngine, FontEngine
 from .helpers import TextBlockHelper, DelayJobRunner
+from .line_widths import LineWidths
+from .profiler import FrameProfiler
 from .text_decorations import TextDecoration
+from .visible_range import VisibleBlocks, VisibleRange
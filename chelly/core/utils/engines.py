@@ -1,6 +1,7 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Tuple, Union, Any
-from qtpy.QtGui import QTextCursor, QTextBlock, QFont, QFontMetrics
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Tuple, Union, Any
+from qtpy.QtGui import QTextCursor, QTextBlock, QFont, QFontMetrics, QGuiApplication
 from qtpy.QtCore import QRect, QPoint
 import enum
 
@@ -418,25 +419,131 @@ class TextEngine:
         self._editor.viewport().setCursor(cursor)
 
 
+class _FontMetricsCache:
+    """Measures of one font"""
+
+    __slots__ = ("metrics", "advances", "bearings", "height", "line_spacing")
+
+    def __init__(self, font: QFont):
+        self.metrics = QFontMetrics(font)
+        self.advances: Dict[str, int] = {}
+        self.bearings: Dict[str, Tuple[int, int]] = {}
+        self.height = self.metrics.height()
+        self.line_spacing = self.metrics.lineSpacing()
+
+
 class FontEngine:
+    """
+    Font measures shared by every engine of the same font key. They are
+    memoized until :meth:`invalidate` is called, on a zoom or a font change.
+    The metrics are the ones of the screen, as QFontMetrics(font), the same
+    at every device pixel ratio.
+    """
+
+    #: fonts kept, the least recently used are dropped first
+    MAX_FONTS = 64
+
+    _fonts: "OrderedDict[str, _FontMetricsCache]" = OrderedDict()
+    _watching = False
+
+    #: memoized measures found / computed, see :meth:`statistics`
+    hits = 0
+    misses = 0
+
     def __init__(self, font: QFont):
         self._font = font
-        self._metrics = QFontMetrics(self._font)
+        self._cache = FontEngine._cached(font)
+
+    @classmethod
+    def _cached(cls, font: QFont) -> _FontMetricsCache:
+        key = font.key()
+        fonts = cls._fonts
+        cache = fonts.get(key)
+        if cache is not None:
+            cls.hits += 1
+            fonts.move_to_end(key)
+            return cache
+
+        cls.misses += 1
+        if not cls._watching and QGuiApplication.instance() is not None:
+            # installed fonts can change the metrics of a font key
+            QGuiApplication.instance().fontDatabaseChanged.connect(cls.invalidate)
+            cls._watching = True
+
+        cache = fonts[key] = _FontMetricsCache(font)
+        while len(fonts) > cls.MAX_FONTS:
+            fonts.popitem(last=False)
+        return cache
+
+    @classmethod
+    def invalidate(cls, font: QFont = None) -> None:
+        """Forgets the measures of the font, or of every font"""
+        if font is None:
+            cls._fonts.clear()
+            return None
+
+        cls._fonts.pop(font.key(), None)
+
+    @classmethod
+    def statistics(cls) -> Dict[str, Union[int, float]]:
+        total = cls.hits + cls.misses
+        return {
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "hit_rate": cls.hits / total if total else 0.0,
+            "fonts": len(cls._fonts),
+        }
+
+    @classmethod
+    def reset_statistics(cls) -> None:
+        cls.hits = 0
+        cls.misses = 0
+
+    @property
+    def metrics(self) -> QFontMetrics:
+        return self._cache.metrics
+
+    @property
+    def height(self) -> int:
+        return self._cache.height
 
     @property
-    def metrics(self):
-        return self._metrics
+    def line_spacing(self) -> int:
+        return self._cache.line_spacing
+
+    def horizontal_advance(self, char: str) -> int:
+        advances = self._cache.advances
+        advance = advances.get(char)
+        if advance is None:
+            FontEngine.misses += 1
+            advance = advances[char] = self._cache.metrics.horizontalAdvance(char)
+        else:
+            FontEngine.hits += 1
+        return advance
+
+    def bearings(self, char: str) -> Tuple[int, int]:
+        bearings = self._cache.bearings
+        char_bearings = bearings.get(char)
+        if char_bearings is None:
+            FontEngine.misses += 1
+            metrics = self._cache.metrics
+            char_bearings = bearings[char] = (
+                metrics.leftBearing(char),
+                metrics.rightBearing(char),
+            )
+        else:
+            FontEngine.hits += 1
+        return char_bearings
 
     def real_horizontal_advance(self, char: str, min_zero: bool = False) -> float:
-        margin_left: int = self.metrics.leftBearing(char)
-        margin_right: int = self.metrics.rightBearing(char)
+        margin_left, margin_right = self.bearings(char)
 
         if min_zero:
             bearing_left: int = 0 if margin_left < 0 else margin_left
             bearing_right: int = 0 if margin_right < 0 else margin_right
-            return self.metrics.horizontalAdvance(char) + bearing_left + bearing_right
+            return self.horizontal_advance(char) + bearing_left + bearing_right
 
-        return self.metrics.horizontalAdvance(char) + margin_left + margin_right
+        return self.horizontal_advance(char) + margin_left + margin_right
 
 
 __all__ = ["FontEngine", "TextEngine"]
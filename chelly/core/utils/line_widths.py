@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, List
+
+from qtpy.QtGui import QFontMetricsF
+
+from .helpers import DelayJobRunner
+
+if TYPE_CHECKING:
+    from ...api import ChellyEditor
+
+
+class LineWidths:
+    """
+    Pixel widths of the lines of an editor, measured when first asked and
+    again only after their text changed. The lines are grouped in buckets of
+    a fixed number of lines and a max segment tree over the buckets answers
+    the widest line of any range in O(log n). Adding or removing lines only
+    aggregates again the buckets after them, with C loops.
+
+    The horizontal scroll bar of the editor is ranged to the widest line
+    measured so far. The visible lines are measured when the range changes
+    and the rest of the document in chunks while the editor is idle, the
+    range grows to the widest line of the whole document.
+    """
+
+    #: lines of a bucket, the leaves of the tree
+    BUCKET_LINES = 256
+    #: cached text widths, cleared when full
+    MAX_CACHED_TEXTS = 4096
+    #: lines measured by an idle job
+    CHUNK_LINES = 2048
+    #: milliseconds without edits before an idle job
+    IDLE_DELAY = 50
+
+    def __init__(self, editor: ChellyEditor):
+        self._editor = editor
+        self._document = None
+        self._metrics_key = None
+        self._metrics = None
+        self._tab_stop = 0.0
+        self._widths: List[float] = []
+        # 1 for the lines whose width is up to date
+        self._measured = bytearray()
+        # the leaf of a bucket is at capacity + bucket
+        self._capacity = 1
+        self._tree: List[float] = [0.0, 0.0]
+        self._text_widths: Dict[str, float] = {}
+        #: lines measured, for tests and profiling
+        self.measures = 0
+
+        self._job_runner = DelayJobRunner(self.IDLE_DELAY)
+        editor.destroyed.connect(self._job_runner.cancel_requests)
+        editor.horizontalScrollBar().rangeChanged.connect(self._adjust_scroll_bar)
+        self._attach(editor.document())
+
+    def _attach(self, document) -> None:
+        if self._document is not None:
+            try:
+                self._document.contentsChange.disconnect(self._on_contents_change)
+            except (RuntimeError, TypeError):
+                ...
+
+        self._document = document
+        document.contentsChange.connect(self._on_contents_change)
+        self.invalidate()
+
+    def _check(self) -> None:
+        """Follows a new document, a new font or a new tab stop"""
+        editor = self._editor
+        if editor.document() is not self._document:
+            self._attach(editor.document())
+
+        key = (editor.font().key(), editor.tabStopDistance())
+        if key != self._metrics_key:
+            self._metrics_key = key
+            self._metrics = QFontMetricsF(editor.font())
+            self._tab_stop = editor.tabStopDistance()
+            self._text_widths.clear()
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        """Measures every line again"""
+        line_count = self._document.blockCount()
+        self._widths = [0.0] * line_count
+        self._measured = bytearray(line_count)
+        self._capacity = 1
+        self._tree = [0.0, 0.0]
+        self._refresh(0, line_count)
+        self._job_runner.request_job(self._measure_idle)
+
+    def _on_contents_change(self, position: int, removed: int, added: int) -> None:
+        document = self._document
+        first = document.findBlock(position).blockNumber()
+        last = document.findBlock(position + added).blockNumber()
+        if first < 0:
+            return self.invalidate()
+        if last < 0:
+            # changed up to the end of the document
+            last = document.blockCount() - 1
+
+        # the lines after the first one are added or removed, the following
+        # ones keep their width
+        old_count = len(self._widths)
+        delta = document.blockCount() - old_count
+        if delta > 0:
+            self._widths[first + 1 : first + 1] = [0.0] * delta
+            self._measured[first + 1 : first + 1] = bytes(delta)
+        elif delta < 0:
+            del self._widths[first + 1 : first + 1 - delta]
+            del self._measured[first + 1 : first + 1 - delta]
+
+        last = min(last, len(self._widths) - 1)
+        self._widths[first : last + 1] = [0.0] * (last + 1 - first)
+        self._measured[first : last + 1] = bytes(last + 1 - first)
+        if delta:
+            self._refresh(first, max(old_count, len(self._widths)))
+        else:
+            self._refresh(first, last + 1)
+        self._job_runner.request_job(self._measure_idle)
+
+    def _refresh(self, start: int, end: int) -> None:
+        """Updates the buckets of the lines from start to end, excluded"""
+        bucket_lines = self.BUCKET_LINES
+        bucket_count = -(-len(self._widths) // bucket_lines)
+        if bucket_count > self._capacity:
+            while self._capacity < bucket_count:
+                self._capacity *= 2
+            self._tree = [0.0] * (2 * self._capacity)
+            start, end = 0, len(self._widths)
+
+        tree = self._tree
+        capacity = self._capacity
+        widths = self._widths
+        first = start // bucket_lines
+        last = min(max(-(-end // bucket_lines), first), capacity)
+        # the buckets past the last line are emptied
+        tree[capacity + first : capacity + last] = [
+            max(widths[bucket * bucket_lines : (bucket + 1) * bucket_lines], default=0.0)
+            for bucket in range(first, last)
+        ]
+
+        low, high = capacity + first, capacity + last
+        while low > 1:
+            low, high = low // 2, (high + 1) // 2
+            tree[low:high] = map(
+                max, tree[2 * low : 2 * high : 2], tree[2 * low + 1 : 2 * high : 2]
+            )
+
+    def _measure(self, text: str) -> float:
+        width = self._text_widths.get(text)
+        if width is not None:
+            return width
+
+        metrics = self._metrics
+        if "\t" in text:
+            # the tabs move to the next tab stop, as in the text layouts
+            tab_stop = self._tab_stop or metrics.horizontalAdvance(" ") * 8
+            width = 0.0
+            for index, part in enumerate(text.split("\t")):
+                if index:
+                    width = (width // tab_stop + 1) * tab_stop
+                width += metrics.horizontalAdvance(part)
+        else:
+            width = metrics.horizontalAdvance(text)
+
+        if len(self._text_widths) >= self.MAX_CACHED_TEXTS:
+            self._text_widths.clear()
+        self._text_widths[text] = width
+        return width
+
+    def _measure_lines(self, first: int, last: int) -> None:
+        """Measures the lines of the range not measured yet"""
+        measured = self._measured
+        widths = self._widths
+        line = measured.find(0, first, last + 1)
+        while line >= 0:
+            start = line
+            block = self._document.findBlockByNumber(line)
+            while block.isValid() and line <= last and not measured[line]:
+                widths[line] = self._measure(block.text())
+                measured[line] = 1
+                block = block.next()
+                line += 1
+            self.measures += line - start
+            self._refresh(start, line)
+            line = measured.find(0, line, last + 1)
+
+    @property
+    def pending(self) -> bool:
+        """True while lines are not measured"""
+        return self._measured.find(0) >= 0
+
+    def _measure_idle(self) -> None:
+        """Measures a chunk of lines, until the whole document is measured"""
+        self._check()
+        line = self._measured.find(0)
+        if line >= 0:
+            self._measure_lines(line, line + self.CHUNK_LINES - 1)
+            if self.pending:
+                self._job_runner.request_job(self._measure_idle)
+        self._set_scroll_bar_range()
+
+    def width(self, line: int) -> float:
+        """The width of a line, in pixels"""
+        return self.max_width(line, line)
+
+    def max_width(self, first: int = 0, last: int = None) -> float:
+        """The width of the widest line from first to last, included"""
+        self._check()
+        line_count = len(self._widths)
+        if last is None or last >= line_count:
+            last = line_count - 1
+        first = max(first, 0)
+        if last < first:
+            return 0.0
+
+        self._measure_lines(first, last)
+        widths = self._widths
+        bucket_lines = self.BUCKET_LINES
+        low = first // bucket_lines + 1
+        high = last // bucket_lines
+        if low > high:
+            return max(widths[first : last + 1])
+
+        # the ends of the range are partial buckets
+        width = max(
+            max(widths[first : low * bucket_lines]),
+            max(widths[high * bucket_lines : last + 1]),
+        )
+        tree = self._tree
+        low += self._capacity
+        high += self._capacity
+        while low < high:
+            if low & 1:
+                width = max(width, tree[low])
+                low += 1
+            if high & 1:
+                high -= 1
+                width = max(width, tree[high])
+            low //= 2
+            high //= 2
+        return width
+
+    def _adjust_scroll_bar(self, *args) -> None:
+        editor = self._editor
+        if editor.lineWrapMode() != editor.NoWrap:
+            return None
+
+        # the visible lines are measured, the others when the editor is idle
+        first = editor.firstVisibleBlock().blockNumber()
+        line_count = editor.viewport().height() // max(editor.fontMetrics().height(), 1)
+        self.max_width(first, first + line_count + 1)
+        self._set_scroll_bar_range()
+
+    def _set_scroll_bar_range(self) -> None:
+        editor = self._editor
+        if editor.lineWrapMode() != editor.NoWrap:
+            return None
+
+        # the root of the tree is the widest line measured, the blocks are as
+        # wide as their lines and the document margins
+        width = self._tree[1] + 2 * self._document.documentMargin()
+        scroll_bar = editor.horizontalScrollBar()
+        maximum = max(0, int(width - editor.viewport().width()))
+        if maximum != scroll_bar.maximum():
+            scroll_bar.setRange(0, maximum)
+
+
+__all__ = ["LineWidths"]
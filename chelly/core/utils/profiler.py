@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import inspect
+import json
+import threading
+import warnings
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, List, Tuple
+
+if TYPE_CHECKING:
+    from ...api import ChellyEditor
+
+
+class _Handler:
+    """A signal handler of a feature or a panel, replaced by a timed call"""
+
+    __slots__ = ("signal", "function", "name", "arguments", "timed")
+
+    def __init__(self, signal: str, function: Callable, name: str):
+        self.signal = signal
+        self.function = function
+        self.name = name
+        self.arguments = self._arguments(function)
+        self.timed = None
+
+    @staticmethod
+    def _arguments(function: Callable):
+        """Number of signal arguments the handler takes, None for all of them"""
+        try:
+            parameters = inspect.signature(function).parameters.values()
+        except (TypeError, ValueError):
+            return None
+
+        count = 0
+        for parameter in parameters:
+            if parameter.kind == parameter.VAR_POSITIONAL:
+                return None
+            if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD):
+                count += 1
+        return count
+
+
+class FrameProfiler:
+    """
+    Times the paint, key press and cursor handlers of the features and the
+    panels of an editor, the overlay layers and the frames they run in.
+
+    Disabled, the handlers are connected as usual and nothing is timed. When
+    enabled, the handlers are reconnected through a timed call keeping the
+    order of their owners in the managers.
+    """
+
+    #: editor signals whose handlers are timed
+    SIGNALS = ("on_painted", "on_key_pressed", "cursorPositionChanged")
+    #: durations kept per handler for the percentiles
+    WINDOW = 1000
+    #: trace events kept for the export
+    MAX_EVENTS = 100000
+
+    def __init__(self, editor: ChellyEditor):
+        self._editor = editor
+        self._enabled = False
+        self._handlers: List[_Handler] = []
+        # handler name -> (category, durations)
+        self._durations: Dict[str, Tuple[str, Deque[float]]] = {}
+        self._counts: Dict[str, int] = {}
+        self._totals: Dict[str, float] = {}
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=self.MAX_EVENTS)
+        self._origin = perf_counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        value = bool(value)
+        if value == self._enabled:
+            return None
+
+        self._enabled = value
+        if value:
+            for owner in self._owners():
+                self.attach(owner)
+        else:
+            self._detach()
+
+    def _owners(self) -> list:
+        editor = self._editor
+        return list(editor.features.as_list) + list(editor.panels.as_list)
+
+    def attach(self, owner: object) -> None:
+        """Times the handlers of a feature or a panel, if the profiler is enabled"""
+        if not self._enabled:
+            return None
+
+        for signal_name in self.SIGNALS:
+            signal = getattr(self._editor, signal_name)
+            for function in self._methods(owner):
+                while self._disconnect(signal, function):
+                    handler = _Handler(
+                        signal_name,
+                        function,
+                        f"{type(owner).__name__}.{function.__name__}",
+                    )
+                    signal.connect(self._timed(handler))
+                    self._handlers.append(handler)
+
+    @staticmethod
+    def _methods(owner: object) -> Iterable[Callable]:
+        """The python methods of the owner, without evaluating its properties"""
+        seen = set()
+        for cls in type(owner).__mro__:
+            for name, value in vars(cls).items():
+                if name in seen or not inspect.isfunction(value):
+                    continue
+                seen.add(name)
+                yield getattr(owner, name)
+
+    @staticmethod
+    def _disconnect(signal, function: Callable) -> bool:
+        # disconnecting is the only way to know if a slot is connected
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            try:
+                return signal.disconnect(function) is not False
+            except (RuntimeError, TypeError):
+                return False
+
+    def _timed(self, handler: _Handler) -> Callable:
+        function = handler.function
+        arguments = handler.arguments
+        name = handler.name
+        category = handler.signal
+
+        def timed(*args):
+            start = perf_counter()
+            try:
+                return function(*args[:arguments])
+            finally:
+                self.record(name, category, start, perf_counter() - start)
+
+        handler.timed = timed
+        return timed
+
+    def _detach(self) -> None:
+        for handler in self._handlers:
+            signal = getattr(self._editor, handler.signal)
+            self._disconnect(signal, handler.timed)
+            signal.connect(handler.function)
+        self._handlers = []
+
+    @contextmanager
+    def span(self, name: str, category: str):
+        """Times the block as a span of the trace"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, perf_counter() - start)
+
+    def record(self, name: str, category: str, start: float, duration: float) -> None:
+        """Adds a duration, ``start`` is a :func:`time.perf_counter` value"""
+        entry = self._durations.get(name)
+        if entry is None:
+            entry = self._durations[name] = (category, deque(maxlen=self.WINDOW))
+            self._counts[name] = 0
+            self._totals[name] = 0.0
+        entry[1].append(duration)
+        self._counts[name] += 1
+        self._totals[name] += duration
+
+        self._events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": duration * 1e6,
+                "pid": 0,
+                "tid": threading.get_ident(),
+            }
+        )
+
+    @staticmethod
+    def _percentile(durations: List[float], percent: float) -> float:
+        index = min(len(durations) - 1, int(round(percent / 100 * (len(durations) - 1))))
+        return durations[index]
+
+    def statistics(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the count, the total and the rolling p50/p95/p99/max in
+        seconds of each handler, the most expensive handlers first.
+        """
+        statistics = {}
+        for name, (category, durations) in self._durations.items():
+            durations = sorted(durations)
+            statistics[name] = {
+                "category": category,
+                "count": self._counts[name],
+                "total": self._totals[name],
+                "p50": self._percentile(durations, 50),
+                "p95": self._percentile(durations, 95),
+                "p99": self._percentile(durations, 99),
+                "max": durations[-1],
+            }
+        return dict(
+            sorted(statistics.items(), key=lambda item: item[1]["total"], reverse=True)
+        )
+
+    def report(self) -> str:
+        """Returns the statistics as a table, durations in milliseconds"""
+        lines = [
+            f"{'handler':<48} {'category':<22} {'count':>7} {'total':>9} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+        ]
+        for name, entry in self.statistics().items():
+            lines.append(
+                f"{name:<48} {entry['category']:<22} {entry['count']:>7} "
+                f"{entry['total'] * 1e3:>9.3f} {entry['p50'] * 1e3:>8.3f} "
+                f"{entry['p95'] * 1e3:>8.3f} {entry['p99'] * 1e3:>8.3f} "
+                f"{entry['max'] * 1e3:>8.3f}"
+            )
+        return "\n".join(lines)
+
+    def trace_events(self) -> List[Dict[str, Any]]:
+        return list(self._events)
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Writes the recorded spans as a Chrome trace-event file (chrome://tracing)"""
+        with open(path, "w", encoding="utf-8") as trace_file:
+            json.dump(
+                {"traceEvents": self.trace_events(), "displayTimeUnit": "ms"},
+                trace_file,
+            )
+
+    def reset(self) -> None:
+        self._durations.clear()
+        self._counts.clear()
+        self._totals.clear()
+        self._events.clear()
+        self._origin = perf_counter()
+
+
+__all__ = ["FrameProfiler"]
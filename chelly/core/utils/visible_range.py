@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Iterable, List, Tuple
+
+from qtpy.QtGui import QTextBlock
+
+if TYPE_CHECKING:
+    from ...api import ChellyEditor
+
+#: (top, block number, block)
+VisibleBlock = Tuple[int, int, QTextBlock]
+
+
+class VisibleBlocks(tuple):
+    """
+    Immutable snapshot of the (top, block number, block) entries shown by the
+    editor. The version changes with the content, so panels and features can
+    cache their work against it.
+    """
+
+    def __new__(cls, blocks: Iterable[VisibleBlock] = (), version: int = 0):
+        snapshot = super().__new__(cls, blocks)
+        snapshot._version = version
+        return snapshot
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def first(self) -> int:
+        return self[0][1] if self else -1
+
+    @property
+    def last(self) -> int:
+        return self[-1][1] if self else -1
+
+    def __setattr__(self, name, value):
+        if name != "_version" or hasattr(self, "_version"):
+            raise AttributeError(f"{type(self).__name__} is immutable")
+        super().__setattr__(name, value)
+
+
+class VisibleRange:
+    """
+    Keeps the visible blocks of an editor. The blocks are walked again only
+    after the scroll offset, the viewport size or the document layout
+    changed, small scrolls reuse the geometry of the blocks still shown.
+    """
+
+    def __init__(self, editor: ChellyEditor):
+        self._editor = editor
+        self._document = None
+        self._version = 0
+        self._snapshot = VisibleBlocks()
+        # every walked block: (top, bottom, block number, block)
+        self._entries: List[Tuple[int, int, int, QTextBlock]] = []
+        self._dirty = True
+        self._scrolled = False
+        #: walks of the block list, for tests and profiling
+        self.walks = 0
+
+        editor.verticalScrollBar().valueChanged.connect(self.scroll)
+        editor.updateRequest.connect(self._on_update_request)
+        self._attach(editor.document())
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def snapshot(self) -> VisibleBlocks:
+        """Returns the visible blocks, updated only when something changed"""
+        if self._editor.document() is not self._document:
+            self._attach(self._editor.document())
+
+        if self._dirty:
+            self._rebuild()
+        elif self._scrolled:
+            self._shift()
+        return self._snapshot
+
+    def invalidate(self, *args) -> None:
+        self._dirty = True
+
+    def scroll(self, *args) -> None:
+        self._scrolled = True
+
+    def _on_update_request(self, rect, dy: int) -> None:
+        if dy:
+            self._scrolled = True
+
+    def _attach(self, document) -> None:
+        if self._document is not None:
+            try:
+                self._document.documentLayout().update.disconnect(self.invalidate)
+                self._document.documentLayout().documentSizeChanged.disconnect(
+                    self.invalidate
+                )
+            except (RuntimeError, TypeError):
+                ...
+
+        self._document = document
+        document.documentLayout().update.connect(self.invalidate)
+        document.documentLayout().documentSizeChanged.connect(self.invalidate)
+        self._dirty = True
+
+    def _rebuild(self) -> None:
+        editor = self._editor
+        block = editor.firstVisibleBlock()
+        top = int(editor.blockBoundingGeometry(block).translated(editor.contentOffset()).top())
+
+        self._entries = []
+        self._extend(block, top)
+        self._publish()
+
+    def _shift(self) -> None:
+        editor = self._editor
+        first = editor.firstVisibleBlock()
+        first_number = first.blockNumber()
+        entries = self._entries
+
+        numbers = [entry[2] for entry in entries]
+        index = bisect_left(numbers, first_number)
+        if index >= len(entries) or numbers[index] != first_number:
+            if not entries or first_number > entries[0][2]:
+                return self._rebuild()
+
+            # scrolled up, walk back to the previously first block
+            added = []
+            block = first
+            while block.isValid() and block.blockNumber() < entries[0][2]:
+                if len(added) > len(entries):
+                    return self._rebuild()
+                added.append(block)
+                block = block.next()
+            if block.blockNumber() != entries[0][2]:
+                return self._rebuild()
+
+            top = int(editor.blockBoundingGeometry(first).translated(editor.contentOffset()).top())
+            new_entries = []
+            for block in added:
+                bottom = top + int(editor.blockBoundingRect(block).height())
+                new_entries.append((top, bottom, block.blockNumber(), block))
+                top = bottom
+            delta = top - entries[0][0]
+            entries = new_entries + [
+                (entry_top + delta, bottom + delta, number, block)
+                for entry_top, bottom, number, block in entries
+            ]
+        else:
+            top = int(editor.blockBoundingGeometry(first).translated(editor.contentOffset()).top())
+            delta = top - entries[index][0]
+            entries = [
+                (entry_top + delta, bottom + delta, number, block)
+                for entry_top, bottom, number, block in entries[index:]
+            ]
+
+        height = editor.height()
+        last = 0
+        while last < len(entries) and (last == 0 or entries[last][1] <= height):
+            last += 1
+        self._entries = entries[:last]
+
+        if last == len(entries):
+            last_top, last_bottom, _, last_block = entries[-1]
+            if last_bottom <= height:
+                self._extend(last_block.next(), last_bottom, first_block=False)
+
+        self._publish()
+
+    def _extend(self, block: QTextBlock, top: int, first_block: bool = True) -> None:
+        """Walks the blocks from ``block`` until one is out of the viewport"""
+        editor = self._editor
+        height = editor.height()
+        entries = self._entries
+        self.walks += 1
+
+        while block.isValid():
+            bottom = top + int(editor.blockBoundingRect(block).height())
+            visible = top >= 0 and bottom <= height
+            if not visible and not first_block:
+                break
+            first_block = False
+
+            entries.append((top, bottom, block.blockNumber(), block))
+            block = block.next()
+            top = bottom
+
+    def _publish(self) -> None:
+        self._dirty = False
+        self._scrolled = False
+
+        blocks = tuple(
+            (top, number, block)
+            for top, bottom, number, block in self._entries
+            if top >= 0 and bottom <= self._editor.height() and block.isVisible()
+        )
+        if blocks != tuple(self._snapshot):
+            self._version += 1
+            self._snapshot = VisibleBlocks(blocks, self._version)
+
+
+__all__ = ["VisibleBlock", "VisibleBlocks", "VisibleRange"]
@@ -16,7 +16,7 @@ class CursorScroller(Feature):
     def update_scroll(self, state: bool) -> None:
         self.editor.setCenterOnScroll(state)
         minimap = self.editor.panels.get("MiniMap")
-        if minimap is not None:
+        if minimap is not None and minimap.chelly_editor is not None:
             minimap.chelly_editor.setCenterOnScroll(state)
 
     def restore(self, *args, **kwargs):
@@ -1,31 +1,35 @@
-from ..core import Feature, TextEngine
+from ..core import Feature, OverlayLayer, TextEngine
 from ..internal import chelly_property, ChellyFollowedValue
 from qtpy.QtGui import QImage, QPainter
-from qtpy.QtCore import QPoint, QSize
+from qtpy.QtCore import QPoint, QRect, QSize
 from typing import Any, Optional
 from typing_extensions import Self
 
 
-class ImageDrawer(Feature):
+class ImageDrawer(Feature, OverlayLayer):
+    OVERLAY_Z = 0
+
     def __init__(self, editor):
         super().__init__(editor)
         self.__qimage_to_paint = None
-        self.editor.on_painted.connect(self.paint)
+        self.__scaled_qimage = None
+        self.editor.overlays.add(self)
 
-    def paint(self, paint_event):
+    def overlay_rect(self, geometry):
         if not isinstance(self.__qimage_to_paint, QImage):
-            return None
+            return QRect()
+        return None
+
+    def paint_overlay(self, painter, geometry):
+        x_offset = geometry.content_offset.x()
+        viewport_size = geometry.viewport_rect.size()
+        size = QSize(int(viewport_size.width() - x_offset), viewport_size.height())
 
-        with QPainter(self.editor.viewport()) as painter:
-            x_offset = self.editor.contentOffset().x()
-            viewport_size = self.editor.viewport().size()
-            drawable_x = viewport_size.width() - x_offset
-            drawable_y = viewport_size.height()
+        # the image is scaled again only when the viewport changed
+        if self.__scaled_qimage is None or self.__scaled_qimage[0] != size:
+            self.__scaled_qimage = (size, self.__qimage_to_paint.scaled(size))
 
-            painter.drawImage(
-                QPoint(0, 0),
-                self.__qimage_to_paint.scaled(QSize(drawable_x, drawable_y)),
-            )
+        painter.drawImage(QPoint(0, 0), self.__scaled_qimage[1])
 
     @chelly_property
     def draw(self) -> Optional[QImage]:
@@ -34,10 +38,12 @@ class ImageDrawer(Feature):
     @draw.setter
     def draw(self, qimage: Optional[QImage]):
         self.__qimage_to_paint = qimage
+        self.__scaled_qimage = None
 
     @draw.deleter
     def draw(self):
         self.__qimage_to_paint = None
+        self.__scaled_qimage = None
 
     @draw.follower
     def draw(self, origin: Self, value: Any):
@@ -1,12 +1,15 @@
 from typing import Any, Union
 
-from ..core import TextEngine, Feature, FontEngine, Character, ChellyCache
+from ..core import TextEngine, Feature, FontEngine, Character, OverlayLayer
 from ..internal import chelly_property
-from qtpy.QtGui import QPen, QColor, QPaintEvent, QPainter
+from qtpy.QtCore import QRect
+from qtpy.QtGui import QPen, QColor, QPainter
 from dataclasses import dataclass
 
 
-class EdgeLine(Feature):
+class EdgeLine(Feature, OverlayLayer):
+    OVERLAY_Z = 30
+
     @dataclass(frozen=True)
     class Defaults:
         LINE_COVER_VIEW_SIZE = 2**16
@@ -59,37 +62,37 @@ class EdgeLine(Feature):
     def __init__(self, editor):
         super().__init__(editor)
         self.__properties = EdgeLine.Properties(self)
-        self.__cached_cursor_position = ChellyCache(
-            None, None, lambda: TextEngine(self.editor).cursor_position
-        )
 
-        self.editor.on_painted.connect(self._paint_margin)
+        self.editor.overlays.add(self)
         self.editor.repaint()
 
-    def _paint_margin(self, event: QPaintEvent) -> None:
-        if not self.__cached_cursor_position.changed:
-            return None
-
-        offset = (
-            self.editor.contentOffset().x() + self.editor.document().documentMargin()
-        )
+    def _line_x(self, geometry) -> int:
+        offset = geometry.content_offset.x() + geometry.document_margin
         line_x_point = (
             FontEngine(self.editor.font()).real_horizontal_advance(
                 Character.LARGEST.value, min_zero=True
             )
             * self.properties.position
         )
-        line_x_point += offset
-        int_line_x_point = int(line_x_point)
-
-        with QPainter(self.editor.viewport()) as painter:
-            painter.setPen(self.properties.pen)
-            painter.drawLine(
-                int_line_x_point,
-                0,
-                int_line_x_point,
-                EdgeLine.Defaults.LINE_COVER_VIEW_SIZE,
-            )
+        return int(line_x_point + offset)
+
+    def overlay_rect(self, geometry) -> QRect:
+        pen_width = max(1, int(self.properties.pen.widthF()))
+        return QRect(
+            self._line_x(geometry) - pen_width,
+            0,
+            pen_width * 2 + 1,
+            geometry.viewport_rect.height(),
+        )
 
+    def paint_overlay(self, painter: QPainter, geometry) -> None:
+        int_line_x_point = self._line_x(geometry)
+        painter.setPen(self.properties.pen)
+        painter.drawLine(
+            int_line_x_point,
+            0,
+            int_line_x_point,
+            EdgeLine.Defaults.LINE_COVER_VIEW_SIZE,
+        )
 
 __all__ = ["EdgeLine"]
@@ -1,17 +1,18 @@
 from textwrap import indent
 from typing_extensions import Self
-from qtpy.QtGui import QPainter, QColor, QFontMetrics, QPen, QPaintEvent
-from qtpy.QtCore import Qt
-from ..core import Feature, TextEngine, Character
+from qtpy.QtGui import QPainter, QColor, QFontMetrics, QFontMetricsF, QPen, QPaintEvent
+from qtpy.QtCore import Qt, QLineF
+from ..core import Feature, OverlayLayer, TextEngine, Character
 from ..internal import chelly_property
-from typing import List, Any
+from typing import Dict, List, Any, Tuple
 from dataclasses import dataclass
 import re
 
 
-class IndentationGuides(Feature):
+class IndentationGuides(Feature, OverlayLayer):
     SPACES_PATTERN = re.compile(r"\A[^\S\n\t]+")
     TABS_PATTERN = re.compile(r"\A[\t]+")
+    OVERLAY_Z = 20
 
     class Guide:
         def __init__(self, line):
@@ -99,7 +100,26 @@ class IndentationGuides(Feature):
     def __init__(self, editor):
         super().__init__(editor)
         self.__properties = IndentationGuides.Properties(self)
-        self.editor.on_painted.connect(self._paint_lines)
+        # block number -> (indentation length, x offset of each guide)
+        self._indentation_cache: Dict[int, Tuple[int, Tuple[float, ...]]] = {}
+        self._indentation_cache_key = None
+        self._document = None
+        self._cached_block_count = -1
+
+        self._attach(self.editor.document())
+        self.editor.overlays.add(self)
+
+    def _attach(self, document) -> None:
+        if self._document is not None:
+            try:
+                self._document.contentsChange.disconnect(self._on_contents_change)
+            except (RuntimeError, TypeError):
+                ...
+
+        self._document = document
+        document.contentsChange.connect(self._on_contents_change)
+        self._cached_block_count = document.blockCount()
+        self._indentation_cache.clear()
 
     def __configure_painter(self, painter: QPainter) -> None:
         pen = self.properties.pen
@@ -156,44 +176,111 @@ class IndentationGuides(Feature):
     def indentation_guides_for_tabs(self) -> List[Guide]:
         return self.get_indentation_cords(Character.TAB)
 
-    def _paint_lines(self, event: QPaintEvent) -> None:
-        with QPainter(self.editor.viewport()) as painter:
-            font_metrics = QFontMetrics(self.editor.font())
-            self.font_width = self.editor.properties.tab_stop_distance
-            self.font_height = font_metrics.height()
-
-            self.__configure_painter(painter)
-            pen = painter.pen()
-            normal_pen = painter.pen()
-
-            if self.editor.properties.indent_with_tabs:
-                for guide in self.indentation_guides_for_tabs:
-                    for level in range(guide.max_level):
-                        if guide.active_level == level:
-                            pen.setColor(Qt.GlobalColor.darkBlue)
-                            painter.setPen(pen)
-                        else:
-                            painter.setPen(normal_pen)
-
-                        rect = TextEngine(self.editor).cursor_rect(
-                            guide.line, level, offset=0
-                        )
-                        painter.drawLine(rect.topLeft(), rect.bottomLeft())
-
+    def _on_contents_change(self, position: int, removed: int, added: int) -> None:
+        document = self._document
+        block_count = document.blockCount()
+        if block_count != self._cached_block_count:
+            # the following blocks moved
+            self._cached_block_count = block_count
+            self._indentation_cache.clear()
+            return None
+
+        first = document.findBlock(position).blockNumber()
+        last = document.findBlock(position + added).blockNumber()
+        for block_number in range(first, last + 1):
+            self._indentation_cache.pop(block_number, None)
+
+    def _block_indentation(
+        self, block, font_metrics: QFontMetrics
+    ) -> Tuple[int, Tuple[float, ...]]:
+        """Returns the indentation length of a block and the x offsets of its guides"""
+        block_number = block.blockNumber()
+        indentation = self._indentation_cache.get(block_number)
+        if indentation is not None:
+            return indentation
+
+        properties = self.editor.properties
+        text = block.text()
+        if properties.indent_with_tabs:
+            match = self.TABS_PATTERN.match(text)
+            length = match.end() if match else 0
+            advance = properties.tab_stop_distance
+            offsets = tuple(level * advance for level in range(length))
+        else:
+            match = self.SPACES_PATTERN.match(text)
+            length = match.end() if match else 0
+            indent_size = properties.indent_size
+            if length % indent_size:
+                offsets = ()
             else:
-                for guide in self.indentation_guides_for_spaces:
-                    for level in range(guide.max_level):
-                        if guide.active_level == level:
-                            pen.setColor(Qt.GlobalColor.darkBlue)
-                            painter.setPen(pen)
-                        else:
-                            painter.setPen(normal_pen)
-
-                        spaces_level = level * self.editor.properties.indent_size
-                        rect = TextEngine(self.editor).cursor_rect(
-                            guide.line, spaces_level, offset=0
-                        )
-                        painter.drawLine(rect.topLeft(), rect.bottomLeft())
+                advance = (
+                    QFontMetricsF(self.editor.font()).horizontalAdvance(Character.SPACE.value)
+                    * indent_size
+                )
+                offsets = tuple(level * advance for level in range(length // indent_size))
+
+        indentation = (length, offsets)
+        self._indentation_cache[block_number] = indentation
+        return indentation
+
+    def indentation_lines(self, geometry) -> Tuple[List[QLineF], List[QLineF]]:
+        """Returns the guide lines of the visible blocks, and the ones of the active level"""
+        font_metrics = geometry.font_metrics
+        origin_x = geometry.content_offset.x() + geometry.document_margin
+        line_height = font_metrics.height()
+        current_line = self.editor.textCursor().blockNumber()
+        if self.editor.document() is not self._document:
+            self._attach(self.editor.document())
+
+        properties = self.editor.properties
+        key = (
+            self.editor.font().key(),
+            properties.indent_with_tabs,
+            properties.indent_size,
+            properties.tab_stop_distance,
+        )
+        if key != self._indentation_cache_key:
+            # font or indentation settings changed
+            self._indentation_cache_key = key
+            self._indentation_cache.clear()
+
+        lines, active_lines = [], []
+        active_level = None
 
+        for top, line_num, block in geometry.visible_blocks:
+            length, offsets = self._block_indentation(block, font_metrics)
+            if not offsets:
+                continue
+
+            if active_level is None and current_line == line_num:
+                active_level = length - 1
+
+            bottom = top + line_height - 1
+            for level, offset in enumerate(offsets):
+                x = int(origin_x + offset + 0.5)
+                line = QLineF(x, top, x, bottom)
+                if level == active_level:
+                    active_lines.append(line)
+                else:
+                    lines.append(line)
+
+        return lines, active_lines
+
+    def paint_overlay(self, painter: QPainter, geometry) -> None:
+        self.font_width = self.editor.properties.tab_stop_distance
+        self.font_height = geometry.font_metrics.height()
+
+        self.__configure_painter(painter)
+        normal_pen = painter.pen()
+        active_pen = QPen(normal_pen)
+        active_pen.setColor(Qt.GlobalColor.darkBlue)
+
+        lines, active_lines = self.indentation_lines(geometry)
+        # one call per pen
+        if lines:
+            painter.drawLines(lines)
+        if active_lines:
+            painter.setPen(active_pen)
+            painter.drawLines(active_lines)
 
 __all__ = ["IndentationGuides"]
@@ -1,27 +1,28 @@
-from textwrap import indent
 from qtpy.QtGui import (
     QPainter,
     QColor,
-    QFontMetrics,
-    QPen,
-    QPaintEvent,
     QBrush,
-    QTextCursor,
 )
-from qtpy.QtCore import Qt, QRect
-from ..core import Feature, TextEngine, Character
-from typing import List
-from dataclasses import dataclass
+from qtpy.QtCore import Qt, QLine, QRect
+from ..core import Feature, OverlayLayer, TextEngine, Character
+from typing import Dict, List, Tuple
 import re
 
 
-class IndentationMarks(Feature):
+class IndentationMarks(Feature, OverlayLayer):
     SPACES_PATTERN = re.compile(r"\A[^\S\n\t]+")
     TABS_PATTERN = re.compile(r"\A[\t]+")
+    OVERLAY_Z = 10
+
+    #: cached whitespace masks, cleared when full
+    MAX_CACHED_LINES = 4096
 
     def __init__(self, editor):
         super().__init__(editor)
-        self.editor.on_painted.connect(self._paint_indentation)
+        # line text -> (is space, left x, right x, layout line) of each mark
+        self._whitespace_cache: Dict[str, Tuple[Tuple[bool, float, float, int], ...]] = {}
+        self._whitespace_cache_key = None
+        self.editor.overlays.add(self)
 
     def _choose_visible_whitespace(self, text: str) -> list:
         result = [False for _ in range(len(text))]
@@ -37,47 +38,112 @@ class IndentationMarks(Feature):
 
         return result
 
-    def _paint_indentation(self, event: QPaintEvent):
+    def _block_whitespaces(self, block) -> Tuple[Tuple[bool, float, float, int], ...]:
+        """Returns the marks of the visible whitespaces of a laid out block"""
+        text = block.text()
+        marks = self._whitespace_cache.get(text)
+        if marks is not None:
+            return marks
+
+        layout = block.layout()
+        marks = []
+        for column, draw in enumerate(self._choose_visible_whitespace(text)):
+            if not draw:
+                continue
+            line = layout.lineForTextPosition(column)
+            if not line.isValid() or column + 1 > line.textStart() + line.textLength():
+                # wrapped, the right side is on the next visual line
+                continue
+            marks.append(
+                (
+                    text[column] == Character.SPACE.value,
+                    self._cursor_x(line, column),
+                    self._cursor_x(line, column + 1),
+                    line.lineNumber(),
+                )
+            )
+
+        if len(self._whitespace_cache) >= self.MAX_CACHED_LINES:
+            self._whitespace_cache.clear()
+        marks = tuple(marks)
+        self._whitespace_cache[text] = marks
+        return marks
+
+    @staticmethod
+    def _cursor_x(line, column: int) -> float:
+        x = line.cursorToX(column)
+        # PySide returns the x and the moved position
+        return x[0] if isinstance(x, tuple) else x
+
+    def _marked_blocks(self, geometry) -> list:
+        """The visible blocks whose whitespaces are painted"""
+        visible_blocks = geometry.visible_blocks
+        if self.editor.properties.show_whitespaces:
+            return list(visible_blocks)
+
         selection_range = TextEngine(self.editor).selection_range
-        if selection_range is None:
-            return None
-        with QPainter(self.editor.viewport()) as painter:
-            self.paint_white_sapces(selection_range, painter)
-
-    def paint_white_sapces(self, selection_range: tuple, painter: QPainter):
-        first_block, last_block = TextEngine(self.editor).blocks_from_selection_range(
-            start=selection_range[0], end=selection_range[1]
+        if selection_range is None or not visible_blocks:
+            return []
+
+        # the lines of the selection, clipped to the visible ones
+        document = self.editor.document()
+        first = document.findBlock(selection_range[0]).blockNumber()
+        last = document.findBlock(selection_range[1]).blockNumber()
+        return [entry for entry in visible_blocks if first <= entry[1] <= last]
+
+    def whitespace_marks(self, geometry) -> Tuple[List[QRect], List[QLine]]:
+        """Returns the dots of the visible spaces and the lines of the visible tabs"""
+        editor = self.editor
+        key = (
+            editor.font().key(),
+            editor.properties.tab_stop_distance,
+            editor.lineWrapMode(),
+            editor.viewport().width() if editor.lineWrapMode() else 0,
         )
+        if key != self._whitespace_cache_key:
+            # the x positions changed
+            self._whitespace_cache_key = key
+            self._whitespace_cache.clear()
+
+        origin_x = geometry.content_offset.x()
+        dots, lines = [], []
+        for top, _, block in self._marked_blocks(geometry):
+            marks = self._block_whitespaces(block)
+            if not marks:
+                continue
+
+            layout = block.layout()
+            origin_y = top + layout.position().y()
+            for is_space, left, right, line_number in marks:
+                line = layout.lineAt(line_number)
+                line_top = int(origin_y + line.y())
+                middle = int(line_top + (int(line.height()) - 1) / 2)
+                left = int(origin_x + left + 0.5)
+                right = int(origin_x + right + 0.5)
+                if is_space:
+                    dots.append(QRect(int((left + right) / 2), middle, 2, 2))
+                else:
+                    lines.append(QLine(left + 3, middle, right - 3, middle))
+
+        return dots, lines
 
-        for block in TextEngine.iterate_blocks_from(
-            first_block, last_block.blockNumber()
+    def overlay_rect(self, geometry):
+        if (
+            not self.editor.properties.show_whitespaces
+            and TextEngine(self.editor).selection_range is None
         ):
-            text = block.text()
-            for column, draw in enumerate(self._choose_visible_whitespace(text)):
-                if draw:
-                    self.draw_white_space(block, column, text[column], painter)
-
-    def draw_white_space(self, block, column, char, painter: QPainter):
-        leftCursorRect = TextEngine(self.editor).cursor_rect(block, column, offset=0)
-        rightCursorRect = TextEngine(self.editor).cursor_rect(
-            block, column + 1, offset=0
-        )
-        if leftCursorRect.top() == rightCursorRect.top():  # if on the same visual line
-            middleHeight = (leftCursorRect.top() + leftCursorRect.bottom()) / 2
-
-            if char == Character.SPACE.value:
-                painter.setPen(Qt.transparent)
-                painter.setBrush(QBrush(Qt.gray))
-                xPos = (leftCursorRect.x() + rightCursorRect.x()) / 2
-                painter.drawRect(QRect(int(xPos), int(middleHeight), 2, 2))
-            else:
-                painter.setPen(QColor(Qt.gray).lighter(120))
-                painter.drawLine(
-                    int(leftCursorRect.x()) + 3,
-                    int(middleHeight),
-                    int(rightCursorRect.x()) - 3,
-                    int(middleHeight),
-                )
+            return QRect()
+        return None
+
+    def paint_overlay(self, painter: QPainter, geometry):
+        dots, lines = self.whitespace_marks(geometry)
+        if dots:
+            painter.setPen(Qt.transparent)
+            painter.setBrush(QBrush(Qt.gray))
+            painter.drawRects(dots)
+        if lines:
+            painter.setPen(QColor(Qt.gray).lighter(120))
+            painter.drawLines(lines)
 
 
 __all__ = ["IndentationMarks"]
@@ -20,6 +20,9 @@ class ChellyEvent:
             self.__event_handlers.remove(callable_object)
         return self
 
+    def __len__(self) -> int:
+        return len(self.__event_handlers)
+
     def emit(self, *callable_objects: Tuple[Any]) -> Self:
         for i in range(len(callable_objects)):
             if self.__emit_types[i] is not Any:
@@ -3,6 +3,11 @@ class LexerExceptions:
         pass
 
 
+class GrammarExceptions:
+    class GrammarValueError(Exception):
+        pass
+
+
 class PropertiesExceptions:
     class PropertyValueError(Exception):
         pass
@@ -36,6 +41,7 @@ class TextExceptions:
 __all__ = [
     "ChellyDocumentExceptions",
     "FeaturesExceptions",
+    "GrammarExceptions",
     "LexerExceptions",
     "PanelsExceptions",
     "PropertiesExceptions",
@@ -1,9 +1,14 @@
-import re
-from ..core import Language
-from ..core import TextBlockHelper
+from .utils import GrammarLanguage
 
 
-class JavaScriptSH(Language):
+class JavaScriptSH(GrammarLanguage):
+    """
+    Highlights javascript syntax in the editor.
+    """
+
+    mimetype = "text/javascript"
+    GRAMMAR = "javascript"
+
     def __init__(self, editor, color_scheme=None):
         super().__init__(editor, color_scheme)
 
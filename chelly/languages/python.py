@@ -1,8 +1,20 @@
 import builtins
 
 import re
-from ..core import Language
+from dataclasses import dataclass
+from qtpy.QtCore import Signal
+from ..core import DelayJobRunner, Language
 from ..core import TextBlockHelper
+from .python_semantic import SemanticTokens, SemanticWorker
+from .utils import (
+    BlockIndex,
+    BlockTokens,
+    GrammarLanguage,
+    TokenDispatcher,
+    compile_pattern,
+    merge_runs,
+    push_run,
+)
 
 
 def any(name, alternates):
@@ -60,7 +72,7 @@ def make_python_patterns(additional_keywords=None, additional_builtins=None):
     ] + additional_builtins
     for v in ["None", "True", "False"]:
         builtinlist.remove(v)
-    builtin = r"([^.'\"\\#]\b|^)" + any("builtin", builtinlist) + r"\b"
+    builtin = r"(?:[^.'\"\\#]\b|^)" + any("builtin", builtinlist) + r"\b"
     builtin_fct = any("builtin_fct", [r"_{2}[a-zA-Z_]*_{2}"])
     comment = any("comment", [r"#[^\n]*"])
     instance = any("instance", [r"\bself\b", r"\bcls\b"])
@@ -75,14 +87,14 @@ def make_python_patterns(additional_keywords=None, additional_builtins=None):
             r"\b[+-]?[0-9]+(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?[jJ]?\b",
         ],
     )
-    sqstring = r"(\b[rRuU])?'[^'\\\n]*(\\.[^'\\\n]*)*'?"
-    dqstring = r'(\b[rRuU])?"[^"\\\n]*(\\.[^"\\\n]*)*"?'
-    uf_sqstring = r"(\b[rRuU])?'[^'\\\n]*(\\.[^'\\\n]*)*(\\)$(?!')$"
-    uf_dqstring = r'(\b[rRuU])?"[^"\\\n]*(\\.[^"\\\n]*)*(\\)$(?!")$'
-    sq3string = r"(\b[rRuU])?'''[^'\\]*((\\.|'(?!''))[^'\\]*)*(''')?"
-    dq3string = r'(\b[rRuU])?"""[^"\\]*((\\.|"(?!""))[^"\\]*)*(""")?'
-    uf_sq3string = r"(\b[rRuU])?'''[^'\\]*((\\.|'(?!''))[^'\\]*)*(\\)?(?!''')$"
-    uf_dq3string = r'(\b[rRuU])?"""[^"\\]*((\\.|"(?!""))[^"\\]*)*(\\)?(?!""")$'
+    sqstring = r"(?:\b[rRuU])?'[^'\\\n]*(?:\\.[^'\\\n]*)*'?"
+    dqstring = r'(?:\b[rRuU])?"[^"\\\n]*(?:\\.[^"\\\n]*)*"?'
+    uf_sqstring = r"(?:\b[rRuU])?'[^'\\\n]*(?:\\.[^'\\\n]*)*\\$(?!')$"
+    uf_dqstring = r'(?:\b[rRuU])?"[^"\\\n]*(?:\\.[^"\\\n]*)*\\$(?!")$'
+    sq3string = r"(?:\b[rRuU])?'''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*(?:''')?"
+    dq3string = r'(?:\b[rRuU])?"""[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*(?:""")?'
+    uf_sq3string = r"(?:\b[rRuU])?'''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*\\?(?!''')$"
+    uf_dq3string = r'(?:\b[rRuU])?"""[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*\\?(?!""")$'
     string = any("string", [sq3string, dq3string, sqstring, dqstring])
     ufstring1 = any("uf_sqstring", [uf_sqstring])
     ufstring2 = any("uf_dqstring", [uf_dqstring])
@@ -98,17 +110,122 @@ def make_python_patterns(additional_keywords=None, additional_builtins=None):
             word_operators,
             builtin_fct,
             comment,
-            ufstring1,
-            ufstring2,
-            ufstring3,
-            ufstring4,
-            string,
+            # the strings are only tried where a quote or a prefix starts
+            r"(?=[rRuU'\"])(?:"
+            + "|".join([ufstring1, ufstring2, ufstring3, ufstring4, string])
+            + ")",
             number,
             any("SYNC", [r"\n"]),
         ]
     )
 
 
+class PythonTokenizer:
+    """
+    Splits a line of python code into format runs, the highlighter state of
+    the previous line is enough to tokenize it so the result can be computed
+    away from the QTextBlock.
+    """
+
+    IDPROG = re.compile(r"\s+(\w+)", re.S)
+    # Syntax highlighting states (from one text block to another):
+    (
+        NORMAL,
+        INSIDE_SQ3STRING,
+        INSIDE_DQ3STRING,
+        INSIDE_SQSTRING,
+        INSIDE_DQSTRING,
+    ) = list(range(5))
+
+    # the unfinished string of the previous line is reopened before matching
+    PREFIXES = {
+        INSIDE_DQ3STRING: r'""" ',
+        INSIDE_SQ3STRING: r"''' ",
+        INSIDE_DQSTRING: r'" ',
+        INSIDE_SQSTRING: r"' ",
+    }
+
+    def __init__(self, pattern, builtin_function_group: str = "builtin_fct"):
+        self.dispatcher = TokenDispatcher(
+            pattern,
+            {
+                "instance": "self",
+                "decorator": "decorator",
+                "keyword": self._on_keyword,
+                "namespace": self._on_namespace,
+                "builtin": "builtin",
+                "operator_word": "operator_word",
+                # trick to highlight __init__, __add__ and so on with
+                # builtin color
+                builtin_function_group: "constant",
+                "comment": "comment",
+                "uf_sqstring": self._unfinished("string", self.INSIDE_SQSTRING),
+                "uf_dqstring": self._unfinished("string", self.INSIDE_DQSTRING),
+                "uf_sq3string": self._unfinished("docstring", self.INSIDE_SQ3STRING),
+                "uf_dq3string": self._unfinished("docstring", self.INSIDE_DQ3STRING),
+                "string": self._on_string,
+                "number": "number",
+            },
+        )
+
+    def tokenize(self, text: str, prev_state: int = NORMAL) -> BlockTokens:
+        prefix = self.PREFIXES.get(prev_state, "")
+        context = {
+            "text": prefix + text,
+            "offset": -len(prefix),
+            "state": self.NORMAL,
+            "docstring": False,
+            "import_stmt": None,
+        }
+
+        runs = self.dispatcher.dispatch(context["text"], context, context["offset"])
+        return BlockTokens(
+            merge_runs(runs, len(text)),
+            context["state"],
+            {"docstring": context["docstring"], "import_stmt": context["import_stmt"]},
+        )
+
+    def _unfinished(self, kind: str, state: int):
+        def handler(context, match, start, end, runs):
+            push_run(runs, start, end, kind)
+            context["state"] = state
+            if kind == "docstring":
+                context["docstring"] = True
+
+        return handler
+
+    def _on_string(self, context, match, start, end, runs):
+        value = match.group("string")
+        if '"""' in value or "'''" in value:
+            # highlight docstring with a different color
+            context["docstring"] = True
+            push_run(runs, start, end, "docstring")
+        else:
+            push_run(runs, start, end, "string")
+
+    def _on_keyword(self, context, match, start, end, runs):
+        push_run(runs, start, end, "keyword")
+
+        value = match.group("keyword")
+        if value in ("def", "class"):
+            match1 = self.IDPROG.match(context["text"], match.end("keyword"))
+            if match1:
+                start1, end1 = match1.span(1)
+                offset = context["offset"]
+                push_run(
+                    runs,
+                    max(0, start1 + offset),
+                    max(0, end1 + offset),
+                    "definition" if value == "class" else "function",
+                )
+
+    def _on_namespace(self, context, match, start, end, runs):
+        # "as" is part of the namespace group, so the other words of the
+        # statement are highlighted by their own matches
+        push_run(runs, start, end, "namespace")
+        context["import_stmt"] = context["text"].strip()
+
+
 #
 # Pygments Syntax highlighter
 #
@@ -120,8 +237,8 @@ class PythonSH(Language):
     mimetype = "text/x-python"
 
     # Syntax highlighting rules:
-    PROG = re.compile(make_python_patterns(), re.S)
-    IDPROG = re.compile(r"\s+(\w+)", re.S)
+    PROG = compile_pattern(make_python_patterns(), re.S)
+    IDPROG = PythonTokenizer.IDPROG
     ASPROG = re.compile(r".*?\b(as)\b")
     # Syntax highlighting states (from one text block to another):
     (
@@ -135,133 +252,212 @@ class PythonSH(Language):
     # Comments suitable for Outline Explorer
     OECOMMENT = re.compile("^(# ?--[-]+|##[#]+ )[ -]*[^- ]+")
 
+    TOKENIZER = PythonTokenizer(PROG)
+
+    on_semantic_requested = Signal(int, object)
+
+    @dataclass(frozen=True)
+    class Defaults:
+        SEMANTIC = False
+        SEMANTIC_DELAY = 500  # milliseconds after the last edit
+
+    @property
+    def semantic(self) -> bool:
+        """
+        Adds the semantic tokens of a background ast pass (parameters, local
+        variables, attributes, class references) on top of the regex
+        formats of the visible blocks.
+        """
+        return self._semantic
+
+    @semantic.setter
+    def semantic(self, value: bool) -> None:
+        if value == self._semantic:
+            return None
+
+        self._semantic = value
+        if value:
+            if self._semantic_worker is None:
+                self._semantic_worker = SemanticWorker()
+                self.move_to_background_thread(self._semantic_worker)
+                self.on_semantic_requested.connect(self._semantic_worker.run)
+                self._semantic_worker.on_analyzed.connect(self._on_semantic_tokens_ready)
+            self.request_semantic_tokens()
+        else:
+            self._semantic_runner.cancel_requests()
+            if self._semantic_worker is not None:
+                self._semantic_worker.revision = -1
+                self.on_semantic_requested.disconnect(self._semantic_worker.run)
+                self._semantic_worker.on_analyzed.disconnect(self._on_semantic_tokens_ready)
+                self.release_worker(self._semantic_worker)
+                self._semantic_worker = None
+            self._semantic_tokens.clear()
+            self._semantic_generation += 1
+            self._update_semantic_blocks()
+
     def __init__(self, editor, color_scheme=None):
         super().__init__(editor, color_scheme)
-        self.import_statements = []
-        self.global_import_statements = []
-        self.docstrings = []
+        # block number -> import statement / docstring flag
+        self.import_statements = BlockIndex()
+        self.global_import_statements = BlockIndex()
+        self.docstrings = BlockIndex()
+
+        self._semantic = PythonSH.Defaults.SEMANTIC
+        self._semantic_worker = None
+        self._semantic_runner = DelayJobRunner(PythonSH.Defaults.SEMANTIC_DELAY)
+        # block number -> (text, runs) of the last analysis
+        self._semantic_tokens = BlockIndex()
+        # block number -> generation of the semantic runs applied to it
+        self._semantic_applied = BlockIndex()
+        self._semantic_generation = 0
+        self._semantic_window = None
+
+    def tokenize(self, text, prev_state):
+        return self.TOKENIZER.tokenize(text, prev_state)
 
     def highlight_block(self, text, block):
-        prev_block = block.previous()
-        prev_state = TextBlockHelper.get_state(prev_block)
-        if prev_state == self.INSIDE_DQ3STRING:
-            offset = -4
-            text = r'""" ' + text
-        elif prev_state == self.INSIDE_SQ3STRING:
-            offset = -4
-            text = r"''' " + text
-        elif prev_state == self.INSIDE_DQSTRING:
-            offset = -2
-            text = r'" ' + text
-        elif prev_state == self.INSIDE_SQSTRING:
-            offset = -2
-            text = r"' " + text
-        else:
-            offset = 0
+        tokens = self.highlight_tokens(text, block)
+        block_number = block.blockNumber()
+        import_stmt = tokens.data["import_stmt"]
 
-        import_stmt = None
         # set docstring dynamic attribute, used by the fold detector.
-        block.docstring = False
-
-        self.setFormat(0, len(text), self.formats["normal"])
-
-        state = self.NORMAL
-        match = self.PROG.search(text)
-        while match:
-            for key, value in list(match.groupdict().items()):
-                if value:
-                    start, end = match.span(key)
-                    start = max([0, start + offset])
-                    end = max([0, end + offset])
-                    if key == "uf_sq3string":
-                        self.setFormat(start, end - start, self.formats["docstring"])
-                        block.docstring = True
-                        state = self.INSIDE_SQ3STRING
-                    elif key == "uf_dq3string":
-                        self.setFormat(start, end - start, self.formats["docstring"])
-                        block.docstring = True
-                        state = self.INSIDE_DQ3STRING
-                    elif key == "uf_sqstring":
-                        self.setFormat(start, end - start, self.formats["string"])
-                        state = self.INSIDE_SQSTRING
-                    elif key == "uf_dqstring":
-                        self.setFormat(start, end - start, self.formats["string"])
-                        state = self.INSIDE_DQSTRING
-                    elif key == "builtin_fct":
-                        # trick to highlight __init__, __add__ and so on with
-                        # builtin color
-                        self.setFormat(start, end - start, self.formats["constant"])
-                    else:
-                        if ('"""' in value or "'''" in value) and key != "comment":
-                            # highlight docstring with a different color
-                            block.docstring = True
-                            self.setFormat(
-                                start, end - start, self.formats["docstring"]
-                            )
-                        elif key == "decorator":
-                            # highlight decorators
-                            self.setFormat(
-                                start, end - start, self.formats["decorator"]
-                            )
-                        elif value in ["self", "cls"]:
-                            # highlight self attribute
-                            self.setFormat(start, end - start, self.formats["self"])
-                        else:
-                            # highlight all other tokens
-                            self.setFormat(start, end - start, self.formats[key])
-                        if key == "keyword":
-                            if value in ("def", "class"):
-                                match1 = self.IDPROG.match(text, end)
-                                if match1:
-                                    start1, end1 = match1.span(1)
-                                    fmt_key = (
-                                        "definition" if value == "class" else "function"
-                                    )
-                                    fmt = self.formats[fmt_key]
-                                    self.setFormat(start1, end1 - start1, fmt)
-                        if key == "namespace":
-                            import_stmt = text.strip()
-                            # color all the "as" words on same line, except
-                            # if in a comment; cheap approximation to the
-                            # truth
-                            if "#" in text:
-                                endpos = text.index("#")
-                            else:
-                                endpos = len(text)
-                            while True:
-                                match1 = self.ASPROG.match(text, end, endpos)
-                                if not match1:
-                                    break
-                                start, end = match1.span(1)
-                                self.setFormat(
-                                    start, end - start, self.formats["namespace"]
-                                )
-            # next match
-            match = self.PROG.search(text, match.end())
-        TextBlockHelper.set_state(block, state)
+        block.docstring = tokens.data["docstring"]
 
         # update import zone
         if import_stmt is not None:
-            block.import_stmt = import_stmt
-            self.import_statements.append(block)
+            self.import_statements.set(block_number, import_stmt)
+            if not text[:1].isspace():
+                self.global_import_statements.set(block_number, import_stmt)
+            else:
+                self.global_import_statements.discard(block_number)
+            self.docstrings.discard(block_number)
             block.import_stmt = True
-        elif block.docstring:
-            self.docstrings.append(block)
+        else:
+            self.import_statements.discard(block_number)
+            self.global_import_statements.discard(block_number)
+            if block.docstring:
+                self.docstrings.set(block_number)
+            else:
+                self.docstrings.discard(block_number)
+
+        if self._semantic or block_number in self._semantic_applied:
+            self._highlight_semantic_tokens(text, block_number)
+
+    def request_semantic_tokens(self) -> None:
+        """Sends a snapshot of the document to the semantic worker"""
+        if not self._semantic:
+            return None
+
+        document = self.document()
+        lines = document.toPlainText().split("\n")
+        if len(lines) != document.blockCount():
+            lines = [block.text() for block in self._iterate_blocks(0, document.blockCount())]
+
+        self._semantic_worker.revision = self._revision
+        self.on_semantic_requested.emit(self._revision, lines)
+
+    def _highlight_semantic_tokens(self, text: str, block_number: int) -> None:
+        entry = self._semantic_tokens.get(block_number)
+        first, last = self._visible_range()
+
+        if entry is not None and entry[0] == text and first <= block_number <= last:
+            self.set_format_runs(entry[1])
+            self._semantic_applied.set(block_number, self._semantic_generation)
+        else:
+            self._semantic_applied.discard(block_number)
+
+    def _update_semantic_blocks(self) -> None:
+        """Highlights again the visible blocks whose semantic runs changed"""
+        window = self._visible_range()
+        if (window, self._semantic_generation) == self._semantic_window:
+            return None
+        self._semantic_window = (window, self._semantic_generation)
+
+        first, last = window
+        for block in list(self._iterate_blocks(first, last)):
+            block_number = block.blockNumber()
+            entry = self._semantic_tokens.get(block_number)
+            wanted = entry is not None and entry[0] == block.text()
+            applied = self._semantic_applied.get(block_number)
+
+            if (wanted and applied != self._semantic_generation) or (
+                not wanted and applied is not None
+            ):
+                self.rehighlightBlock(block)
+
+    def _on_semantic_tokens_ready(self, revision: int, tokens: SemanticTokens) -> None:
+        if revision != self._revision or not self._semantic:
+            return None
+
+        self._semantic_tokens.clear()
+        for block_number, entry in tokens.items():
+            self._semantic_tokens.set(block_number, entry)
+        self._semantic_generation += 1
+        self._update_semantic_blocks()
+
+    def _on_editor_painted(self, *args) -> None:
+        super()._on_editor_painted(*args)
+
+        if self._semantic_tokens or self._semantic_applied:
+            self._update_semantic_blocks()
+
+    def imports_in_range(self, first_block: int, last_block: int):
+        return self.import_statements.in_range(first_block, last_block)
+
+    def docstrings_in_range(self, first_block: int, last_block: int):
+        return [number for number, _ in self.docstrings.in_range(first_block, last_block)]
 
     def rehighlight(self):
-        self.import_statements[:] = []
-        self.global_import_statements[:] = []
-        self.docstrings[:] = []
+        self.import_statements.clear()
+        self.global_import_statements.clear()
+        self.docstrings.clear()
         super(PythonSH, self).rehighlight()
 
+    def _on_contents_change(self, position: int, removed: int, added: int) -> None:
+        document = self.document()
+        delta = document.blockCount() - self._cached_block_count
+
+        if delta:
+            block_number = document.findBlock(position).blockNumber()
+            self.import_statements.shift(block_number, delta)
+            self.global_import_statements.shift(block_number, delta)
+            self.docstrings.shift(block_number, delta)
+            self._semantic_tokens.shift(block_number, delta)
+            self._semantic_applied.shift(block_number, delta)
+
+        super()._on_contents_change(position, removed, added)
+
+        if self._semantic:
+            # abandon the analysis in flight, analyze again once edits settle
+            self._semantic_worker.revision = self._revision
+            self._semantic_runner.request_job(self.request_semantic_tokens)
+
+
+class PythonGrammarSH(GrammarLanguage):
+    """
+    Highlights python syntax with the table-driven grammar engine.
+    """
+
+    mimetype = "text/x-python"
+    GRAMMAR = "python"
+    LISTS = {
+        "builtins": [
+            str(name)
+            for name in dir(builtins)
+            if not name.startswith("_") and name not in ("None", "True", "False")
+        ]
+    }
+
 
 class PythonLanguage(PythonSH):
     ...
 
 
 __all__ = [
+    "PythonGrammarSH",
     "PythonLanguage",
     "PythonSH",
+    "PythonTokenizer",
     "any",
     "kw_namespace_list",
     "kwlist",
@@ -0,0 +1,439 @@
+import ast
+import re
+from bisect import bisect_right
+from typing import Dict, List, Sequence, Tuple
+
+from qtpy.QtCore import QObject, Signal
+
+from .utils import FormatRun
+
+#: (line, column, length, kind), line relative to the analyzed statement
+SemanticToken = Tuple[int, int, int, str]
+#: line number -> (line text, format runs)
+SemanticTokens = Dict[int, Tuple[str, Tuple[FormatRun, ...]]]
+
+
+class _ScopeVisitor(ast.NodeVisitor):
+    """
+    Resolves the names of one top level statement. Names not bound in a
+    function scope are kept aside, they are resolved against the module
+    symbols once every statement is analyzed.
+    """
+
+    IGNORED_NAMES = frozenset(["self", "cls"])
+
+    def __init__(self, lines: Sequence[str], line_offset: int):
+        self.lines = lines
+        self.line_offset = line_offset
+        self.tokens: List[SemanticToken] = []
+        self.free_names: List[Tuple[int, int, int, str]] = []
+        # (is class scope, name -> kind)
+        self.scopes: List[Tuple[bool, Dict[str, str]]] = []
+
+    def _column(self, line_number: int, byte_offset: int) -> int:
+        # ast offsets are utf-8 byte offsets
+        try:
+            line = self.lines[line_number - 1]
+        except IndexError:
+            return byte_offset
+        if line.isascii():
+            return byte_offset
+        return len(line.encode("utf-8")[:byte_offset].decode("utf-8", "ignore"))
+
+    def _add(self, line_number: int, byte_offset: int, name: str, kind: str) -> None:
+        self.tokens.append(
+            (
+                line_number - 1 - self.line_offset,
+                self._column(line_number, byte_offset),
+                len(name),
+                kind,
+            )
+        )
+
+    def _resolve(self, name: str):
+        for index in range(len(self.scopes) - 1, -1, -1):
+            is_class, names = self.scopes[index]
+            if is_class and index != len(self.scopes) - 1:
+                # class bodies are not visible from their methods
+                continue
+            kind = names.get(name)
+            if kind is not None:
+                return kind
+        return None
+
+    @staticmethod
+    def _bound_names(body: Sequence[ast.AST]) -> Tuple[Dict[str, str], set]:
+        """Names assigned in a function body, without the nested scopes"""
+        names: Dict[str, str] = {}
+        declared = set()
+        stack = list(body)
+        while stack:
+            node = stack.pop()
+            if isinstance(node, (ast.Global, ast.Nonlocal)):
+                declared.update(node.names)
+                continue
+            if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+                names[node.id] = "local"
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                stack.extend(node.decorator_list)
+                continue
+            elif isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+                continue
+            stack.extend(ast.iter_child_nodes(node))
+
+        for name in declared:
+            names.pop(name, None)
+        return names, declared
+
+    def _visit_function(self, node, body: Sequence[ast.AST]) -> None:
+        arguments = node.args
+        for default in arguments.defaults + [d for d in arguments.kw_defaults if d]:
+            self.visit(default)
+        if not isinstance(node, ast.Lambda):
+            for decorator in node.decorator_list:
+                self.visit(decorator)
+            if node.returns is not None:
+                self.visit(node.returns)
+
+        all_arguments = arguments.posonlyargs + arguments.args + arguments.kwonlyargs
+        for argument in (arguments.vararg, arguments.kwarg):
+            if argument is not None:
+                all_arguments.append(argument)
+
+        for argument in all_arguments:
+            if argument.annotation is not None:
+                self.visit(argument.annotation)
+
+        names, _ = self._bound_names(body)
+        for argument in all_arguments:
+            names[argument.arg] = "parameter"
+            if argument.arg not in self.IGNORED_NAMES:
+                self._add(argument.lineno, argument.col_offset, argument.arg, "parameter")
+
+        self.scopes.append((False, names))
+        for child in body:
+            self.visit(child)
+        self.scopes.pop()
+
+    def visit_FunctionDef(self, node) -> None:
+        self._visit_function(node, node.body)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node) -> None:
+        self._visit_function(node, [node.body])
+
+    def visit_ClassDef(self, node) -> None:
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.visit(child)
+
+        self.scopes.append((True, {}))
+        for child in node.body:
+            self.visit(child)
+        self.scopes.pop()
+
+    def _visit_comprehension(self, node, elements: Sequence[ast.AST]) -> None:
+        names = {}
+        for generator in node.generators:
+            for target in ast.walk(generator.target):
+                if isinstance(target, ast.Name):
+                    names[target.id] = "local"
+
+        # the first iterable is evaluated in the enclosing scope
+        self.visit(node.generators[0].iter)
+        self.scopes.append((False, names))
+        for index, generator in enumerate(node.generators):
+            self.visit(generator.target)
+            if index:
+                self.visit(generator.iter)
+            for condition in generator.ifs:
+                self.visit(condition)
+        for element in elements:
+            self.visit(element)
+        self.scopes.pop()
+
+    def visit_ListComp(self, node) -> None:
+        self._visit_comprehension(node, [node.elt])
+
+    visit_SetComp = visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node) -> None:
+        self._visit_comprehension(node, [node.key, node.value])
+
+    def visit_Name(self, node) -> None:
+        if node.id in self.IGNORED_NAMES:
+            return None
+
+        kind = self._resolve(node.id) if self.scopes else None
+        if kind is not None:
+            self._add(node.lineno, node.col_offset, node.id, kind)
+        elif isinstance(node.ctx, ast.Load):
+            self.free_names.append(
+                (
+                    node.lineno - 1 - self.line_offset,
+                    self._column(node.lineno, node.col_offset),
+                    len(node.id),
+                    node.id,
+                )
+            )
+
+    def visit_Attribute(self, node) -> None:
+        self.visit(node.value)
+        end_lineno = getattr(node, "end_lineno", None)
+        if end_lineno is not None:
+            # the attribute name ends the node, no space is allowed before
+            # the end of an attribute (only around the dot)
+            self._add(
+                end_lineno,
+                node.end_col_offset - len(node.attr.encode("utf-8")),
+                node.attr,
+                "attribute",
+            )
+
+
+class PythonSemanticAnalyzer:
+    """
+    Finds what the regex highlighter can't tell apart: parameters, local
+    variables, attributes and references to the classes of the module.
+
+    Every top level statement is analyzed on its own and the result is
+    cached by its source, after an edit only the changed statements are
+    analyzed again. The lines of the previous pass locate the edit, only the
+    top level statements around it are parsed again while the statement
+    boundaries stay clear, otherwise the whole module is parsed.
+    """
+
+    #: semantic token -> color scheme key
+    KINDS = {
+        "parameter": "instance",
+        "local": "name",
+        "attribute": "name_attribute",
+        "class": "definition",
+    }
+
+    STATEMENT_START = re.compile(r"[^\s#)\]}]")
+    #: lines compared at once when looking for the edited lines
+    COMPARED_LINES = 256
+
+    def __init__(self) -> None:
+        # statement source -> (tokens, free names, module classes)
+        self._statements: Dict[str, Tuple] = {}
+        # lines and statements of the last pass, None when it did not parse
+        self._lines: List[str] = []
+        self._parsed_segments: List[Tuple] = None
+        #: number of statements analyzed by the last pass
+        self.analyzed = 0
+        #: number of lines parsed by the last pass
+        self.parsed_lines = 0
+
+    def analyze(self, lines: List[str], is_cancelled=None) -> SemanticTokens:
+        """
+        Returns the semantic runs of the lines, an empty result when
+        ``is_cancelled`` returns True before the analysis is done.
+        """
+        segments = self._segments(lines)
+
+        statements = {}
+        tokens: List[SemanticToken] = []
+        free_names = []
+        classes = set()
+        self.analyzed = 0
+
+        for first_line, last_line, nodes in segments:
+            if is_cancelled is not None and is_cancelled():
+                return {}
+
+            source = "\n".join(lines[first_line : last_line + 1])
+            result = self._statements.get(source)
+            if result is None:
+                result = self._analyze_segment(source, nodes, lines, first_line)
+                self.analyzed += 1
+            statements[source] = result
+
+            segment_tokens, segment_names, segment_classes = result
+            tokens.extend(
+                (line + first_line, column, length, kind)
+                for line, column, length, kind in segment_tokens
+            )
+            free_names.extend(
+                (line + first_line, column, length, name)
+                for line, column, length, name in segment_names
+            )
+            classes.update(segment_classes)
+
+        # keep the statements of this pass only
+        self._statements = statements
+
+        tokens.extend(
+            (line, column, length, "class")
+            for line, column, length, name in free_names
+            if name in classes
+        )
+        return self._encode(lines, tokens)
+
+    def _segments(self, lines: List[str]):
+        """(first line, last line, ast nodes or None) of the top level statements"""
+        previous_lines, previous_segments = self._lines, self._parsed_segments
+        self._lines = list(lines)
+        self.parsed_lines = 0
+
+        segments = None
+        if previous_segments is not None:
+            segments = self._parse_edit(previous_lines, previous_segments, lines)
+        if segments is None:
+            segments = self._parse(lines, 0, len(lines) - 1)
+
+        self._parsed_segments = segments
+        if segments is not None:
+            return segments
+
+        # the code is being edited, split on the lines starting a statement
+        # and parse each chunk on its own
+        segments = []
+        first_line = 0
+        for line_number, line in enumerate(lines):
+            if (
+                line_number
+                and self.STATEMENT_START.match(line)
+                and not lines[line_number - 1].startswith("@")
+            ):
+                segments.append((first_line, line_number - 1, None))
+                first_line = line_number
+        segments.append((first_line, len(lines) - 1, None))
+        return segments
+
+    def _parse(self, lines: List[str], first_line: int, last_line: int):
+        """The statements of the lines from first to last line, None on an error"""
+        self.parsed_lines += last_line + 1 - first_line
+        try:
+            module = ast.parse("\n".join(lines[first_line : last_line + 1]))
+        except (SyntaxError, ValueError):
+            return None
+
+        segments = []
+        for node in module.body:
+            if first_line:
+                ast.increment_lineno(node, first_line)
+            first = min(
+                [node.lineno]
+                + [decorator.lineno for decorator in getattr(node, "decorator_list", [])]
+            )
+            segments.append((first - 1, node.end_lineno - 1, [node]))
+        return segments
+
+    def _common_prefix(self, lines: List[str], other_lines: List[str], limit: int) -> int:
+        """Number of equal lines at the start of both lists, up to limit"""
+        start = 0
+        while start < limit:
+            end = min(start + self.COMPARED_LINES, limit)
+            if lines[start:end] != other_lines[start:end]:
+                break
+            start = end
+        while start < limit and lines[start] == other_lines[start]:
+            start += 1
+        return start
+
+    def _parse_edit(self, previous_lines: List[str], previous_segments, lines: List[str]):
+        """
+        The statements of the lines, only the ones around the lines changed
+        since the previous pass are parsed. None when the edited lines don't
+        parse on their own, as an unterminated string or an indented line.
+        """
+        length = min(len(lines), len(previous_lines))
+        prefix = self._common_prefix(lines, previous_lines, length)
+        if prefix == len(lines) == len(previous_lines):
+            return previous_segments
+        suffix = self._common_prefix(lines[::-1], previous_lines[::-1], length - prefix)
+        # last edited line before the edit, prefix - 1 for inserted lines
+        last_edited = len(previous_lines) - suffix - 1
+        delta = len(lines) - len(previous_lines)
+
+        # the statement the edit starts in or follows, an indented line added
+        # after a statement belongs to it
+        firsts = [segment[0] for segment in previous_segments]
+        first_index = max(bisect_right(firsts, prefix) - 1, 0)
+        last_index = bisect_right(firsts, max(prefix, last_edited)) - 1
+        if last_index < first_index:
+            first_line = 0
+            last_line = last_edited
+        else:
+            first_line = min(previous_segments[first_index][0], prefix)
+            last_line = max(previous_segments[last_index][1], last_edited)
+
+        segments = self._parse(lines, first_line, last_line + delta)
+        if segments is None:
+            return None
+
+        # the statements after the edit moved, their nodes are parsed again if
+        # their source is not cached
+        return (
+            previous_segments[:first_index]
+            + segments
+            + [
+                (first + delta, last + delta, None)
+                for first, last, _nodes in previous_segments[max(last_index + 1, first_index):]
+            ]
+        )
+
+    @staticmethod
+    def _analyze_segment(source: str, nodes, lines: List[str], first_line: int):
+        line_offset = first_line
+        if nodes is None:
+            try:
+                nodes = ast.parse(source).body
+            except (SyntaxError, ValueError):
+                return ((), (), ())
+            # line numbers of the chunk start at its first line
+            line_offset = 0
+            lines = lines[first_line:]
+
+        visitor = _ScopeVisitor(lines, line_offset)
+        classes = []
+        for node in nodes:
+            if isinstance(node, ast.ClassDef):
+                classes.append(node.name)
+            visitor.visit(node)
+
+        return (tuple(visitor.tokens), tuple(visitor.free_names), tuple(classes))
+
+    def _encode(self, lines: List[str], tokens: List[SemanticToken]) -> SemanticTokens:
+        runs_by_line: Dict[int, List[FormatRun]] = {}
+        for line, column, length, kind in tokens:
+            runs_by_line.setdefault(line, []).append((column, length, self.KINDS[kind]))
+
+        return {
+            line: (lines[line], tuple(sorted(runs)))
+            for line, runs in runs_by_line.items()
+            if 0 <= line < len(lines)
+        }
+
+
+class SemanticWorker(QObject):
+    """
+    Runs the semantic analysis of text snapshots away from the GUI thread,
+    a snapshot is abandoned as soon as a newer revision is known.
+    """
+
+    on_analyzed = Signal(int, object)
+
+    def __init__(self, analyzer: PythonSemanticAnalyzer = None):
+        super().__init__()
+        self.analyzer = analyzer or PythonSemanticAnalyzer()
+        #: latest document revision, older requests are abandoned
+        self.revision = 0
+
+    def run(self, revision: int, lines: list) -> None:
+        if revision != self.revision:
+            return None
+
+        tokens = self.analyzer.analyze(lines, lambda: revision != self.revision)
+        if revision == self.revision:
+            self.on_analyzed.emit(revision, tokens)
+
+
+__all__ = [
+    "PythonSemanticAnalyzer",
+    "SemanticToken",
+    "SemanticTokens",
+    "SemanticWorker",
+]
@@ -1 +1,12 @@
 from .base_sh import Rules
+from .block_index import BlockIndex
+from .grammar_engine import GrammarEngine, GrammarLanguage
+from .grammar_loader import (
+    GRAMMARS_PATH,
+    Grammar,
+    GrammarLoader,
+    compile_pattern,
+    grammar_loader,
+    load_grammar,
+)
+from .token_dispatch import BlockTokens, FormatRun, TokenDispatcher, merge_runs, push_run
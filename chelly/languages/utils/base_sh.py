@@ -1,5 +1,33 @@
+from typing import Dict, Pattern, Tuple, Union
+
+#: ("push", state name), ("pop", count) or None
+Transition = Union[Tuple[str, Union[str, int]], None]
+
+
 class Rules:
-    ...
+    """
+    Rules of one grammar state compiled into a single alternation, the
+    group that fired (``match.lastgroup``) selects the action to run.
+    """
+
+    __slots__ = ("name", "pattern", "actions", "default")
+
+    def __init__(
+        self,
+        name: str,
+        pattern: Pattern,
+        actions: Dict[str, Tuple[str, Tuple[Tuple[int, str], ...], Transition]],
+        default: str = "normal",
+    ) -> None:
+        self.name = name
+        self.pattern = pattern
+        #: group name -> (format key, (group index, format key) captures, transition)
+        self.actions = actions
+        #: format key of the text no rule matches
+        self.default = default
+
+    def __repr__(self) -> str:
+        return f"<Rules {self.name} ({len(self.actions)} rules)>"
 
 
-__all__ = ["Rules"]
+__all__ = ["Rules", "Transition"]
@@ -0,0 +1,75 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+class BlockIndex:
+    """
+    Values keyed by block number, kept sorted so the blocks of a range are
+    found in O(log n). Holds at most one value per block, entries are updated
+    in place when a block is highlighted again.
+    """
+
+    def __init__(self) -> None:
+        self._numbers: List[int] = []
+        self._values: Dict[int, Any] = {}
+
+    def set(self, block_number: int, value: Any = True) -> None:
+        if block_number not in self._values:
+            insort(self._numbers, block_number)
+        self._values[block_number] = value
+
+    def discard(self, block_number: int) -> None:
+        if block_number in self._values:
+            del self._values[block_number]
+            del self._numbers[bisect_left(self._numbers, block_number)]
+
+    def get(self, block_number: int, default: Any = None) -> Any:
+        return self._values.get(block_number, default)
+
+    def in_range(self, first_block: int, last_block: int) -> List[Tuple[int, Any]]:
+        """Returns the (block number, value) entries of the inclusive range"""
+        start = bisect_left(self._numbers, first_block)
+        end = bisect_right(self._numbers, last_block)
+        values = self._values
+        return [(number, values[number]) for number in self._numbers[start:end]]
+
+    def shift(self, block_number: int, delta: int) -> None:
+        """
+        Follows ``delta`` blocks inserted (or removed when negative) right
+        after ``block_number``.
+        """
+        if not delta:
+            return None
+
+        start = bisect_right(self._numbers, block_number)
+        if delta < 0:
+            # entries of the removed blocks
+            end = bisect_right(self._numbers, block_number - delta)
+            for number in self._numbers[start:end]:
+                del self._values[number]
+            del self._numbers[start:end]
+
+        moved = self._numbers[start:]
+        values = {number: self._values.pop(number) for number in moved}
+        self._numbers[start:] = [number + delta for number in moved]
+        for number, value in values.items():
+            self._values[number + delta] = value
+
+    def clear(self) -> None:
+        self._numbers.clear()
+        self._values.clear()
+
+    def __contains__(self, block_number: int) -> bool:
+        return block_number in self._values
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._numbers)
+
+    def __repr__(self) -> str:
+        return f"<BlockIndex {self._numbers!r}>"
+
+
+__all__ = ["BlockIndex"]
@@ -0,0 +1,259 @@
+import re
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Tuple
+
+from ...core import Language
+from ...internal import GrammarExceptions
+from .base_sh import Rules, Transition
+from .grammar_loader import Grammar, compile_pattern, load_grammar
+from .token_dispatch import BlockTokens, merge_runs
+
+
+class GrammarEngine:
+    """
+    Compiles the ``states`` of a grammar file into a state machine, every
+    state matches its rules with one combined regex.
+
+    A grammar state looks like::
+
+        states:
+          root:
+            - {token: comment, match: '#.*'}
+            - {token: keyword, words: keywords_list}
+            - {match: '\\b(def)\\s+(\\w+)', captures: {1: keyword, 2: function}}
+            - {token: docstring, match: "'''", push: docstring}
+          docstring:
+            default: docstring
+            rules:
+              - {token: docstring, match: "'''", pop: 1}
+
+    ``words`` refers to a list of the ``static`` section, ``include`` copies
+    the rules of another state and a match with ``captures`` is only
+    highlighted inside its groups. The stack of states at the end of a line
+    is interned into the 16 bits highlighter state of the block.
+    """
+
+    ROOT = "root"
+    MAX_DEPTH = 16
+    MAX_STATES = 0xFFFE  # 0xFFFF is the unknown state of the highlighter
+    WORD_BEFORE = r"(?<![\w$.])"
+    WORD_AFTER = r"(?![\w$])"
+
+    def __init__(self, grammar: Grammar, lists: Dict[str, List[str]] = None):
+        self.grammar = grammar
+        self.lists = dict(grammar.data.get("static", {}))
+        if lists:
+            self.lists.update(lists)
+
+        states = grammar.data.get("states")
+        if not states or self.ROOT not in states:
+            raise GrammarExceptions.GrammarValueError(
+                f"grammar {grammar.name} has no {self.ROOT!r} state"
+            )
+
+        self._states = states
+        self.rules: Dict[str, Rules] = {
+            name: self._compile_state(name) for name in states
+        }
+
+        self._lock = Lock()
+        self._stacks: List[Tuple[str, ...]] = [(self.ROOT,)]
+        self._stack_ids: Dict[Tuple[str, ...], int] = {(self.ROOT,): 0}
+
+    @classmethod
+    def from_name(cls, name: str, lists: Dict[str, List[str]] = None):
+        return cls(load_grammar(name), lists)
+
+    def stack(self, state: int) -> Tuple[str, ...]:
+        """Returns the states stack of a highlighter state"""
+        if 0 <= state < len(self._stacks):
+            return self._stacks[state]
+        return self._stacks[0]
+
+    def state_id(self, stack: Tuple[str, ...]) -> int:
+        state = self._stack_ids.get(stack)
+        if state is not None:
+            return state
+
+        with self._lock:
+            state = self._stack_ids.get(stack)
+            if state is None and len(self._stacks) < self.MAX_STATES:
+                state = len(self._stacks)
+                self._stacks.append(stack)
+                self._stack_ids[stack] = state
+        if state is not None:
+            return state
+
+        # out of ids, keep the innermost state only when it has one
+        return self._stack_ids.get((self.ROOT, stack[-1]), 0)
+
+    def tokenize(self, text: str, prev_state: int = 0) -> BlockTokens:
+        stack = self.stack(prev_state)
+        rules = self.rules[stack[-1]]
+        runs = []
+        append = runs.append
+        position = 0
+        length = len(text)
+        empty_matches = 0
+
+        while True:
+            match = rules.pattern.search(text, position)
+            if match is None:
+                break
+
+            start, end = match.span()
+            kind, captures, transition = rules.actions[match.lastgroup]
+
+            if start > position and rules.default != "normal":
+                append([position, start, rules.default])
+
+            if captures:
+                for group, capture_kind in captures:
+                    capture_start, capture_end = match.span(group)
+                    if capture_start < capture_end:
+                        append([capture_start, capture_end, capture_kind])
+            elif start < end:
+                append([start, end, kind])
+
+            if transition is not None:
+                if transition[0] == "push":
+                    stack = (stack + (transition[1],))[-self.MAX_DEPTH :]
+                else:
+                    stack = stack[: -transition[1]] or self._stacks[0]
+                rules = self.rules[stack[-1]]
+
+            if end > position:
+                position = end
+                empty_matches = 0
+            elif transition is not None and empty_matches < self.MAX_DEPTH:
+                empty_matches += 1
+            elif position < length:
+                # the next character is left to the state default
+                if rules.default != "normal":
+                    append([position, position + 1, rules.default])
+                position += 1
+            else:
+                break
+
+        if position < length and rules.default != "normal":
+            append([position, length, rules.default])
+
+        return BlockTokens(merge_runs(runs, length), self.state_id(stack))
+
+    def _state_rules(self, name: str, seen: Tuple[str, ...] = ()) -> Iterable[Dict[str, Any]]:
+        if name not in self._states:
+            raise GrammarExceptions.GrammarValueError(
+                f"grammar {self.grammar.name} has no state {name!r}"
+            )
+        if name in seen:
+            raise GrammarExceptions.GrammarValueError(
+                f"state {name!r} of grammar {self.grammar.name} includes itself"
+            )
+
+        state = self._states[name]
+        rules = state.get("rules", []) if isinstance(state, dict) else state
+        for rule in rules:
+            if "include" in rule:
+                yield from self._state_rules(rule["include"], seen + (name,))
+            else:
+                yield rule
+
+    def _rule_source(self, rule: Dict[str, Any]) -> str:
+        if "words" in rule:
+            words = rule["words"]
+            if isinstance(words, str):
+                if words not in self.lists:
+                    raise GrammarExceptions.GrammarValueError(
+                        f"grammar {self.grammar.name} has no word list {words!r}"
+                    )
+                words = self.lists[words]
+            words = sorted(set(words), key=len, reverse=True)
+            return (
+                self.WORD_BEFORE
+                + "(?:"
+                + "|".join(re.escape(word) for word in words)
+                + ")"
+                + self.WORD_AFTER
+            )
+
+        if "match" in rule:
+            return rule["match"]
+
+        raise GrammarExceptions.GrammarValueError(
+            f"rule {rule!r} of grammar {self.grammar.name} has no match or words"
+        )
+
+    def _compile_state(self, name: str) -> Rules:
+        state = self._states[name]
+        default = state.get("default", "normal") if isinstance(state, dict) else "normal"
+
+        sources = []
+        rules = list(self._state_rules(name))
+        for index, rule in enumerate(rules):
+            sources.append(f"(?P<r{index}>{self._rule_source(rule)})")
+
+        try:
+            # a state without rules never matches
+            pattern = compile_pattern("|".join(sources) or r"(?!)")
+        except re.error as error:
+            raise GrammarExceptions.GrammarValueError(
+                f"invalid rule in state {name!r} of grammar {self.grammar.name}: {error}"
+            )
+
+        actions = {}
+        for index, rule in enumerate(rules):
+            group_name = f"r{index}"
+            group = pattern.groupindex[group_name]
+            captures = tuple(
+                (group + int(capture), capture_kind)
+                for capture, capture_kind in sorted(
+                    rule.get("captures", {}).items(), key=lambda item: int(item[0])
+                )
+            )
+
+            transition: Transition = None
+            if "push" in rule:
+                if rule["push"] not in self._states:
+                    raise GrammarExceptions.GrammarValueError(
+                        f"rule {rule!r} pushes an unknown state"
+                    )
+                transition = ("push", rule["push"])
+            elif rule.get("pop"):
+                transition = ("pop", int(rule["pop"]))
+
+            actions[group_name] = (rule.get("token", default), captures, transition)
+
+        return Rules(name, pattern, actions, default)
+
+
+class GrammarLanguage(Language):
+    """
+    Language highlighted by a :class:`GrammarEngine`, subclasses only name
+    their grammar file.
+    """
+
+    #: name of the grammar in the grammars folder
+    GRAMMAR: str = None
+    #: word lists that can't be written in the grammar file
+    LISTS: Dict[str, List[str]] = None
+
+    @classmethod
+    def engine(cls) -> GrammarEngine:
+        engine = cls.__dict__.get("_grammar_engine")
+        if engine is None:
+            engine = GrammarEngine.from_name(cls.GRAMMAR, cls.LISTS)
+            cls._grammar_engine = engine
+        return engine
+
+    def __init__(self, editor, color_scheme=None):
+        super().__init__(editor, color_scheme)
+        self._engine = self.engine()
+
+    def tokenize(self, text, prev_state):
+        return self._engine.tokenize(text, prev_state)
+
+    def highlight_block(self, text, block):
+        self.highlight_tokens(text, block)
+
+
+__all__ = ["GrammarEngine", "GrammarLanguage"]
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import pathlib
+import re
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Pattern, Tuple, Union
+
+#: Grammar files shipped with chelly
+GRAMMARS_PATH = pathlib.Path(__file__).resolve().parent.parent / "grammars"
+
+#: name -> (regex source, flags)
+PatternSources = Dict[str, Tuple[str, int]]
+
+
+@dataclass(frozen=True)
+class Grammar:
+    name: str
+    data: Dict[str, Any]
+    patterns: Dict[str, Pattern]
+
+
+class GrammarLoader:
+    """
+    Loads the grammar files and compiles their patterns once per process.
+
+    The parsed grammar and the regex sources built from it are also kept in
+    an on-disk cache keyed by the hash of the grammar file, so later startups
+    skip the YAML parsing and the building of the sources. The cache is
+    written by the first load of a grammar and the patterns are always
+    compiled by ``re.compile``.
+    """
+
+    @dataclass(frozen=True)
+    class Defaults:
+        CACHE_PATH = pathlib.Path(
+            os.environ.get("CHELLY_CACHE_DIR", pathlib.Path.home() / ".cache" / "chelly")
+        ).joinpath("grammars")
+        CACHE_VERSION = 3
+
+    @property
+    def cache_path(self) -> Union[pathlib.Path, None]:
+        return self._cache_path
+
+    def __init__(self, cache_path: Union[pathlib.Path, str, None] = Defaults.CACHE_PATH):
+        self._cache_path = pathlib.Path(cache_path) if cache_path is not None else None
+        self._grammars: Dict[str, Grammar] = {}
+        self._patterns: Dict[Tuple[str, int], Pattern] = {}
+
+    def grammar_path(self, name: str) -> pathlib.Path:
+        return GRAMMARS_PATH.joinpath(f"{name}.syntax.yaml")
+
+    def load(
+        self, name: str, build: Callable[[Dict[str, Any]], PatternSources] = None
+    ) -> Grammar:
+        """
+        Returns the grammar ``name`` from the grammars folder, ``build`` turns
+        the parsed grammar into the regex sources to compile.
+        """
+        content = self.grammar_path(name).read_bytes()
+        key = self._key(name.encode(), content, *self._builder_key(build))
+
+        grammar = self._grammars.get(key)
+        if grammar is not None:
+            return grammar
+
+        entry = self._read(f"{name}-{key}")
+        grammar = self._grammar(name, entry)
+        if grammar is None:
+            import yaml
+
+            data = yaml.safe_load(content)
+            sources = {} if build is None else build(data)
+            grammar = Grammar(
+                name,
+                data,
+                {
+                    pattern_name: self.compile(source, flags)
+                    for pattern_name, (source, flags) in sources.items()
+                },
+            )
+            self._write(f"{name}-{key}", {"data": data, "sources": sources})
+
+        self._grammars[key] = grammar
+        return grammar
+
+    def compile(self, source: str, flags: int = 0) -> Pattern:
+        """Same as ``re.compile``, the pattern is kept for the process"""
+        pattern = self._patterns.get((source, flags))
+        if pattern is None:
+            pattern = re.compile(source, flags)
+            self._patterns[(source, flags)] = pattern
+        return pattern
+
+    def clear(self) -> None:
+        self._grammars.clear()
+        self._patterns.clear()
+
+    @staticmethod
+    def _builder_key(build: Union[Callable, None]) -> Tuple[bytes, ...]:
+        if build is None:
+            return ()
+
+        # the sources depend on the module of the builder too
+        module = sys.modules.get(build.__module__)
+        try:
+            with open(module.__file__, "rb") as infile:
+                module_content = infile.read()
+        except (AttributeError, OSError, TypeError):
+            module_content = b""
+
+        return (f"{build.__module__}.{build.__qualname__}".encode(), module_content)
+
+    def _key(self, *parts: bytes) -> str:
+        digest = hashlib.sha1()
+        digest.update(str(GrammarLoader.Defaults.CACHE_VERSION).encode())
+        for part in parts:
+            digest.update(b"\0")
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _grammar(self, name: str, entry: Any) -> Union[Grammar, None]:
+        """The grammar of a cache entry, None when the entry is not valid"""
+        try:
+            return Grammar(
+                name,
+                entry["data"],
+                {
+                    pattern_name: self.compile(source, flags)
+                    for pattern_name, (source, flags) in entry["sources"].items()
+                },
+            )
+        except (AttributeError, KeyError, TypeError, ValueError, re.error):
+            return None
+
+    def _read(self, entry_name: str) -> Union[Dict[str, Any], None]:
+        if self._cache_path is None:
+            return None
+
+        try:
+            with open(self._cache_path.joinpath(f"{entry_name}.json"), "r") as infile:
+                return json.load(infile)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, entry_name: str, entry: Dict[str, Any]) -> None:
+        if self._cache_path is None:
+            return None
+
+        path = self._cache_path.joinpath(f"{entry_name}.json")
+        temporary_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self._cache_path.mkdir(parents=True, exist_ok=True)
+            with open(temporary_path, "w") as outfile:
+                json.dump(entry, outfile)
+            os.replace(temporary_path, path)
+        except (OSError, TypeError, ValueError):
+            try:
+                temporary_path.unlink()
+            except OSError:
+                ...
+
+
+grammar_loader = GrammarLoader()
+
+
+def load_grammar(name: str, build: Callable[[Dict[str, Any]], PatternSources] = None) -> Grammar:
+    return grammar_loader.load(name, build)
+
+
+def compile_pattern(source: str, flags: int = 0) -> Pattern:
+    return grammar_loader.compile(source, flags)
+
+
+__all__ = [
+    "GRAMMARS_PATH",
+    "Grammar",
+    "GrammarLoader",
+    "compile_pattern",
+    "grammar_loader",
+    "load_grammar",
+]
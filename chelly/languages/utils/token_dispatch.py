@@ -0,0 +1,146 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Pattern, Tuple, Union
+
+#: (start, length, format key)
+FormatRun = Tuple[int, int, str]
+
+
+@dataclass(frozen=True)
+class BlockTokens:
+    """Highlighting result of a single line, independent of any QTextBlock"""
+
+    runs: Tuple[FormatRun, ...]
+    state: int = 0
+    data: Dict[str, Any] = field(default_factory=dict, compare=False)
+
+
+def push_run(runs: List[list], start: int, end: int, kind: str) -> None:
+    """
+    Appends the [start, end) run, runs written later win over the ones they
+    overlap, like consecutive ``setFormat`` calls do.
+    """
+    if start >= end:
+        return None
+
+    covered = []
+    while runs and runs[-1][1] > start:
+        covered.append(runs.pop())
+
+    if covered and covered[-1][0] < start:
+        runs.append([covered[-1][0], start, covered[-1][2]])
+
+    runs.append([start, end, kind])
+
+    for run_start, run_end, run_kind in reversed(covered):
+        if run_end > end:
+            runs.append([max(run_start, end), run_end, run_kind])
+
+
+def merge_runs(
+    runs: List[list], length: int, default_kind: str = "normal"
+) -> Tuple[FormatRun, ...]:
+    """
+    Returns the runs as (start, length, kind) tuples covering the whole line,
+    gaps take the default kind and adjacent runs of the same kind are merged.
+    """
+    if not runs:
+        return ((0, length, default_kind),) if length else ()
+
+    merged = []
+    append = merged.append
+    # the run being merged, not appended yet
+    run_start = run_end = 0
+    run_kind = default_kind
+
+    for start, end, kind in runs:
+        if start > run_end:
+            if run_kind != default_kind:
+                append((run_start, run_end - run_start, run_kind))
+                run_start, run_kind = run_end, default_kind
+            run_end = start
+
+        if kind == run_kind and run_end == start:
+            run_end = end
+        else:
+            if run_end > run_start:
+                append((run_start, run_end - run_start, run_kind))
+            run_start, run_end, run_kind = start, end, kind
+
+    if run_end < length:
+        if run_kind != default_kind:
+            append((run_start, run_end - run_start, run_kind))
+            run_start, run_kind = run_end, default_kind
+        run_end = length
+
+    if run_end > run_start:
+        append((run_start, run_end - run_start, run_kind))
+    return tuple(merged)
+
+
+class TokenDispatcher:
+    """
+    Runs one master pattern over a line and dispatches every match through
+    ``match.lastindex`` to a handler table, instead of scanning the whole
+    ``groupdict`` to find the group that fired. The top level alternatives of
+    the pattern must end with their named group, it is the last one closed.
+
+    A handler is either the format key of the group or a callable
+    ``handler(context, match, start, end, runs)`` that pushes its own runs,
+    the span is already shifted by the offset and may end up empty.
+    Groups without a handler are ignored.
+    """
+
+    def __init__(
+        self,
+        pattern: Union[str, Pattern],
+        handlers: Dict[str, Union[str, Callable]],
+        default_kind: str = "normal",
+        flags: int = re.S,
+    ) -> None:
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern, flags)
+
+        self.pattern: Pattern = pattern
+        self.handlers = dict(handlers)
+        self.default_kind = default_kind
+
+        # handler of every group number, None for the groups without one
+        self._table: List[Union[str, Callable, None]] = [None] * (pattern.groups + 1)
+        for group, index in pattern.groupindex.items():
+            self._table[index] = self.handlers.get(group)
+
+    def dispatch(self, text: str, context: Any = None, offset: int = 0) -> List[list]:
+        """Returns the raw [start, end, kind] runs of the matched tokens"""
+        runs = []
+        table = self._table
+
+        for match in self.pattern.finditer(text):
+            index = match.lastindex
+            handler = table[index]
+            if handler is None:
+                continue
+
+            start, end = match.span(index)
+            if start >= end:
+                continue
+            if offset:
+                start = max(0, start + offset)
+                end = max(0, end + offset)
+
+            if handler.__class__ is not str:
+                handler(context, match, start, end, runs)
+            elif runs and runs[-1][1] > start:
+                push_run(runs, start, end, handler)
+            elif start < end:
+                runs.append([start, end, handler])
+
+        return runs
+
+    def tokenize(self, text: str, context: Any = None, offset: int = 0) -> Tuple[FormatRun, ...]:
+        """Returns the merged runs covering the whole line"""
+        runs = self.dispatch(text, context, offset)
+        return merge_runs(runs, len(text) + offset, self.default_kind)
+
+
+__all__ = ["BlockTokens", "FormatRun", "TokenDispatcher", "merge_runs", "push_run"]
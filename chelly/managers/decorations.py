@@ -10,6 +10,8 @@ class TextDecorationsManager(Manager):
     def __init__(self, editor):
         super().__init__(editor)
         self._decorations = []
+        #: changes on every append, remove or clear
+        self.version = 0
 
     def append(self, decoration):
         """
@@ -23,6 +25,7 @@ class TextDecorationsManager(Manager):
                 self._decorations, key=lambda sel: sel.draw_order
             )
             self.editor.setExtraSelections(self._decorations)
+            self.version += 1
             return True
         return False
 
@@ -35,6 +38,7 @@ class TextDecorationsManager(Manager):
         try:
             self._decorations.remove(decoration)
             self.editor.setExtraSelections(self._decorations)
+            self.version += 1
             return True
         except ValueError:
             return False
@@ -44,6 +48,7 @@ class TextDecorationsManager(Manager):
         Removes all text decoration from the editor.
         """
         self._decorations[:] = []
+        self.version += 1
         try:
             self.editor.setExtraSelections(self._decorations)
         except RuntimeError:
@@ -42,6 +42,7 @@ class FeaturesManager(Manager):
             mode = feature
 
         self._features[mode.__class__.__name__] = mode
+        self.editor.profiler.attach(mode)
         return mode
 
     def get(self, mode: Feature):
@@ -1,5 +1,5 @@
 from typing import Any
-from ..core import Manager, Language
+from ..core import ColorScheme, Manager, Language
 from pygments.style import Style
 from dataclasses import dataclass
 
@@ -56,7 +56,14 @@ class LanguagesManager(Manager):
     def lexer(self, arg: dict) -> None:
         lexer_object = self.get_lexer_from_any(arg)
 
-        if callable(lexer_object.language):
+        if (
+            callable(lexer_object.language)
+            and type(self.__lexer) is lexer_object.language
+            and lexer_object.style is not None
+        ):
+            # same language with another style, the blocks keep their tokens
+            self.__lexer.color_scheme = ColorScheme.from_style(lexer_object.style)
+        elif callable(lexer_object.language):
             self.__lexer = lexer_object.language(self.editor, lexer_object.style)
         else:
             self.__lexer = lexer_object.language
@@ -8,12 +8,58 @@ from .size_helpers import PanelsSizeHelpers
 class PanelsManager(PanelsSizeHelpers):
     def __init__(self, editor) -> None:
         super().__init__(editor)
+        self._damage_tracking = True
+        self._cached_revision = -1
+        self._cached_line = -1
+        self._cached_decorations = -1
+        self._cached_block_count = -1
+        self._cursor_lines = ()
+        # first and last block edited since the previous update
+        self._edited_blocks = None
+        self._document = None
         self.bind()
 
+    @property
+    def damage_tracking(self) -> bool:
+        """
+        Repaints a side panel only when something it depends on changed, and
+        only the rows involved. Disabled, every side panel repaints the whole
+        updated rect.
+        """
+        return self._damage_tracking
+
+    @damage_tracking.setter
+    def damage_tracking(self, value: bool) -> None:
+        self._damage_tracking = value
+
     def bind(self):
         self.editor.blockCountChanged[int].connect(self.update_viewport_margins)
         self.editor.updateRequest[QRect, int].connect(self.update)
         self.editor.on_resized.connect(self.refresh)
+        self._attach(self.editor.document())
+
+    def _attach(self, document) -> None:
+        if self._document is not None:
+            try:
+                self._document.contentsChange.disconnect(self._on_contents_change)
+            except (RuntimeError, TypeError):
+                ...
+        self._document = document
+        document.contentsChange.connect(self._on_contents_change)
+        self._edited_blocks = None
+        self._cached_block_count = -1
+
+    def _on_contents_change(self, position: int, removed: int, added: int) -> None:
+        document = self._document
+        first = document.findBlock(position).blockNumber()
+        last = document.findBlock(position + added).blockNumber()
+        if last < first:
+            last = document.blockCount() - 1
+
+        if self._edited_blocks is not None:
+            first = min(first, self._edited_blocks[0])
+            last = max(last, self._edited_blocks[1])
+        self._edited_blocks = (first, last)
 
     def _call_panel(self, panel: Panel) -> Union[None, Panel]:
         if callable(panel):
@@ -37,6 +83,7 @@ class PanelsManager(PanelsSizeHelpers):
             widget_name = widget.__class__.__name__
             self._widgets[zone][widget_name] = widget
             self._settings[widget_name] = settings
+            self.editor.profiler.attach(widget)
             return widget
 
         # make it like a singleton
@@ -83,6 +130,115 @@ class PanelsManager(PanelsSizeHelpers):
         self, rect: object, delta_y: int, force_update_margins: bool = False
     ) -> None:
         """Updates panels"""
+        if self._damage_tracking:
+            self._update_damaged(rect, delta_y)
+        else:
+            self._update_all(rect, delta_y)
+
+        if rect.contains(self.editor.viewport().rect()) or force_update_margins:
+            self.update_viewport_margins()
+
+    def _damage(self, delta_y: int) -> dict:
+        """
+        What changed since the previous update, each change maps to the
+        (first, last) lines to repaint, None for the whole updated rect
+        """
+        editor = self.editor
+        document = editor.document()
+        if document is not self._document:
+            self._attach(document)
+
+        damage = {Panel.Dependencies.VIEWPORT: None}
+        if delta_y:
+            damage[Panel.Dependencies.SCROLL] = None
+
+        revision = document.revision()
+        block_count = document.blockCount()
+        # setPlainText() resets the revision, the block count tells it apart
+        if revision != self._cached_revision or block_count != self._cached_block_count:
+            self._cached_revision = revision
+            if self._edited_blocks is None or self._cached_block_count < 0:
+                damage[Panel.Dependencies.DOCUMENT] = None
+            elif block_count == self._cached_block_count:
+                first, last = self._edited_blocks
+                damage[Panel.Dependencies.DOCUMENT] = [(first, last)]
+            else:
+                # the following lines moved
+                damage[Panel.Dependencies.DOCUMENT] = [
+                    (self._edited_blocks[0], block_count)
+                ]
+        self._cached_block_count = block_count
+        self._edited_blocks = None
+
+        decorations = getattr(editor.decorations, "version", 0)
+        if decorations != self._cached_decorations:
+            self._cached_decorations = decorations
+            damage[Panel.Dependencies.DECORATIONS] = None
+
+        line = editor.textCursor().blockNumber()
+        if line != self._cached_line:
+            previous_line, self._cached_line = self._cached_line, line
+            damage[Panel.Dependencies.CURSOR_LINE] = [
+                (previous_line, previous_line),
+                (line, line),
+            ]
+        return damage
+
+    def _line_rows(self, first: int, last: int) -> List[QRect]:
+        rows = []
+        for top, block_number, block in self.editor.visible_blocks:
+            if first <= block_number <= last:
+                height = int(self.editor.blockBoundingRect(block).height())
+                rows.append(QRect(0, top, 0, height))
+        return rows
+
+    def _update_damaged(self, rect: QRect, delta_y: int) -> None:
+        damage = self._damage(delta_y)
+
+        for zones_id, zone in self._widgets.items():
+            if zones_id == Panel.Position.TOP or zones_id == Panel.Position.BOTTOM:
+                continue
+
+            for panel in list(zone.values()):
+                dependencies = panel.dependencies
+                changes = [flag for flag in damage if flag & dependencies]
+                if not changes:
+                    continue
+
+                if delta_y and panel.scrollable and dependencies & Panel.Dependencies.SCROLL:
+                    # blits an opaque panel, only the exposed strip is
+                    # repainted, the viewport rect is the scrolled area
+                    panel.scroll(0, delta_y)
+                    changes = [
+                        flag
+                        for flag in changes
+                        if flag
+                        not in (Panel.Dependencies.SCROLL, Panel.Dependencies.VIEWPORT)
+                    ]
+
+                lines = []
+                for flag in changes:
+                    if damage[flag] is None:
+                        lines = None
+                        break
+                    lines.extend(damage[flag])
+
+                if lines is None:
+                    if panel.backing_store:
+                        if delta_y:
+                            panel.invalidate_rows()
+                        else:
+                            panel.invalidate_rect(rect)
+                    panel.update(0, rect.y(), panel.width(), rect.height())
+                    continue
+
+                for first, last in lines:
+                    if panel.backing_store:
+                        panel.invalidate_rows(first, last)
+                    for row in self._line_rows(first, last):
+                        panel.update(0, row.y(), panel.width(), row.height())
+
+    def _update_all(self, rect: QRect, delta_y: int) -> None:
         helper = TextEngine(self.editor)
 
         for zones_id, zone in self._widgets.items():
@@ -98,12 +254,11 @@ class PanelsManager(PanelsSizeHelpers):
                 cached_line, cached_column = self._cached_cursor_pos
 
                 if line != cached_line or col != cached_column or panel.scrollable:
+                    if panel.backing_store:
+                        panel.invalidate_rect(rect)
                     panel.update(0, rect.y(), panel.width(), rect.height())
                 self._cached_cursor_pos = helper.cursor_position
 
-        if rect.contains(self.editor.viewport().rect()) or force_update_margins:
-            self.update_viewport_margins()
-
     def update_viewport_margins(self) -> None:
         """Update viewport margins"""
         top = self._viewport_margin(Panel.Position.TOP)
@@ -0,0 +1,338 @@
+"""
+Headless keystroke to paint latency harness.
+
+Builds a ChellyEditor with a feature and panel set like the one of
+latest.py, replays synthetic key events and measures the time from the key
+press to the end of the following editor paint, for each scenario, document
+size and feature toggle. The results are written as JSON.
+
+Examples:
+    $ python dev/latency.py --sizes 1000 10000 --output latency.json
+    $ python dev/latency.py --toggle SymbolMatcher --toggle AutoComplete
+    $ python dev/latency.py --baseline latency.json --tolerance 0.25
+"""
+
+import sys
+
+sys.dont_write_bytecode = True
+
+import argparse
+import json
+import os
+import platform
+import statistics
+from time import perf_counter
+
+os.environ.setdefault("QT_API", "pyside6")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from pygments.styles.monokai import MonokaiStyle
+from qtpy import QtCore
+from qtpy.QtCore import QEvent, Qt
+from qtpy.QtGui import QKeyEvent, QTextCursor
+from qtpy.QtWidgets import QApplication
+
+from chelly import components, features
+from chelly.api import ChellyEditor
+from chelly.core import Panel
+from chelly.internal import ChellyQThreadManager
+from chelly.languages import PythonLanguage
+
+DEFAULT_FEATURES = [
+    "CaretLineHighLighter",
+    "IndentationGuides",
+    "AutoIndent",
+    "CursorHistory",
+    "SmartBackSpace",
+    "IndentationMarks",
+    "EdgeLine",
+    "AutoComplete",
+    "SymbolMatcher",
+]
+DEFAULT_PANELS = [
+    "MarkerMargin",
+    "LineNumberMargin",
+    "EditionMargin",
+    "VerticalScrollBar",
+    "MiniMap",
+]
+PANEL_ZONES = {"VerticalScrollBar": Panel.Position.RIGHT, "MiniMap": Panel.Position.RIGHT}
+
+#: scenario -> keys of one sample, as (key, text)
+SCENARIOS = {
+    "typing": [(Qt.Key_A, "a")],
+    "enter": [(Qt.Key_Return, "\r")],
+    "brackets": [(Qt.Key_ParenLeft, "(")],
+    "backspace": [(Qt.Key_Backspace, "")],
+}
+
+#: text put on the edited line before each scenario
+SCENARIO_LINES = {
+    "typing": "value = ",
+    "enter": "    if value:",
+    "brackets": "    call",
+    "backspace": "        ",
+}
+
+#: seconds waited for the paint following a key press
+PAINT_TIMEOUT = 5.0
+
+
+def corpus(lines: int) -> str:
+    """Python source of the given number of lines, made of the chelly sources"""
+    root = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "chelly")
+    source = []
+    for folder, _, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            if name.endswith(".py"):
+                with open(os.path.join(folder, name), "r", encoding="utf-8") as infile:
+                    source.extend(infile.read().splitlines())
+
+    text = []
+    while len(text) < lines:
+        text.extend(source[: lines - len(text)])
+    return "\n".join(text)
+
+
+class LatencyProbe:
+    """Measures the time from a key press to the end of the next editor paint"""
+
+    def __init__(self, app: QApplication, editor: ChellyEditor):
+        self._app = app
+        self._editor = editor
+        self._painted = None
+        # connected last, runs after the paint handlers of the features
+        editor.on_painted.connect(self._on_painted)
+
+    def _on_painted(self, *args) -> None:
+        self._painted = perf_counter()
+
+    def press(self, key: int, text: str) -> float:
+        editor = self._editor
+        self._painted = None
+
+        start = perf_counter()
+        self._app.sendEvent(editor, QKeyEvent(QEvent.KeyPress, key, Qt.NoModifier, text))
+        self._app.sendEvent(editor, QKeyEvent(QEvent.KeyRelease, key, Qt.NoModifier, text))
+
+        while self._painted is None and perf_counter() - start < PAINT_TIMEOUT:
+            self._app.processEvents(QtCore.QEventLoop.AllEvents, 50)
+        if self._painted is None:
+            raise TimeoutError("the editor was not painted after the key press")
+        return self._painted - start
+
+
+def build_editor(text: str, feature_names: list, panel_names: list) -> ChellyEditor:
+    editor = ChellyEditor(None)
+    editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    for name in feature_names:
+        editor.features.append(getattr(features, name))
+    for name in panel_names:
+        panel = editor.panels.append(
+            getattr(components, name), PANEL_ZONES.get(name, Panel.Position.LEFT)
+        )
+        panel.show()
+
+    editor.properties.text = text
+    editor.resize(1000, 800)
+    editor.show()
+    return editor
+
+
+def prepare_line(editor: ChellyEditor, text: str) -> None:
+    """Opens a new line with the text in the middle of the document"""
+    document = editor.document()
+    cursor = QTextCursor(document.findBlockByNumber(document.blockCount() // 2))
+    cursor.movePosition(QTextCursor.EndOfBlock)
+    cursor.insertText("\n" + text)
+    editor.setTextCursor(cursor)
+    editor.centerCursor()
+
+
+def distribution(samples: list) -> dict:
+    """Sample statistics in milliseconds"""
+    ordered = sorted(samples)
+
+    def percentile(percent: float) -> float:
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index] * 1e3
+
+    return {
+        "samples": len(ordered),
+        "min": ordered[0] * 1e3,
+        "mean": statistics.mean(ordered) * 1e3,
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": ordered[-1] * 1e3,
+    }
+
+
+def run(
+    app: QApplication,
+    sizes: list,
+    keystrokes: int,
+    feature_names: list,
+    panel_names: list,
+    toggles: list,
+    scenarios: list,
+    warmup: int = 3,
+) -> dict:
+    """Runs every scenario for every size and configuration, returns the report"""
+    # configuration name -> features
+    configurations = {"all": feature_names}
+    for toggled in toggles:
+        configurations[f"-{toggled}"] = [name for name in feature_names if name != toggled]
+
+    results = []
+    for size in sizes:
+        text = corpus(size)
+        for configuration, enabled_features in configurations.items():
+            editor = build_editor(text, enabled_features, panel_names)
+            app.processEvents()
+            probe = LatencyProbe(app, editor)
+
+            for scenario in scenarios:
+                prepare_line(editor, SCENARIO_LINES[scenario])
+                app.processEvents()
+
+                samples = []
+                for index in range(warmup + keystrokes):
+                    if scenario == "backspace" and not editor.textCursor().block().text():
+                        # keep an indentation to delete
+                        editor.textCursor().insertText(SCENARIO_LINES[scenario])
+                        app.processEvents()
+
+                    for key, key_text in SCENARIOS[scenario]:
+                        latency = probe.press(key, key_text)
+                        if index >= warmup:
+                            samples.append(latency)
+
+                results.append(
+                    {
+                        "scenario": scenario,
+                        "lines": size,
+                        "configuration": configuration,
+                        "features": enabled_features,
+                        "panels": panel_names,
+                        **distribution(samples),
+                    }
+                )
+
+            editor.close()
+            editor.deleteLater()
+            app.sendPostedEvents(None, QEvent.DeferredDelete)
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "qt": QtCore.qVersion(),
+            "qt_api": os.environ.get("QT_API"),
+            "platform": app.platformName(),
+            "machine": platform.machine(),
+        },
+        "unit": "ms",
+        "results": results,
+    }
+
+
+def report(results: dict) -> str:
+    lines = [
+        f"{'scenario':<10} {'lines':>7} {'configuration':<24} "
+        f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    ]
+    for entry in results["results"]:
+        lines.append(
+            f"{entry['scenario']:<10} {entry['lines']:>7} {entry['configuration']:<24} "
+            f"{entry['p50']:>8.3f} {entry['p95']:>8.3f} {entry['p99']:>8.3f} "
+            f"{entry['max']:>8.3f}"
+        )
+    return "\n".join(lines)
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Results whose p95 is above the one of the baseline by more than the tolerance"""
+    reference = {
+        (entry["scenario"], entry["lines"], entry["configuration"]): entry["p95"]
+        for entry in baseline["results"]
+    }
+    slower = []
+    for entry in results["results"]:
+        p95 = reference.get((entry["scenario"], entry["lines"], entry["configuration"]))
+        if p95 is not None and entry["p95"] > p95 * (1 + tolerance):
+            slower.append({**entry, "baseline_p95": p95})
+    return slower
+
+
+def parse_arguments(arguments: list) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--keystrokes", type=int, default=50, help="samples per scenario")
+    parser.add_argument("--features", nargs="*", default=DEFAULT_FEATURES)
+    parser.add_argument("--panels", nargs="*", default=DEFAULT_PANELS)
+    parser.add_argument(
+        "--toggle",
+        action="append",
+        default=[],
+        help="also measure without this feature, 'each' toggles every feature",
+    )
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS)
+    )
+    parser.add_argument("--output", help="JSON file, standard output by default")
+    parser.add_argument("--baseline", help="JSON file of a previous run to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="p95 increase over the baseline failing the run",
+    )
+    return parser.parse_args(arguments)
+
+
+def main(arguments: list = None) -> int:
+    options = parse_arguments(sys.argv[1:] if arguments is None else arguments)
+    toggles = options.toggle
+    if "each" in toggles:
+        toggles = list(options.features)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    ChellyQThreadManager(app)
+    results = run(
+        app,
+        options.sizes,
+        options.keystrokes,
+        options.features,
+        options.panels,
+        toggles,
+        options.scenarios,
+    )
+    # the event loop is not run, the threads of the panels and the
+    # highlighters are stopped as when the application quits
+    app.aboutToQuit.emit()
+
+    print(report(results), file=sys.stderr)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as outfile:
+            json.dump(results, outfile, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+    if options.baseline:
+        with open(options.baseline, "r", encoding="utf-8") as infile:
+            slower = regressions(results, json.load(infile), options.tolerance)
+        for entry in slower:
+            print(
+                f"regression: {entry['scenario']} {entry['lines']} lines "
+                f"{entry['configuration']} p95 {entry['p95']:.3f}ms, "
+                f"was {entry['baseline_p95']:.3f}ms",
+                file=sys.stderr,
+            )
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
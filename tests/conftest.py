@@ -0,0 +1,17 @@
+import os
+import shutil
+import tempfile
+
+
+def pytest_configure(config):
+    # the grammar cache is written when the test modules are imported, it
+    # goes to a temporary folder instead of the cache of the user
+    cache_path = tempfile.mkdtemp(prefix="chelly-cache-")
+    config._chelly_cache_path = cache_path
+    os.environ["CHELLY_CACHE_DIR"] = cache_path
+
+
+def pytest_unconfigure(config):
+    cache_path = getattr(config, "_chelly_cache_path", None)
+    if cache_path is not None:
+        shutil.rmtree(cache_path, ignore_errors=True)
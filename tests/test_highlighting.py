@@ -0,0 +1,518 @@
+import sys
+
+sys.dont_write_bytecode = True
+
+import json
+import os
+
+# Setup path
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+import pytest
+from latest import *
+
+
+def _python_corpus(copies: int) -> str:
+    with open(os.path.join(parent, "chelly", "languages", "python.py"), "r") as infile:
+        return "\n".join([infile.read()] * copies)
+
+
+def test_progressive_highlighting(benchmark):
+    progressive_editor = ChellyEditor(div)
+    progressive_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    lexer = progressive_editor.language.lexer
+    lexer.progressive = True
+
+    content = _python_corpus(40)
+    benchmark.pedantic(
+        setattr, args=(progressive_editor.properties, "text", content), rounds=3
+    )
+    assert lexer.is_highlighting
+
+    while lexer.is_highlighting:
+        app.processEvents()
+
+    last_block = progressive_editor.document().lastBlock().previous()
+    assert last_block.layout().formats()
+
+
+def _tokenize_lines(tokenizer, lines):
+    state = 0
+    tokens = 0
+    for line in lines:
+        block_tokens = tokenizer.tokenize(line, state)
+        state = block_tokens.state
+        tokens += len(block_tokens.runs)
+    return tokens
+
+
+def _record_throughput(benchmark, tokens):
+    benchmark.extra_info["tokens"] = tokens
+    # there are no statistics with --benchmark-disable
+    if benchmark.stats is not None:
+        benchmark.extra_info["tokens_per_second"] = tokens / benchmark.stats["mean"]
+
+
+def test_python_tokenizer_throughput(benchmark):
+    from chelly.languages.python import PythonSH
+
+    tokenizer = PythonSH.TOKENIZER
+    lines = _python_corpus(20).splitlines()
+
+    benchmark.group = "tokenizer"
+    tokens = benchmark(_tokenize_lines, tokenizer, lines)
+    _record_throughput(benchmark, tokens)
+
+    block_tokens = tokenizer.tokenize("    def __init__(self):")
+    assert block_tokens.runs == (
+        (0, 4, "normal"),
+        (4, 3, "keyword"),
+        (7, 1, "normal"),
+        (8, 8, "constant"),
+        (16, 1, "normal"),
+        (17, 4, "self"),
+        (21, 2, "normal"),
+    )
+
+    block_tokens = tokenizer.tokenize('x = """doc')
+    assert block_tokens.state == tokenizer.INSIDE_DQ3STRING
+    assert tokenizer.tokenize('end"""', block_tokens.state).runs == (
+        (0, 6, "docstring"),
+    )
+
+
+def _groupdict_tokenize_lines(lines):
+    """
+    The per-pattern loop of PythonSH before the TokenDispatcher, making the
+    same BlockTokens to compare the group lookups only
+    """
+    from chelly.languages.python import PythonSH
+    from chelly.languages.utils import BlockTokens, merge_runs, push_run
+
+    prefixes = {
+        PythonSH.INSIDE_DQ3STRING: '""" ',
+        PythonSH.INSIDE_SQ3STRING: "''' ",
+        PythonSH.INSIDE_DQSTRING: '" ',
+        PythonSH.INSIDE_SQSTRING: "' ",
+    }
+    unfinished = {
+        "uf_sq3string": PythonSH.INSIDE_SQ3STRING,
+        "uf_dq3string": PythonSH.INSIDE_DQ3STRING,
+        "uf_sqstring": PythonSH.INSIDE_SQSTRING,
+        "uf_dqstring": PythonSH.INSIDE_DQSTRING,
+    }
+    state = PythonSH.NORMAL
+    tokens = 0
+    for text in lines:
+        prefix = prefixes.get(state, "")
+        offset = -len(prefix)
+        length = len(text)
+        text = prefix + text
+        runs = []
+
+        state = PythonSH.NORMAL
+        match = PythonSH.PROG.search(text)
+        while match:
+            for key, value in list(match.groupdict().items()):
+                if value:
+                    start, end = match.span(key)
+                    start = max([0, start + offset])
+                    end = max([0, end + offset])
+                    state = unfinished.get(key, state)
+                    if key in unfinished:
+                        kind = "docstring" if "3" in key else "string"
+                    elif key == "builtin_fct":
+                        kind = "constant"
+                    elif ('"""' in value or "'''" in value) and key != "comment":
+                        kind = "docstring"
+                    elif value in ["self", "cls"]:
+                        kind = "self"
+                    else:
+                        kind = key
+                    push_run(runs, start, end, kind)
+                    if key == "keyword" and value in ("def", "class"):
+                        match1 = PythonSH.IDPROG.match(text, end)
+                        if match1:
+                            start1, end1 = match1.span(1)
+                            push_run(runs, start1, end1, "function")
+                    if key == "namespace":
+                        endpos = text.index("#") if "#" in text else len(text)
+                        while True:
+                            match1 = PythonSH.ASPROG.match(text, end, endpos)
+                            if not match1:
+                                break
+                            start, end = match1.span(1)
+                            push_run(runs, start, end, "namespace")
+            match = PythonSH.PROG.search(text, match.end())
+        tokens += len(BlockTokens(merge_runs(runs, length), state).runs)
+    return tokens
+
+
+def test_python_tokenizer_groupdict_baseline(benchmark):
+    # the loop replaced by the TokenDispatcher, for the tokens/s before
+    lines = _python_corpus(20).splitlines()
+
+    benchmark.group = "tokenizer"
+    tokens = benchmark(_groupdict_tokenize_lines, lines)
+    _record_throughput(benchmark, tokens)
+
+
+def test_shared_token_cache(benchmark):
+    cache = PythonLanguage.shared_token_cache()
+    content = _python_corpus(2)
+
+    first_editor = ChellyEditor(div)
+    first_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    first_editor.properties.text = content
+    assert len(cache) > 0
+
+    second_editor = ChellyEditor(div)
+    second_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    assert second_editor.language.lexer.token_cache is cache
+
+    cache.reset_counters()
+    benchmark.pedantic(
+        setattr, args=(second_editor.properties, "text", content), rounds=3
+    )
+    benchmark.extra_info["hit_rate"] = cache.hit_rate
+    assert cache.misses == 0 and cache.hits > 0
+    assert (
+        second_editor.document().lastBlock().layout().formats()
+        == first_editor.document().lastBlock().layout().formats()
+    )
+
+
+def test_background_highlighting(benchmark):
+    content = _python_corpus(40)
+
+    background_editor = ChellyEditor(div)
+    background_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    lexer = background_editor.language.lexer
+    lexer.background = True
+    assert lexer.progressive
+
+    benchmark.pedantic(
+        setattr, args=(background_editor.properties, "text", content), rounds=3
+    )
+
+    while lexer.is_highlighting:
+        app.processEvents()
+
+    sync_editor = ChellyEditor(div)
+    sync_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    sync_editor.properties.text = content
+
+    for block_number in (10, 5000, background_editor.blockCount() - 2):
+        background_block = background_editor.document().findBlockByNumber(block_number)
+        sync_block = sync_editor.document().findBlockByNumber(block_number)
+        assert background_block.layout().formats() == sync_block.layout().formats()
+        assert background_block.userState() == sync_block.userState()
+
+
+def test_background_thread_lifetime(benchmark):
+    from chelly.core import Language
+    from chelly.internal import ChellyQThreadManager
+
+    def background_editor():
+        thread_editor = ChellyEditor(div)
+        thread_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+        thread_editor.language.lexer.background = True
+        return thread_editor
+
+    # the threads killed by the thread manager are forgotten, a later editor
+    # gets a new one instead of the deleted one
+    background_editor()
+    ChellyQThreadManager(app).__kill__()
+    assert Language._background_thread is None
+
+    first_editor = background_editor()
+    second_editor = background_editor()
+    second_editor.language.lexer.semantic = True
+    thread = Language._background_thread
+    assert thread.isRunning() and Language._background_users == 3
+
+    first_editor.language.lexer.background = False
+    second_editor.language.lexer.semantic = False
+    assert Language._background_users == 1
+
+    # the last worker stops the thread
+    second_editor.deleteLater()
+    app.sendPostedEvents(None, QEvent.DeferredDelete)
+    assert Language._background_thread is None
+
+    lexer = first_editor.language.lexer
+
+    def toggle():
+        lexer.background = True
+        assert Language._background_thread.isRunning()
+        lexer.background = False
+
+    benchmark.pedantic(toggle, rounds=3)
+    assert Language._background_thread is None
+
+
+def test_import_and_docstring_index(benchmark):
+    from qtpy.QtGui import QTextCursor
+
+    index_editor = ChellyEditor(div)
+    index_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    lexer = index_editor.language.lexer
+    index_editor.properties.text = _python_corpus(4)
+
+    def indexed_imports():
+        return [number for number, _ in lexer.imports_in_range(0, index_editor.blockCount())]
+
+    def expected_imports():
+        return [
+            number
+            for number, line in enumerate(index_editor.toPlainText().split("\n"))
+            if line.lstrip().startswith(("import ", "from "))
+        ]
+
+    imports = expected_imports()
+    assert indexed_imports() == imports
+
+    cursor = QTextCursor(index_editor.document())
+    for _ in range(3):
+        cursor.insertText("x = 1\n")
+        cursor.insertText('"""docstring"""\n')
+    cursor.movePosition(QTextCursor.Down)
+    cursor.movePosition(QTextCursor.Down, QTextCursor.KeepAnchor, 6)
+    cursor.removeSelectedText()
+
+    assert indexed_imports() == expected_imports()
+    assert lexer.docstrings_in_range(0, 5) == [1, 3, 5]
+
+    benchmark(lexer.imports_in_range, 0, index_editor.blockCount())
+
+
+def _languages_import_time(
+    cache_path, modules: str = "chelly.languages, chelly.languages.sh.python_test"
+) -> float:
+    import subprocess
+
+    script = (
+        "import time, chelly.core;"
+        "start = time.perf_counter();"
+        f"import {modules};"
+        "print(time.perf_counter() - start)"
+    )
+    environment = dict(os.environ, CHELLY_CACHE_DIR=str(cache_path))
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=parent,
+        env=environment,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return float(output.split()[-1])
+
+
+def test_grammar_cache_import_time(benchmark, tmp_path):
+    from chelly.languages.utils.grammar_loader import GrammarLoader
+
+    # the cache is written by the first grammar load, not by the imports
+    _languages_import_time(tmp_path, "chelly.languages")
+    cache_path = tmp_path.joinpath("grammars")
+    assert not cache_path.exists()
+
+    benchmark.group = "import"
+    cold = _languages_import_time(tmp_path)
+    entry_paths = list(cache_path.glob("*.json"))
+    assert entry_paths
+
+    warm = benchmark.pedantic(_languages_import_time, args=(tmp_path,), rounds=3)
+    benchmark.extra_info["cold_import_seconds"] = cold
+    benchmark.extra_info["warm_import_seconds"] = warm
+
+    # an entry that does not compile is built again from the grammar file
+    for entry_path in entry_paths:
+        entry = json.loads(entry_path.read_text())
+        assert set(entry) == {"data", "sources"}
+        entry["sources"] = {"broken": ["(", 0]}
+        entry_path.write_text(json.dumps(entry))
+    grammar = GrammarLoader(cache_path).load("python")
+    assert grammar.data["static"]["keywords_list"] and grammar.patterns == {}
+    assert all(json.loads(path.read_text())["sources"] == {} for path in entry_paths)
+
+
+def test_grammar_engine_throughput(benchmark):
+    from chelly.languages.python import PythonGrammarSH
+
+    engine = PythonGrammarSH.engine()
+    lines = _python_corpus(20).splitlines()
+
+    benchmark.group = "tokenizer"
+    tokens = benchmark(_tokenize_lines, engine, lines)
+    _record_throughput(benchmark, tokens)
+
+    block_tokens = engine.tokenize("    def __init__(self):")
+    assert (4, 3, "keyword") in block_tokens.runs
+    assert (8, 8, "function") in block_tokens.runs
+    assert (17, 4, "self") in block_tokens.runs
+
+    block_tokens = engine.tokenize('x = """doc')
+    assert engine.stack(block_tokens.state)[-1] == "dq3string"
+    assert engine.tokenize('end"""', block_tokens.state).runs == ((0, 6, "docstring"),)
+
+    # out of state ids, the stacks fall back to an existing id
+    full = type(engine)(engine.grammar, engine.lists)
+    full.MAX_STATES = 2
+    assert full.state_id(("root", "dq3string")) == 1
+    assert full.state_id(("root", "sq3string")) == 0
+    assert full.state_id(("root", "sq3string", "dq3string")) == 1
+
+
+def test_javascript_highlighting():
+    js_editor = ChellyEditor(div)
+    js_editor.language.lexer = (JavaScriptLanguage, MonokaiStyle)
+    lexer = js_editor.language.lexer
+    engine = lexer.engine()
+    js_editor.properties.text = "/* multi\n   line */\nvar s = 'a\\\nb';\nconst x = 1;"
+
+    document = js_editor.document()
+    assert engine.stack(document.findBlockByNumber(0).userState())[-1] == "block_comment"
+    assert document.findBlockByNumber(1).userState() == 0
+    assert engine.stack(document.findBlockByNumber(2).userState())[-1] == "sqstring"
+    assert document.findBlockByNumber(4).layout().formats()
+
+
+def test_theme_switch_without_tokenizing(benchmark):
+    content = _python_corpus(40)
+
+    theme_editor = ChellyEditor(div)
+    theme_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    lexer = theme_editor.language.lexer
+    theme_editor.properties.text = content
+
+    styles = [DraculaStyle, MonokaiStyle]
+
+    def switch_theme():
+        styles.reverse()
+        theme_editor.language.lexer = (PythonLanguage, styles[0])
+
+    cache = lexer.token_cache
+    cache.reset_counters()
+    benchmark.pedantic(switch_theme, rounds=4)
+    assert theme_editor.language.lexer is lexer
+    assert cache.hits == cache.misses == 0
+
+    while lexer.is_highlighting:
+        app.processEvents()
+
+    fresh_editor = ChellyEditor(div)
+    fresh_editor.language.lexer = (PythonLanguage, styles[0])
+    fresh_editor.properties.text = content
+
+    for block_number in (0, 5000, theme_editor.blockCount() - 2):
+        theme_block = theme_editor.document().findBlockByNumber(block_number)
+        fresh_block = fresh_editor.document().findBlockByNumber(block_number)
+        assert theme_block.layout().formats() == fresh_block.layout().formats()
+
+
+def _resident_memory() -> int:
+    try:
+        with open("/proc/self/statm", "r") as infile:
+            return int(infile.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def test_shared_color_scheme_memory(benchmark):
+    import tracemalloc
+
+    editor_count = 50
+    editors = []
+
+    def open_editors():
+        for _ in range(editor_count):
+            tab_editor = ChellyEditor(div)
+            tab_editor.language.lexer = (PythonLanguage, ParaisoDarkStyle)
+            editors.append(tab_editor)
+
+    resident = _resident_memory()
+    tracemalloc.start()
+    benchmark.pedantic(open_editors, rounds=1)
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    benchmark.group = "memory"
+    benchmark.extra_info["editors"] = editor_count
+    benchmark.extra_info["python_bytes_per_editor"] = traced // editor_count
+    benchmark.extra_info["resident_bytes_per_editor"] = (
+        _resident_memory() - resident
+    ) // editor_count
+
+    color_schemes = {id(tab_editor.language.lexer.color_scheme) for tab_editor in editors}
+    assert len(color_schemes) == 1
+
+    from chelly.core import ColorScheme
+
+    dracula = ColorScheme.from_style(DraculaStyle)
+    paraiso = editors[0].language.lexer.color_scheme
+    assert paraiso is ColorScheme.from_style(ParaisoDarkStyle)
+    for color in dracula.brushes.keys() & paraiso.brushes.keys():
+        assert dracula.brushes[color] is paraiso.brushes[color]
+
+
+def test_semantic_highlighting(benchmark):
+    from chelly.languages.python_semantic import PythonSemanticAnalyzer
+
+    lines = _python_corpus(20).split("\n")
+    analyzer = PythonSemanticAnalyzer()
+    benchmark.group = "semantic"
+    benchmark.pedantic(analyzer.analyze, args=(lines,), rounds=1)
+    benchmark.extra_info["lines"] = len(lines)
+
+    # only the changed statement is parsed and analyzed again
+    segment = next(
+        (first, last)
+        for first, last, _nodes in analyzer._parsed_segments
+        if first <= 1000 <= last
+    )
+    lines[1000] += "  # edited"
+    tokens = analyzer.analyze(lines)
+    assert analyzer.analyzed == 1
+    assert analyzer.parsed_lines == segment[1] + 1 - segment[0]
+    assert tokens == PythonSemanticAnalyzer().analyze(lines)
+
+    # an unterminated string makes the boundaries ambiguous, all is parsed
+    lines.insert(1000, 'x = """')
+    analyzer.analyze(lines)
+    assert analyzer.parsed_lines > len(lines)
+    del lines[1000]
+    analyzer.analyze(lines)
+    assert analyzer.parsed_lines == len(lines)
+
+    semantic_editor = ChellyEditor(div)
+    semantic_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    lexer = semantic_editor.language.lexer
+    semantic_editor.properties.text = (
+        "class Point:\n"
+        "    def move(self, dx):\n"
+        "        step = dx\n"
+        "        return Point(self.x + step)\n"
+    )
+    lexer.semantic = True
+
+    while lexer._semantic_generation == 0:
+        app.processEvents()
+
+    def block_kinds(block_number):
+        block = semantic_editor.document().findBlockByNumber(block_number)
+        format_ranges = block.layout().formats()
+        return {
+            (format_range.start, format_range.length): lexer.color_scheme.kind_of(
+                format_range.format
+            )
+            for format_range in format_ranges
+        }
+
+    kinds = block_kinds(3)
+    assert kinds[(15, 5)] == "definition"
+    assert kinds[(26, 1)] == "name_attribute"
+    assert kinds[(30, 4)] == "name"
+    assert "instance" in block_kinds(1).values()
@@ -0,0 +1,638 @@
+import sys
+
+sys.dont_write_bytecode = True
+
+import json
+import os
+import time
+
+# Setup path
+current = os.path.dirname(os.path.realpath(__file__))
+parent = os.path.dirname(current)
+sys.path.append(parent)
+
+import pytest
+from latest import *
+from chelly.core import FontEngine, TextEngine
+from qtpy.QtGui import QFontMetricsF
+
+
+def _python_corpus(copies: int) -> str:
+    with open(os.path.join(parent, "chelly", "languages", "python.py"), "r") as infile:
+        return "\n".join([infile.read()] * copies)
+
+
+def _shown_editor(copies: int = 10) -> ChellyEditor:
+    shown_editor = ChellyEditor(None)
+    shown_editor.language.lexer = (PythonLanguage, MonokaiStyle)
+    shown_editor.properties.text = _python_corpus(copies)
+    shown_editor.resize(800, 1200)
+    shown_editor.show()
+    app.processEvents()
+    return shown_editor
+
+
+def _geometry(visible_blocks):
+    return [(top, block_number) for top, block_number, _ in visible_blocks]
+
+
+def test_visible_range_snapshot(benchmark):
+    range_editor = _shown_editor()
+    visible_range = range_editor.visible_range
+    snapshot = range_editor.visible_blocks
+    assert len(snapshot) > 10
+
+    def blink():
+        # the caret blinking only repaints the viewport
+        range_editor.viewport().repaint()
+
+    walks = visible_range.walks
+    benchmark(blink)
+    assert visible_range.walks == walks
+    assert range_editor.visible_blocks is snapshot
+
+    scroll_bar = range_editor.verticalScrollBar()
+    for value in (3, 5, 2, 40, 38):
+        scroll_bar.setValue(value)
+        app.processEvents()
+        shifted = range_editor.visible_blocks
+        assert shifted.first == value
+
+        visible_range.invalidate()
+        assert _geometry(range_editor.visible_blocks) == _geometry(shifted)
+
+    assert range_editor.visible_blocks.version > snapshot.version
+    range_editor.close()
+
+
+def test_overlay_compositor(benchmark):
+    overlay_editor = _shown_editor()
+    for feature in (ImageDrawer, IndentationMarks, IndentationGuides, EdgeLine):
+        overlay_editor.features.append(feature)
+
+    overlay_editor.features.get(EdgeLine).properties.position = 20
+    compositor = overlay_editor.overlays
+    assert [type(layer) for layer in compositor.layers] == [
+        ImageDrawer,
+        IndentationMarks,
+        IndentationGuides,
+        EdgeLine,
+    ]
+
+    viewport = overlay_editor.viewport()
+    benchmark.group = "overlays"
+    frames = compositor.frames
+    benchmark(viewport.repaint)
+    assert compositor.frames > frames
+    # nothing to draw for the image and the selection marks
+    assert set(compositor.layer_times) == {"IndentationGuides", "EdgeLine"}
+    benchmark.extra_info["overlay_seconds"] = compositor.frame_time
+
+    # a small repaint far from the edge line leaves it out
+    viewport.repaint(QRect(0, 0, 4, 4))
+    assert "EdgeLine" not in compositor.layer_times
+    overlay_editor.close()
+
+
+def test_indentation_guides_geometry(benchmark):
+    guides_editor = _shown_editor()
+    guides_editor.properties.indent_with_spaces = True
+    guides_editor.properties.indent_size = 4
+    guides = guides_editor.features.append(IndentationGuides)
+    compositor = guides_editor.overlays
+
+    guides_editor.verticalScrollBar().setValue(150)
+    app.processEvents()
+    geometry = compositor.geometry(QPaintEvent(guides_editor.viewport().rect()))
+
+    def expected_lines():
+        text_engine = TextEngine(guides_editor)
+        expected = []
+        for guide in guides.indentation_guides_for_spaces:
+            for level in range(guide.max_level):
+                rect = text_engine.cursor_rect(guide.line, level * 4, offset=0)
+                expected.append((rect.left(), rect.top(), rect.bottom()))
+        return sorted(expected)
+
+    def painted_lines():
+        lines, active_lines = guides.indentation_lines(geometry)
+        return sorted(
+            (int(line.x1()), int(line.y1()), int(line.y2()))
+            for line in lines + active_lines
+        )
+
+    assert painted_lines() and painted_lines() == expected_lines()
+
+    benchmark.group = "overlays"
+    benchmark(guides_editor.viewport().repaint)
+    benchmark.extra_info["guides_seconds"] = compositor.layer_times["IndentationGuides"]
+
+    # an edited line is measured again
+    top, block_number, block = geometry.visible_blocks[0]
+    cursor = QTextCursor(block)
+    cursor.insertText("    ")
+    geometry = compositor.geometry(QPaintEvent(guides_editor.viewport().rect()))
+    assert painted_lines() == expected_lines()
+    guides_editor.close()
+
+
+def test_line_number_margin_paint(benchmark):
+    numbers_editor = _shown_editor()
+    margin = numbers_editor.panels.append(LineNumberMargin, Panel.Position.LEFT)
+    margin.show()
+    numbers_editor.resize(800, numbers_editor.fontMetrics().height() * 300 + 40)
+    app.processEvents()
+    assert len(numbers_editor.visible_blocks) >= 300
+
+    benchmark.group = "panels"
+    benchmark(margin.repaint)
+    assert margin.painted_rows == len(numbers_editor.visible_blocks)
+
+    # the width fits the digits of the last line number
+    metrics = QFontMetrics(margin.font())
+    digit_width = (
+        metrics.horizontalAdvance("9")
+        + max(0, metrics.leftBearing("9"))
+        + max(0, metrics.rightBearing("9"))
+    )
+    digits = len(str(numbers_editor.blockCount()))
+    assert margin.line_number_area_width == digit_width * digits + 2
+
+    # moving the current line repaints the rows around it only
+    margin.painted_rows = 0
+    cursor = numbers_editor.textCursor()
+    cursor.movePosition(QTextCursor.Down)
+    numbers_editor.setTextCursor(cursor)
+    app.processEvents()
+    assert 0 < margin.painted_rows < 10
+    numbers_editor.close()
+
+
+def test_font_engine_cache(benchmark):
+    fonts_editor = _shown_editor()
+    margin = fonts_editor.panels.append(LineNumberMargin, Panel.Position.LEFT)
+    FontEngine.invalidate()
+    FontEngine.reset_statistics()
+
+    def size_hints():
+        for _ in range(100):
+            margin.sizeHint()
+
+    # the width is measured once for the font and the number of digits
+    margin.sizeHint()
+    statistics = FontEngine.statistics()
+    assert statistics["fonts"] == 1
+
+    benchmark.group = "fonts"
+    benchmark(size_hints)
+    assert FontEngine.statistics() == statistics
+    benchmark.extra_info.update(statistics)
+
+    # zooming forgets the measures of the previous font
+    font_key = fonts_editor.font().key()
+    fonts_editor.commands.zoom_in(2)
+    assert fonts_editor.font().key() != font_key
+    assert font_key not in FontEngine._fonts
+
+    # the width of the new font, a second call makes no metrics lookup
+    width = margin.line_number_area_width
+    assert width == FontEngine(margin.font()).real_horizontal_advance("9", True) * len(
+        str(fonts_editor.blockCount())
+    ) + 2
+
+    lookups = FontEngine.hits + FontEngine.misses
+    assert margin.line_number_area_width == width
+    assert FontEngine.hits + FontEngine.misses == lookups
+    fonts_editor.close()
+
+
+def test_panels_damage_tracking(benchmark):
+    damage_editor = _shown_editor()
+    margin = damage_editor.panels.append(LineNumberMargin, Panel.Position.LEFT)
+    margin.properties.background = QColor("#202020")
+    margin.show()
+    app.processEvents()
+    rows = len(damage_editor.visible_blocks)
+
+    def painted_rows(action):
+        margin.painted_rows = -1
+        action()
+        app.processEvents()
+        return margin.painted_rows
+
+    def move_cursor():
+        cursor = damage_editor.textCursor()
+        cursor.movePosition(QTextCursor.Down)
+        damage_editor.setTextCursor(cursor)
+
+    # the caret blinking leaves the margin alone
+    def blink():
+        # a caret sized repaint of the first row
+        damage_editor.updateRequest.emit(QRect(0, 0, 2, 20), 0)
+
+    assert painted_rows(blink) == -1
+    assert painted_rows(move_cursor) == 2
+    assert painted_rows(lambda: damage_editor.textCursor().insertText("x")) == 1
+    assert 1 < painted_rows(lambda: damage_editor.textCursor().insertText("\n")) < rows
+
+    scroll_bar = damage_editor.verticalScrollBar()
+
+    def scroll():
+        scroll_bar.setValue(scroll_bar.value() + 3)
+        app.processEvents()
+
+    # the margin is blitted, only the exposed rows are painted
+    assert painted_rows(scroll) <= 4
+
+    # a new color renders every row again, the scroll does not blit old rows
+    edition_margin = damage_editor.panels.append(EditionMargin, Panel.Position.LEFT)
+    edition_margin.show()
+    app.processEvents()
+    for panel, name, color in (
+        (margin, "foreground", QColor("#00FF00")),
+        (margin, "highlight", QColor("#FF00FF")),
+        (edition_margin, "added", QColor("#0000FF")),
+    ):
+        panel.painted_rows = -1
+        setattr(panel.properties, name, color)
+        scroll()
+        assert panel.painted_rows == len(damage_editor.visible_blocks)
+
+    benchmark.group = "panels"
+    benchmark(scroll)
+    benchmark.extra_info["exposed_rows"] = margin.painted_rows
+
+    damage_editor.panels.damage_tracking = False
+    assert painted_rows(blink) > 0
+    damage_editor.close()
+
+
+def test_panel_backing_store_scrolling(benchmark):
+    store_editor = _shown_editor(30)
+    store_editor.resize(800, store_editor.fontMetrics().height() * 300 + 40)
+    # a transparent margin is repainted whole by Qt on every scroll
+    margin = store_editor.panels.append(LineNumberMargin, Panel.Position.LEFT)
+    margin.show()
+    app.processEvents()
+    scroll_bar = store_editor.verticalScrollBar()
+
+    def scroll():
+        scroll_bar.setValue(scroll_bar.value() + 3)
+        app.processEvents()
+
+    def scroll_time(backing_store: bool) -> float:
+        margin.backing_store = backing_store
+        scroll_bar.setValue(0)
+        app.processEvents()
+        start = time.perf_counter()
+        for _ in range(20):
+            scroll()
+        return time.perf_counter() - start
+
+    direct_time = scroll_time(False)
+    assert margin.painted_rows > 100
+
+    store_time = scroll_time(True)
+    # only the rows exposed by the scroll are rendered
+    assert margin.painted_rows <= 4
+
+    benchmark.group = "panels"
+    benchmark(scroll)
+    benchmark.extra_info["direct_scroll_time"] = direct_time
+    benchmark.extra_info["backing_store_scroll_time"] = store_time
+    store_editor.close()
+
+
+def test_indentation_marks_visible_range(benchmark):
+    marks_editor = _shown_editor(100)
+    marks = marks_editor.features.append(IndentationMarks)
+    compositor = marks_editor.overlays
+    marks_editor.selectAll()
+    marks_editor.verticalScrollBar().setValue(1000)
+    app.processEvents()
+    geometry = compositor.geometry(QPaintEvent(marks_editor.viewport().rect()))
+
+    def expected_marks():
+        text_engine = TextEngine(marks_editor)
+        expected = []
+        for _, _, block in geometry.visible_blocks:
+            text = block.text()
+            for column, draw in enumerate(marks._choose_visible_whitespace(text)):
+                if draw:
+                    left = text_engine.cursor_rect(block, column, offset=0)
+                    right = text_engine.cursor_rect(block, column + 1, offset=0)
+                    middle = int((left.top() + left.bottom()) / 2)
+                    if text[column] == " ":
+                        expected.append((int((left.x() + right.x()) / 2), middle))
+                    else:
+                        expected.append((left.x() + 3, middle))
+        return sorted(expected)
+
+    def painted_marks():
+        dots, lines = marks.whitespace_marks(geometry)
+        return sorted(
+            [(dot.x(), dot.y()) for dot in dots]
+            + [(line.x1(), line.y1()) for line in lines]
+        )
+
+    # only the visible lines of the selection are marked
+    assert painted_marks() and painted_marks() == expected_marks()
+
+    benchmark.group = "overlays"
+    benchmark(marks_editor.viewport().repaint)
+    benchmark.extra_info["marks_seconds"] = compositor.layer_times["IndentationMarks"]
+
+    # without a selection the marks are painted only when asked
+    marks_editor.moveCursor(QTextCursor.End)
+    marks_editor.verticalScrollBar().setValue(1000)
+    app.processEvents()
+    geometry = compositor.geometry(QPaintEvent(marks_editor.viewport().rect()))
+    assert painted_marks() == []
+    marks_editor.properties.show_whitespaces = True
+    assert painted_marks() == expected_marks()
+    marks_editor.close()
+
+
+def test_frame_profiler(benchmark, tmp_path):
+    profiled_editor = _shown_editor()
+    for feature in (SymbolMatcher, CaretLineHighLighter, AutoComplete, IndentationGuides):
+        profiled_editor.features.append(feature)
+    profiler = profiled_editor.profiler
+
+    def type_text():
+        for key, text in ((Qt.Key_A, "a"), (Qt.Key_ParenLeft, "(")):
+            app.sendEvent(
+                profiled_editor, QKeyEvent(QEvent.KeyPress, key, Qt.NoModifier, text)
+            )
+        app.processEvents()
+
+    # disabled, nothing is recorded
+    type_text()
+    assert profiler.statistics() == {}
+
+    profiler.enabled = True
+    profiled_editor.features.append(SmartBackSpace)
+    benchmark.group = "profiler"
+    benchmark(type_text)
+
+    statistics = profiler.statistics()
+    assert {
+        "ChellyEditor.keyPressEvent",
+        "ChellyEditor.paintEvent",
+        "SymbolMatcher.do_symbols_matching",
+        "CaretLineHighLighter.refresh",
+        "AutoComplete._on_key_pressed",
+        "SmartBackSpace._on_key_pressed",
+        "IndentationGuides.paint_overlay",
+    } <= set(statistics)
+    matcher = statistics["SymbolMatcher.do_symbols_matching"]
+    assert matcher["category"] == "cursorPositionChanged"
+    assert matcher["p50"] <= matcher["p95"] <= matcher["p99"] <= matcher["max"]
+    benchmark.extra_info["report"] = profiler.report()
+
+    trace = tmp_path / "trace.json"
+    profiler.export_chrome_trace(str(trace))
+    events = json.loads(trace.read_text())["traceEvents"]
+    assert {"name", "cat", "ph", "ts", "dur", "pid", "tid"} <= set(events[0])
+
+    # the handlers are connected back
+    profiler.enabled = False
+    profiler.reset()
+    type_text()
+    assert profiler.statistics() == {}
+    profiled_editor.close()
+
+
+def test_keystroke_latency_harness(benchmark):
+    from dev import latency
+
+    def run():
+        return latency.run(
+            app,
+            sizes=[300],
+            keystrokes=3,
+            feature_names=["AutoIndent", "AutoComplete", "SmartBackSpace"],
+            panel_names=["LineNumberMargin"],
+            toggles=["AutoComplete"],
+            scenarios=list(latency.SCENARIOS),
+            warmup=1,
+        )
+
+    benchmark.group = "latency"
+    results = benchmark.pedantic(run, rounds=1, iterations=1)
+
+    entries = results["results"]
+    assert len(entries) == 2 * len(latency.SCENARIOS)
+    for entry in entries:
+        assert entry["lines"] == 300 and entry["samples"] == 3
+        assert 0 < entry["p50"] <= entry["p95"] <= entry["p99"] <= entry["max"]
+    assert {entry["configuration"] for entry in entries} == {"all", "-AutoComplete"}
+    json.dumps(results)
+
+    assert latency.regressions(results, results, 0.0) == []
+    faster = {"results": [dict(entry, p95=entry["p95"] / 2) for entry in entries]}
+    assert len(latency.regressions(results, faster, 0.5)) == len(entries)
+
+
+def test_keystroke_latency_script_exit_status(tmp_path):
+    import subprocess
+
+    # the default panels start threads, they are stopped before the exit
+    command = [
+        sys.executable,
+        os.path.join(parent, "dev", "latency.py"),
+        "--sizes", "300",
+        "--keystrokes", "2",
+        "--scenarios", "typing",
+        "--output", str(tmp_path / "latency.json"),
+    ]
+    environment = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    completed = subprocess.run(
+        command, cwd=parent, env=environment, capture_output=True, text=True
+    )
+    assert completed.returncode == 0, completed.stderr
+    assert json.loads((tmp_path / "latency.json").read_text())["results"]
+
+    command[-1] = str(tmp_path / "again.json")
+    command += ["--baseline", str(tmp_path / "latency.json"), "--tolerance", "100"]
+    completed = subprocess.run(
+        command, cwd=parent, env=environment, capture_output=True, text=True
+    )
+    assert completed.returncode == 0, completed.stderr
+
+
+def _resident_memory() -> float:
+    """Resident memory of the process in MiB, None where /proc is missing"""
+    try:
+        with open("/proc/self/statm", "r") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def test_raster_minimap(benchmark):
+    lines_per_copy = _python_corpus(1).count("\n") + 1
+    map_editor = _shown_editor(50000 // lines_per_copy + 1)
+    assert map_editor.document().blockCount() >= 50000
+
+    def switch(mode: int):
+        memory = _resident_memory()
+        start = time.perf_counter()
+        minimap.mode = mode
+        app.processEvents()
+        elapsed = time.perf_counter() - start
+        app.sendPostedEvents(None, QEvent.DeferredDelete)
+        if memory is not None:
+            memory = _resident_memory() - memory
+        return elapsed, memory
+
+    memory = _resident_memory()
+    start = time.perf_counter()
+    minimap = map_editor.panels.append(
+        MiniMap(map_editor, MiniMap.Mode.RASTER), Panel.Position.RIGHT
+    )
+    minimap.show()
+    app.processEvents()
+    benchmark.extra_info["raster_build_time"] = time.perf_counter() - start
+    if memory is not None:
+        benchmark.extra_info["raster_memory_mib"] = _resident_memory() - memory
+
+    # the zoomed out editor, for comparison
+    editor_time, editor_memory = switch(MiniMap.Mode.EDITOR)
+    assert minimap.chelly_editor is not None
+    benchmark.extra_info["editor_build_time"] = editor_time
+    benchmark.extra_info["editor_memory_mib"] = editor_memory
+    switch(MiniMap.Mode.RASTER)
+
+    raster = minimap.view
+    assert minimap.mode == MiniMap.Mode.RASTER and minimap.chelly_editor is None
+
+    def rendered_tiles():
+        while raster.is_rendering:
+            app.processEvents()
+        raster.repaint()
+        while raster.is_rendering:
+            app.processEvents()
+        first = raster.tile_at(raster.offset)[0]
+        last = raster.tile_at(raster.offset + raster.visible_line_count)[0]
+        return [raster.tile(tile) for tile in range(first, last + 1)]
+
+    # only the tiles shown are rendered, with a placeholder until they are ready
+    tiles = rendered_tiles()
+    assert all(tile is not None for tile in tiles)
+    assert len(tiles) <= raster.visible_line_count // raster.Defaults.TILE_LINES + 2
+    assert raster.tile(raster.tile_at(40000)[0]) is None
+
+    scroll_bar = map_editor.verticalScrollBar()
+    scroll_bar.setValue(scroll_bar.maximum() // 2)
+    app.processEvents()
+    first_tile = raster.tile_at(raster.offset)[0]
+    tile_lines = raster.Defaults.TILE_LINES
+    assert raster.tile_at(raster.offset + 10) == divmod(raster.offset + 10, tile_lines)
+    cursor = QTextCursor(map_editor.document().findBlockByNumber(raster.offset + 10))
+    cursor.insertText("a = 1\nb = 2\n")
+    cursor.movePosition(QTextCursor.Down, QTextCursor.KeepAnchor, 3)
+    cursor.removeSelectedText()
+    app.processEvents()
+
+    # the tiles of the edited lines are the same as freshly rendered ones
+    edited_tiles = rendered_tiles()
+    assert all(tile is not None for tile in edited_tiles)
+    raster.invalidate()
+    assert raster.tile(first_tile) is None
+    assert rendered_tiles() == edited_tiles
+
+    # the least recently used tiles are evicted
+    for value in range(0, scroll_bar.maximum(), scroll_bar.maximum() // 100):
+        scroll_bar.setValue(value)
+        app.processEvents()
+        rendered_tiles()
+    tile_count = raster.tile_at(map_editor.document().blockCount())[0] + 1
+    cached = [tile for tile in range(tile_count) if raster.tile(tile) is not None]
+    assert len(cached) <= raster.Defaults.MAX_TILES < tile_count
+
+    # a click moves the cursor to the line under it
+    app.sendEvent(
+        raster,
+        QMouseEvent(
+            QEvent.MouseButtonPress,
+            QPointF(20, 40),
+            Qt.LeftButton,
+            Qt.LeftButton,
+            Qt.NoModifier,
+        ),
+    )
+    assert map_editor.textCursor().blockNumber() == raster.line_at(40)
+
+    # the slider follows the editor and scrolls it
+    raster.scroll_editor(raster.height())
+    assert scroll_bar.value() == scroll_bar.maximum()
+    app.processEvents()
+    assert raster.slider.geometry().bottom() == raster.height() - 1
+
+    def scroll():
+        scroll_bar.setValue(scroll_bar.value() - 40)
+        app.processEvents()
+
+    benchmark.group = "minimap"
+    benchmark(scroll)
+
+    # the render thread stops with the last raster minimap
+    assert type(raster)._render_thread.isRunning()
+    switch(MiniMap.Mode.EDITOR)
+    assert type(raster)._render_thread is None
+    map_editor.close()
+
+
+def test_line_width_index(benchmark):
+    widths_editor = _shown_editor(100)
+    line_widths = widths_editor.line_widths
+    # loading measures the visible lines, the others are measured when idle
+    assert line_widths.pending
+    assert line_widths.measures < widths_editor.blockCount() // 10
+    document = widths_editor.document()
+    metrics = QFontMetricsF(widths_editor.font())
+
+    def expected_max(first: int, last: int) -> float:
+        return max(
+            metrics.horizontalAdvance(document.findBlockByNumber(line).text())
+            for line in range(first, last + 1)
+        )
+
+    def check_ranges():
+        line_count = document.blockCount()
+        ranges = ((0, line_count - 1), (7, 7), (100, 4000), (line_count - 50, line_count - 1))
+        for first, last in ranges:
+            assert line_widths.max_width(first, last) == expected_max(first, last)
+
+    check_ranges()
+    measures = line_widths.measures
+
+    # an edit measures the changed lines again, the following ones are moved
+    cursor = QTextCursor(document.findBlockByNumber(50))
+    cursor.insertText("x" * 500 + "\n\n" + "y" * 300)
+    cursor = QTextCursor(document.findBlockByNumber(3000))
+    cursor.movePosition(QTextCursor.Down, QTextCursor.KeepAnchor, 20)
+    cursor.removeSelectedText()
+    check_ranges()
+    assert line_widths.measures - measures <= 4
+    assert line_widths.max_width(50, 52) == metrics.horizontalAdvance("x" * 500)
+
+    # the horizontal scroll bar reaches the end of the widest line once the
+    # editor is idle
+    deadline = time.perf_counter() + 10
+    while widths_editor.horizontalScrollBar().maximum() <= 0 and time.perf_counter() < deadline:
+        app.processEvents(QEventLoop.AllEvents, 50)
+    scroll_bar = widths_editor.horizontalScrollBar()
+    widest = line_widths.max_width() + 2 * document.documentMargin()
+    assert scroll_bar.maximum() == int(widest - widths_editor.viewport().width())
+
+    minimap = widths_editor.panels.append(MiniMap, Panel.Position.RIGHT)
+    minimap.show()
+    widths_editor.verticalScrollBar().setValue(0)
+    app.processEvents()
+    assert minimap.properties.shadow.isEnabled()
+
+    benchmark.group = "minimap"
+    benchmark(minimap.update_shadow)
+    widths_editor.close()
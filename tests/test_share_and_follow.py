@@ -27,3 +27,176 @@ def test_follow_style(benchmark):
 
     assert editor.style.selection_background == editor1.style.selection_background
     assert editor.style.selection_foreground == editor1.style.selection_foreground
+
+
+def _replace_all(target: ChellyEditor, before: str, after: str) -> None:
+    cursor = QTextCursor(target.document())
+    cursor.beginEditBlock()
+    found = target.document().find(before, cursor)
+    while not found.isNull():
+        found.insertText(after)
+        found = target.document().find(before, found)
+    cursor.endEditBlock()
+
+
+def test_follow_shared_document(benchmark):
+    text = "\n".join(f"value_{line} = {line} + self.offset" for line in range(5000))
+    leader = ChellyEditor(None)
+    leader.language.lexer = (PythonLanguage, MonokaiStyle)
+    leader.properties.text = text
+    follower = ChellyEditor(None)
+    follower.language.lexer = (PythonLanguage, MonokaiStyle)
+    follower.properties.text = "own text"
+    follower.follow(leader, shared=True)
+
+    assert follower.shares_document
+    # the blocks are highlighted once, by the leader
+    assert follower.language.lexer.document() is None
+    assert follower.document() is leader.document()
+    assert follower.chelly_document is leader.chelly_document
+
+    # the text is shared, the cursors are not
+    leader.moveCursor(QTextCursor.End)
+    leader.textCursor().insertText("\nlast = 1")
+    assert follower.toPlainText() == leader.toPlainText()
+    assert follower.textCursor().position() == 0
+    follower.textCursor().insertText("first = 0\n")
+    assert leader.document().firstBlock().text() == "first = 0"
+
+    def replace_pair():
+        _replace_all(follower, "self.offset", "self.delta")
+        _replace_all(follower, "self.delta", "self.offset")
+
+    benchmark(replace_pair)
+    assert leader.toPlainText() == follower.toPlainText()
+
+    # unfollowed, the follower keeps a copy of the text
+    follower.unfollow(leader)
+    assert not follower.shares_document
+    assert follower.document() is not leader.document()
+    assert follower.toPlainText() == leader.toPlainText()
+    follower.textCursor().insertText("# own\n")
+    assert leader.document().firstBlock().text() == "first = 0"
+    assert follower.chelly_document.editor is follower
+    assert follower.language.lexer.document() is follower.document()
+
+
+def test_follow_edit_deltas(benchmark):
+    text = "\n".join(f"value_{line} = {line} + self.offset" for line in range(2000))
+    leader = ChellyEditor(None)
+    leader.language.lexer = (PythonLanguage, MonokaiStyle)
+    leader.properties.text = text
+    follower = ChellyEditor(None)
+    follower.follow(leader)
+
+    deltas = []
+    leader.chelly_document.edits.on_edited.connect(deltas.append)
+
+    # a replace-all is delivered as one change at the next event loop turn
+    _replace_all(leader, "self.offset", "self.delta")
+    assert leader.chelly_document.edits.pending
+    assert follower.toPlainText() != leader.toPlainText()
+    app.processEvents()
+    assert len(deltas) == 1
+    delta = deltas[0]
+    assert delta.first_block == 0
+    assert delta.old_last_block == delta.new_last_block == 1999
+    assert delta.removed_text.count("self.offset") == 2000
+    assert delta.inserted_text == delta.removed_text.replace("self.offset", "self.delta")
+    assert follower.toPlainText() == leader.toPlainText()
+
+    # the lines added and removed are in the block range
+    deltas.clear()
+    cursor = QTextCursor(leader.document().findBlockByNumber(10))
+    cursor.insertText("first\nsecond\n")
+    cursor = QTextCursor(leader.document().findBlockByNumber(1000))
+    cursor.movePosition(QTextCursor.NextBlock, QTextCursor.KeepAnchor)
+    cursor.removeSelectedText()
+    leader.chelly_document.edits.flush()
+    assert len(deltas) == 1
+    assert (deltas[0].first_block, deltas[0].block_delta) == (10, 1)
+    assert follower.toPlainText() == leader.toPlainText()
+    lines = text.replace("self.offset", "self.delta").split("\n")
+    deltas[0].apply_to_lines(lines)
+    assert lines == leader.toPlainText().split("\n")
+
+    # the highlighting changes only the formats
+    deltas.clear()
+    leader.language.lexer.rehighlight()
+    app.processEvents()
+    assert not deltas
+
+    def replace_pair():
+        _replace_all(leader, "self.delta", "self.offset")
+        _replace_all(leader, "self.offset", "self.delta")
+        leader.chelly_document.edits.flush()
+
+    benchmark(replace_pair)
+    assert follower.toPlainText() == leader.toPlainText()
+    follower.unfollow(leader)
+
+
+def test_shared_document_outlives_leader(benchmark):
+    leader = ChellyEditor(None)
+    leader.language.lexer = (PythonLanguage, MonokaiStyle)
+    leader.properties.text = "value = 1\nother = 2"
+    followers = [ChellyEditor(None) for _ in range(2)]
+    for follower in followers:
+        follower.language.lexer = (PythonLanguage, MonokaiStyle)
+        follower.follow(leader, shared=True)
+
+    # the followers keep a copy of the text of the deleted leader
+    leader.deleteLater()
+    app.sendPostedEvents(None, QEvent.DeferredDelete)
+    for follower in followers:
+        assert not follower.shares_document
+        assert follower.toPlainText() == "value = 1\nother = 2"
+        assert follower.chelly_document.editor is follower
+        assert follower.language.lexer.document() is follower.document()
+
+    followers[0].textCursor().insertText("# own\n")
+    app.processEvents()
+    assert followers[1].toPlainText() == "value = 1\nother = 2"
+
+
+def test_edition_margin_edits(benchmark):
+    margin_editor = ChellyEditor(None)
+    margin = margin_editor.panels.append(EditionMargin, Panel.Position.LEFT)
+    # the edits are not tracked before the margin compares the lines
+    assert not margin_editor.chelly_document.tracks_edits
+
+    margin_editor.properties.text = "\n".join(f"line_{line}" for line in range(100))
+    margin.update_diffs()
+    assert margin_editor.chelly_document.tracks_edits
+
+    # past the limit, the margin drops the edits and their copy of the lines
+    margin_editor.properties.text = "\n".join(
+        f"line_{line}" for line in range(margin.properties.max_lines_count + 1)
+    )
+    margin.update_diffs()
+    assert not margin_editor.chelly_document.tracks_edits
+
+
+def test_follow_cycles_keep_one_document(benchmark):
+    leader = ChellyEditor(None)
+    leader.language.lexer = (PythonLanguage, MonokaiStyle)
+    leader.properties.text = "\n".join(f"value_{line} = {line}" for line in range(900))
+    follower = ChellyEditor(None)
+    follower.language.lexer = (PythonLanguage, MonokaiStyle)
+
+    def cycle():
+        follower.follow(leader, shared=True)
+        follower.unfollow(leader)
+        app.sendPostedEvents(None, QEvent.DeferredDelete)
+
+    for _ in range(3):
+        cycle()
+    benchmark(cycle)
+
+    # the copies of the previous cycles are deleted
+    assert len(follower.findChildren(QTextDocument)) == 1
+    # the highlighter follows the blocks of its new document
+    lexer = follower.language.lexer
+    assert lexer._cached_block_count == follower.document().blockCount() == 900
+    follower.textCursor().insertText("first = 0\n")
+    assert lexer._cached_block_count == 901